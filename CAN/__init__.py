@@ -1,4 +1,3 @@
-import re
 from pprint import pprint
 
 
@@ -6,15 +5,25 @@ class CAN:
     """
     The CAN class parses a raw line from can-utils candump.
     """
-    text, interface, code, byte_n, value = None, None, None, None, None
+    __slots__ = ('text', 'interface', 'code', 'byte_n', 'bytes', '_payload')
 
     def __init__(self, line):
-        self.text = re.sub(r'\s+', ' ', line).strip()
-        tokens = self.text.split(' ')
+        tokens = line.split()
+        self.text = ' '.join(tokens)
         self.interface = tokens[0]
         self.code = int(tokens[1], 16)
         self.byte_n = int(tokens[2].strip('[]'))
         self.bytes = tokens[3:]
+        self._payload = None
+
+    @property
+    def payload(self):
+        """
+        The data bytes of the frame, converted once on first use.
+        """
+        if self._payload is None:
+            self._payload = bytes.fromhex(''.join(self.bytes))
+        return self._payload
 
     def get_hex_bytes(self, endian = 1):
         hex_bytes = self.bytes
@@ -38,26 +47,8 @@ class CAN:
         Given an int value and a collection of signal syntax (SG) tokens this
         decodes out the encoded value.
         """
-        sign = 0
-        value = int(self.get_value(sg.endian))
-        bitmask = (pow(2, int(sg.bit_len)) - 1) << int(sg.start_bit)
-        value = (value & bitmask)
-        value = value >> int(sg.start_bit)
-        if sg.signed:
-            first_bitmask = pow(2, int(sg.bit_len) - 1)
-            sign = (value & first_bitmask) >> (int(sg.bit_len) - 1)
-            value = first_bitmask ^ value
-        value = sg.offset + sg.scale * value
-        if sign == 1:
-            value *= -1
-        if sg.min_val < sg.max_val:
-            value = max(value, sg.min_val)
-        if sg.max_val > sg.min_val:
-            value = min(sg.max_val, value)
-        value = re.sub(r'[.]0$', "", str(value))
-        if sg.units != "":
-            return f'{value} {sg.units}'
-        return value
+        decoder = sg.compile()
+        return decoder.format(decoder.decode(self.get_value(sg.endian)))
 
     def __str__(self):
         return f'{self.interface} {self.code} [{self.byte_n}] {self.get_hex_str()}'
@@ -0,0 +1,143 @@
+import mmap
+import os
+from binascii import unhexlify
+
+
+class FrameAPI:
+    """
+    The read side of the CAN API for frames that have timestamp,
+    interface, code, byte_n and payload (as bytes) attributes.
+    """
+    __slots__ = ()
+
+    def get_hex_bytes(self, endian = 1):
+        hex_bytes = [f'{b:02X}' for b in self.payload]
+        if endian == 0:
+            hex_bytes = reversed(hex_bytes)
+        return hex_bytes
+
+    def get_hex_str(self, endian = 1):
+        return ' '.join(self.get_hex_bytes(endian))
+
+    def get_value(self, endian = 1):
+        return int.from_bytes(self.payload, 'little' if endian == 0 else 'big')
+
+    def get_binary_str(self, endian = 1):
+        return format(self.get_value(endian), f'0{self.byte_n*8}b')
+
+    def decode(self, sg):
+        decoder = sg.compile()
+        return decoder.format(decoder.decode(self.get_value(sg.endian)))
+
+    def __str__(self):
+        return f'{self.interface} {self.code} [{self.byte_n}] {self.get_hex_str()}'
+
+
+class Frame(FrameAPI):
+    """
+    A candump frame parsed straight from bytes.
+    """
+    __slots__ = ('timestamp', 'interface', 'code', 'byte_n', 'payload')
+
+    def __init__(self, timestamp, interface, code, byte_n, payload):
+        self.timestamp = timestamp
+        self.interface = interface
+        self.code = code
+        self.byte_n = byte_n
+        self.payload = payload
+
+
+def parse_line(line, codes=None):
+    """
+    Parse one candump line given as bytes into a Frame. Both the
+    default "can0 3E8 [6] FF FF ..." layout and the "candump -l"
+    "(ts) can0 3E8#FFFF..." layout are understood, with or without a
+    leading timestamp. Returns None for blank lines, and for frames
+    whose id is not in codes before their payload is converted.
+    """
+    tokens = line.split()
+    if len(tokens) == 0:
+        return None
+    timestamp = None
+    if tokens[0][0] == 0x28:
+        timestamp = float(tokens[0][1:-1])
+        del tokens[0]
+    ident = tokens[1]
+    if 0x23 in ident:
+        code, _, data = ident.partition(b'#')
+        code = int(code, 16)
+        if codes is not None and code not in codes:
+            return None
+        if data[0:1] == b'#':
+            data = data[2:]
+        elif data[0:1] in (b'R', b'r'):
+            data = b''
+        payload = unhexlify(data)
+        byte_n = len(payload)
+    else:
+        code = int(ident, 16)
+        if codes is not None and code not in codes:
+            return None
+        byte_n = int(tokens[2][1:-1])
+        if tokens[3:4] == [b'remote']:
+            payload = b''
+        else:
+            payload = unhexlify(b''.join(tokens[3:]))
+    return Frame(timestamp, tokens[0].decode(), code, byte_n, payload)
+
+
+def frame_text(line, frame):
+    """
+    Return str(frame) with the payload bytes written as in the default
+    candump layout line the frame was parsed from, case included, the
+    way CAN(line) prints them. Other lines give str(frame).
+    """
+    tokens = line.split()
+    if tokens and tokens[0][0] == '(':
+        del tokens[0]
+    if len(tokens) < 3 or '#' in tokens[1] or tokens[2][0] != '[':
+        return str(frame)
+    return f'{frame.interface} {frame.code} [{frame.byte_n}] {" ".join(tokens[3:])}'
+
+
+def parse_key(line):
+    """
+    Return (timestamp, code) of a candump line given as bytes without
+    converting its payload, or None for blank lines.
+    """
+    tokens = line.split(None, 3)
+    if len(tokens) == 0:
+        return None
+    timestamp = None
+    if tokens[0][0] == 0x28:
+        timestamp = float(tokens[0][1:-1])
+        ident = tokens[2]
+    else:
+        ident = tokens[1]
+    return timestamp, int(ident.partition(b'#')[0], 16)
+
+
+def map_lines(filename):
+    """
+    Yield the lines of the file as bytes from a read-only memory map.
+    """
+    with open(filename, 'rb') as can_fh:
+        if os.fstat(can_fh.fileno()).st_size == 0:
+            return
+        with mmap.mmap(can_fh.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            readline = data.readline
+            line = readline()
+            while line:
+                yield line
+                line = readline()
+
+
+def read_frames(filename, codes=None):
+    """
+    Yield a Frame for every candump line in the file, or only for
+    the lines with an id in codes.
+    """
+    for line in map_lines(filename):
+        frame = parse_line(line, codes)
+        if frame is not None:
+            yield frame
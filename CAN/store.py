@@ -0,0 +1,148 @@
+import math
+from array import array
+from .reader import FrameAPI, read_frames
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class FrameView(FrameAPI):
+    """
+    One row of a FrameStore. It reads its fields from the store's
+    arrays on access and offers the read side of the CAN API.
+    """
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def timestamp(self):
+        timestamp = self.store.timestamps[self.index]
+        return None if math.isnan(timestamp) else timestamp
+
+    @property
+    def interface(self):
+        return self.store.interfaces[self.store.interface_ids[self.index]]
+
+    @property
+    def code(self):
+        return self.store.codes[self.index]
+
+    @property
+    def byte_n(self):
+        return self.store.byte_ns[self.index]
+
+    @property
+    def payload(self):
+        return self.store.payload(self.index)
+
+
+class FrameStore:
+    """
+    Frames held column-wise in typed arrays: timestamps (NaN when the
+    log has none), ids, DLCs, an interface number per frame, and all
+    payloads back to back in one bytearray with their start offsets.
+    A frame costs about 30 bytes plus its payload instead of a CAN
+    object per line. store[i] returns a FrameView of row i.
+    """
+    def __init__(self):
+        self.timestamps = array('d')
+        self.codes = array('L')
+        self.byte_ns = array('B')
+        self.interface_ids = array('B')
+        self.interfaces = []
+        self.interface_index = {}
+        self.offsets = array('Q', [0])
+        self.data = bytearray()
+
+    @classmethod
+    def from_file(cls, filename, codes=None):
+        """
+        Return a FrameStore of the candump file, or only of the frames
+        with an id in codes.
+        """
+        store = cls()
+        store.extend(read_frames(filename, codes))
+        return store
+
+    def append(self, frame):
+        """
+        Add a Frame, CAN or FrameView.
+        """
+        interface_id = self.interface_index.get(frame.interface)
+        if interface_id is None:
+            interface_id = self.interface_index[frame.interface] = len(self.interfaces)
+            self.interfaces.append(frame.interface)
+        timestamp = getattr(frame, 'timestamp', None)
+        self.timestamps.append(math.nan if timestamp is None else timestamp)
+        self.codes.append(frame.code)
+        self.byte_ns.append(frame.byte_n)
+        self.interface_ids.append(interface_id)
+        self.data += frame.payload
+        self.offsets.append(len(self.data))
+
+    def extend(self, frames):
+        for frame in frames:
+            self.append(frame)
+
+    def payload(self, index):
+        """
+        Return the payload of row index as bytes.
+        """
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]])
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.codes)
+        if not 0 <= index < len(self.codes):
+            raise IndexError(f'FrameStore index out of range: {index}')
+        return FrameView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.codes)):
+            yield FrameView(self, index)
+
+    def nbytes(self):
+        """
+        Return the bytes held by the arrays.
+        """
+        return sum(column.itemsize * len(column) for column in
+                   (self.timestamps, self.codes, self.byte_ns, self.interface_ids, self.offsets)) \
+            + len(self.data)
+
+    def to_numpy(self):
+        """
+        Return the columns as NumPy arrays: timestamps, codes, byte_ns
+        and a zero padded (frames x longest payload) uint8 payload
+        matrix, ready for DBC.decode_batch().
+        """
+        if numpy is None:
+            raise Exception('FrameStore.to_numpy() requires numpy')
+        offsets = numpy.frombuffer(self.offsets, dtype=numpy.uint64).astype(numpy.int64)
+        lengths = offsets[1:] - offsets[:-1]
+        width = int(lengths.max()) if len(lengths) else 0
+        payloads = numpy.zeros((len(lengths), width), dtype=numpy.uint8)
+        data = numpy.frombuffer(bytes(self.data), dtype=numpy.uint8)
+        rows = numpy.repeat(numpy.arange(len(lengths)), lengths)
+        columns = numpy.arange(len(data)) - numpy.repeat(offsets[:-1], lengths)
+        payloads[rows, columns] = data
+        return {
+            'timestamps': numpy.array(self.timestamps, dtype=numpy.float64),
+            'codes': numpy.array(self.codes, dtype=numpy.int64),
+            'byte_ns': numpy.array(self.byte_ns, dtype=numpy.uint8),
+            'payloads': payloads,
+        }
+
+    def decode_batch(self, dbc):
+        """
+        Decode every stored frame column-wise; see DBC.decode_batch().
+        """
+        columns = self.to_numpy()
+        return dbc.decode_batch(columns['codes'], columns['payloads'], columns['byte_ns'])
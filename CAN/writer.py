@@ -0,0 +1,66 @@
+import sys
+from itertools import repeat
+
+WRITE_LINES = 65536
+
+
+def format_id(code):
+    """
+    Return the id as candump prints it: 3 hex digits, or 8 for an
+    extended (29 bit) id.
+    """
+    return f'{code:03X}' if code <= 0x7FF else f'{code:08X}'
+
+
+def payload_rows(payloads):
+    """
+    Return the payloads as an iterable of bytes, splitting an (N, width)
+    uint8 matrix with one copy of its data.
+    """
+    if hasattr(payloads, 'tobytes') and getattr(payloads, 'ndim', 1) == 2:
+        width = payloads.shape[1]
+        data = payloads.tobytes()
+        return (data[start:start + width] for start in range(0, len(data), width))
+    return (bytes(payload) for payload in payloads)
+
+
+def format_lines(codes, payloads, timestamps=None, interface='can0'):
+    """
+    Yield a candump line per frame: the "candump -l" layout
+    "(ts) can0 3E8#FFFF..." when timestamps are given, otherwise the
+    default "  can0  3E8   [2]  FF FF" layout. codes is an id, or one
+    id per frame; payloads is an (N, width) uint8 matrix, as from
+    MessageEncoder.encode_batch(), or a sequence of bytes.
+    """
+    if hasattr(codes, 'tolist'):
+        codes = codes.tolist()
+    if hasattr(timestamps, 'tolist'):
+        timestamps = timestamps.tolist()
+    if isinstance(codes, int):
+        codes = repeat(format_id(codes))
+    else:
+        codes = (format_id(code) for code in codes)
+    rows = payload_rows(payloads)
+    if timestamps is None:
+        for code, payload in zip(codes, rows):
+            yield f'  {interface}  {code}   [{len(payload)}]  {payload.hex(" ").upper()}\n'
+    else:
+        for timestamp, code, payload in zip(timestamps, codes, rows):
+            yield f'({timestamp:.6f}) {interface} {code}#{payload.hex().upper()}\n'
+
+
+def write_lines(lines, out=None):
+    """
+    Write the lines WRITE_LINES at a time and return how many there were.
+    """
+    out = out or sys.stdout
+    line_n = 0
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) == WRITE_LINES:
+            out.write(''.join(buffer))
+            line_n += len(buffer)
+            buffer.clear()
+    out.write(''.join(buffer))
+    return line_n + len(buffer)
@@ -1,7 +1,17 @@
-import re
+import io
 import os
 from pprint import pformat, pprint
-from tempfile import TemporaryFile, NamedTemporaryFile
+from .decoder import SignalDecoder, MessageDecoder, Decoded
+from .encoder import SignalEncoder, MessageEncoder
+from . import batch
+from . import cache
+from . import parser
+from .plan import DecodePlan
+from .memo import DecodeCache, DECODE_CACHE_SIZE
+from .predicate import Predicate
+from .bus import BusRouter
+
+UNKNOWN_EXTENDED_IDS = 4096
 
 
 class DBC:
@@ -10,6 +20,8 @@ class DBC:
     decode, and annotate CAN messages.
     """
     class LIST_:
+        __slots__ = ('name', 'items')
+
         def __init__(self, raw_text):
             elements = raw_text.split(' ')
             self.name = elements.pop(0).rstrip(':')
@@ -20,17 +32,31 @@ class DBC:
                 raise Exception(f'Invalid object appended to {__class__}: {type(item)}')
             self.items.append(item)
 
+    class RAW_:
+        __slots__ = ('name', 'tokens')
+
+        def __init__(self, type_name, tokens):
+            self.name = type_name
+            self.tokens = tokens
+
+        def append(self, _):
+            raise Exception(f'Cannot append to {__class__}')
+
     class BO_:
-        def __init__(self, raw_text):
+        __slots__ = ('id', 'name', 'byte_n', 'origin', 'sgs', 'decoder', 'source_txt')
+
+        def __init__(self, raw_text, tokens=None):
+            if tokens is None:
+                tokens = parser.tokenize(raw_text)
             self.sgs = []
+            self.decoder = None
+            self.id = int(tokens[0])
+            self.name = tokens[1]
+            self.byte_n = int(tokens[3])
+            self.origin = tokens[4] if len(tokens) > 4 else ""
+            if raw_text is None:
+                raw_text = f'{self.id} {self.name}: {self.byte_n} {self.origin}'
             self.source_txt = raw_text.strip()
-            attr_a, attr_b = self.source_txt.split(':', 1)
-            elements = [e.strip() for e in attr_a.strip().split(' ')]
-            self.id = int(elements[0])
-            self.name = elements[1]
-            elements = [e.strip() for e in attr_b.strip().split(' ')]
-            self.byte_n = int(elements[0])
-            self.origin = elements[1]
 
         def __str__(self):
             return f'{__class__.__name__} {self.id} {self.name}: ' \
@@ -42,20 +68,42 @@ class DBC:
                 raise Exception(f'Invalid object appended to {__class__}: {type(sg)}')
             sg.byte_n = self.byte_n
             self.sgs.append(sg)
+            self.decoder = None
+
+        def compile(self):
+            """
+            Return the MessageDecoder for this message, building it once.
+            """
+            if self.decoder is None:
+                self.decoder = MessageDecoder(self)
+            return self.decoder
 
     class SG_:
-        def __init__(self, raw_text):
-            self.source_txt = raw_text.strip()
-            attr_a, attr_b = self.source_txt.split(':', 1)
-            self.name = attr_a.strip()
-            elements = attr_b.strip().split(' ')
-            self.start_bit, self.bit_len, endian_signed = re.split(r'[|@]', elements[0])
-            self.endian = int(re.sub(r'[^0-9]+', "", endian_signed))
+        __slots__ = ('name', 'start_bit', 'bit_len', 'endian', 'signed', 'scale', 'offset',
+                     'min_val', 'max_val', 'units', 'destination', 'byte_n', 'values',
+                     'decoder', 'source_txt')
+
+        def __init__(self, raw_text, tokens=None):
+            if tokens is None:
+                tokens = parser.tokenize(raw_text)
+            colon = tokens.index(':')
+            self.name = ' '.join(tokens[0:colon])
+            self.start_bit, self.bit_len = tokens[colon + 1], tokens[colon + 3]
+            endian_signed = tokens[colon + 5]
+            self.endian = int(endian_signed[0:-1])
             self.signed = endian_signed.endswith('-')
-            self.scale, self.offset = [float(n) for n in elements[1].strip('()').split(',', 1)]
-            self.min_val, self.max_val = [float(n) for n in elements[2].strip('[]').split('|', 1)]
-            self.units = elements[3].strip('"')
-            self.destination = elements[4].strip('"')
+            self.scale, self.offset = float(tokens[colon + 7]), float(tokens[colon + 9])
+            self.min_val, self.max_val = float(tokens[colon + 12]), float(tokens[colon + 14])
+            self.units = parser.unquote(tokens[colon + 16])
+            self.destination = ''.join(tokens[colon + 17:])
+            self.values = None
+            self.decoder = None
+            if raw_text is None:
+                raw_text = f'{self.name} : {self.start_bit}|{self.bit_len}@{endian_signed} ' \
+                           f'({tokens[colon + 7]},{tokens[colon + 9]}) ' \
+                           f'[{tokens[colon + 12]}|{tokens[colon + 14]}] ' \
+                           f'{tokens[colon + 16]} {self.destination}'
+            self.source_txt = raw_text.strip()
 
         def __str__(self):
             return f'{__class__.__name__} {self.name} : ' \
@@ -67,11 +115,22 @@ class DBC:
         def append(self, row):
             raise Exception(f'Cannot append to {__class__}')
 
+        def compile(self):
+            """
+            Return the SignalDecoder for this signal, building it once.
+            """
+            if self.decoder is None:
+                self.decoder = SignalDecoder(self)
+            return self.decoder
+
     class BO_TX_BU_:
-        def __init__(self, raw_text):
-            attr_a, attr_b = raw_text.split(':', 1)
-            self.id = int(attr_a.strip())
-            self.modules = attr_b.strip().split(',')
+        __slots__ = ('id', 'modules')
+
+        def __init__(self, raw_text, tokens=None):
+            if tokens is None:
+                tokens = parser.tokenize(raw_text)
+            self.id = int(tokens[0])
+            self.modules = parser.split_list(tokens[2:])
 
         def append(self, module):
             if not isinstance(module, str):
@@ -79,23 +138,29 @@ class DBC:
             self.modules.append(module)
 
     class BA_DEF_DEF_:
-        def __init__(self, raw_text):
-            attr_a, attr_b = raw_text.split(' ', 1)
-            self.name = attr_a.strip('"')
-            self.value = attr_b.strip('"')
+        __slots__ = ('name', 'value')
+
+        def __init__(self, raw_text, tokens=None):
+            if tokens is None:
+                tokens = parser.tokenize(raw_text)
+            self.name = parser.unquote(tokens[0])
+            self.value = parser.unquote(' '.join(tokens[1:]))
 
         def append(self, _):
             raise Exception(f'Cannot append to {__class__}')
 
     class BA_DEF_:
-        def __init__(self, raw_text):
-            elements = raw_text.split(' ')
-            self.name = elements.pop(0).strip('"')
-            self.data_type = elements.pop(0)
-            if len(elements) > 0 and ',' in elements[0]:
-                self.library = [e.strip('"') for e in elements.split(',')]
-            else:
-                self.library = elements
+        __slots__ = ('object_type', 'name', 'data_type', 'library')
+
+        def __init__(self, raw_text, tokens=None):
+            if tokens is None:
+                tokens = parser.tokenize(raw_text)
+            self.object_type = ""
+            if tokens[0] in parser.OBJECT_TYPES:
+                self.object_type = tokens.pop(0)
+            self.name = parser.unquote(tokens[0])
+            self.data_type = tokens[1]
+            self.library = [parser.unquote(e) for e in parser.split_list(tokens[2:])]
 
         def append(self, value):
             if not isinstance(value, str):
@@ -103,14 +168,14 @@ class DBC:
             self.library.append(value.strip('"'))
 
     class VAL_TABLE_:
-        def __init__(self, raw_text):
-            self.rows = []
-            attr_a, attr_b = raw_text.split(' ', 1)
-            self.name = attr_a.strip()
-            elements = attr_b.split(' ')
-            while len(elements) > 0:
-                self.rows.append({'type': elements.pop(1),
-                                  'index': elements.pop(0)})
+        __slots__ = ('name', 'rows')
+
+        def __init__(self, raw_text, tokens=None):
+            if tokens is None:
+                tokens = parser.tokenize(raw_text)
+            self.name = tokens[0]
+            self.rows = [{'type': parser.unquote(tokens[i + 1]), 'index': tokens[i]}
+                         for i in range(1, len(tokens) - 1, 2)]
 
         def append(self, row):
             if not isinstance(row, dict):
@@ -118,14 +183,20 @@ class DBC:
             self.rows.append(row)
 
     class VAL_:
-        def __init__(self, raw_text):
-            self.rows = []
-            attr_a, attr_b, attr_c = raw_text.split(' ', 2)
-            self.name = f'{attr_a} {attr_b}'
-            elements = attr_c.split(' ')
-            while len(elements) > 0:
-                self.rows.append({'type': elements.pop(1),
-                                  'name': elements.pop(0)})
+        __slots__ = ('bo_id', 'signal', 'name', 'rows', 'table')
+
+        def __init__(self, raw_text, tokens=None):
+            if tokens is None:
+                tokens = parser.tokenize(raw_text)
+            if tokens[0].isdigit():
+                self.bo_id, self.signal, first = int(tokens[0]), tokens[1], 2
+                self.name = f'{tokens[0]} {tokens[1]}'
+            else:
+                self.bo_id, self.signal, first = None, tokens[0], 1
+                self.name = tokens[0]
+            self.rows = [{'type': parser.unquote(tokens[i + 1]), 'name': tokens[i]}
+                         for i in range(first, len(tokens) - 1, 2)]
+            self.table = tokens[first] if len(tokens) == first + 1 else None
 
         def append(self, row):
             if not isinstance(row, dict):
@@ -133,14 +204,15 @@ class DBC:
             self.rows.append(row)
 
     class BA_:
-        def __init__(self, raw_text):
-            self.rows = []
-            attrs = raw_text.split(' ', 4)
-            last_i = len(attrs) - 1
-            self.name = ' '.join(attrs[0:last_i])
-            elements = attrs[last_i].strip('"').split(',')
-            for element in elements:
-                self.rows.append({'type': element.strip()})
+        __slots__ = ('attribute', 'object_type', 'name', 'rows')
+
+        def __init__(self, raw_text, tokens=None):
+            if tokens is None:
+                tokens = parser.tokenize(raw_text)
+            self.attribute = parser.unquote(tokens[0])
+            self.object_type = tokens[1] if tokens[1] in parser.OBJECT_TYPES else ""
+            self.name = ' '.join(tokens[0:-1])
+            self.rows = [{'type': e.strip()} for e in parser.unquote(tokens[-1]).split(',')]
 
         def append(self, row):
             if not isinstance(row, dict):
@@ -148,20 +220,32 @@ class DBC:
             self.rows.append(row)
 
     class CM_:
-        def __init__(self, raw_text):
-            attrs = raw_text.split(' ', 3)
-            self.bo_id = int(attrs[1])
-            self.text = ' '.join(attrs[2:]).strip('"')
+        __slots__ = ('object_type', 'bo_id', 'signal', 'text')
+
+        def __init__(self, raw_text, tokens=None):
+            if tokens is None:
+                tokens = parser.tokenize(raw_text)
+            self.object_type = tokens[0] if tokens[0] in parser.OBJECT_TYPES else ""
+            self.bo_id, self.signal = None, None
+            if self.object_type in ('BO_', 'SG_'):
+                self.bo_id = int(tokens[1])
+            if self.object_type == 'SG_':
+                self.signal = tokens[2]
+            self.text = parser.unquote(tokens[-1])
 
         def append(self, _):
             raise Exception(f'Cannot append to {__class__}')
 
     class SIG_GROUP_:
-        def __init__(self, raw_text):
-            attr_a, attr_b = raw_text.split(':', 1)
-            self.bo_id = int(attr_a.split(' ', 1)[0])
-            self.name = attr_a.split(' ', 1)[1].strip()
-            self.members = attr_b.strip().split(' ')
+        __slots__ = ('bo_id', 'name', 'members')
+
+        def __init__(self, raw_text, tokens=None):
+            if tokens is None:
+                tokens = parser.tokenize(raw_text)
+            colon = tokens.index(':')
+            self.bo_id = int(tokens[0])
+            self.name = ' '.join(tokens[1:colon])
+            self.members = tokens[colon + 1:]
 
         def append(self, _):
             raise Exception(f'Cannot append to {__class__}')
@@ -170,78 +254,107 @@ class DBC:
         self.filename = None
         self.version = ""
         self.records = []
-        temp_file = None
+        self.indexes = {}
+        self.unknown_ids = set()
+        self.unknown_extended = 0
         if "\n" in filename or not os.path.exists(filename):
-            temp_file = NamedTemporaryFile()
-            with open(temp_file.name, 'w') as dbc_fh:
-                dbc_fh.write(filename)
-            filename = temp_file.name
+            self.parse(io.StringIO(filename))
         else:
             self.filename = filename
-        with open(filename, 'r') as dbc_fh:
-            for line in dbc_fh:
-                line = line.rstrip().rstrip(';').rstrip()
-                if len(line) == 0:
-                    continue
-                if line.startswith('VERSION '):
-                    self.version = line.split(' ', 1)[1].strip('"')
-                    continue
-                line = re.sub(r'\s+', ' ', line)
-                if re.match(r'[A-Z_]+_([ ]*[:]|[ ].+)', line):
-                    type_name, attributes = None, None
-                    if ' ' in line:
-                        type_name, attributes = line.strip().split(' ', 1)
-                        if attributes == ':':
-                            type_name += ':'
-                            attributes = None
-                    else:
-                        type_name = line.strip()
-                    if type_name == 'BO_':
-                        self.add_record(self.BO_(attributes))
-                    elif type_name == 'BO_TX_BU_':
-                        self.add_record(self.BO_TX_BU_(attributes))
-                    elif type_name == 'BA_DEF_':
-                        self.add_record(self.BA_DEF_(attributes))
-                    elif type_name == 'BA_DEF_DEF_':
-                        self.add_record(self.BA_DEF_DEF_(attributes))
-                    elif type_name == 'VAL_TABLE_':
-                        self.add_record(self.VAL_TABLE_(attributes))
-                    elif type_name == 'VAL_':
-                        self.add_record(self.VAL_(attributes))
-                    elif type_name == 'BA_':
-                        self.add_record(self.BA_(attributes))
-                    elif type_name == 'CM_':
-                        self.add_record(self.CM_(attributes))
-                    elif type_name == 'SIG_GROUP_':
-                        self.add_record(self.SIG_GROUP_(attributes))
-                    else:
-                        if type_name.endswith(':'):
-                            self.add_record(self.LIST_(type_name.rstrip(':')))
-                            if attributes is not None:
-                                for subrec in attributes.split(' '):
-                                    self.add_subrecord(subrec)
-                        else:
-                            raise Exception(f'Unrecognized entry: {type_name} {attributes}')
-                    continue
-                if re.match(r'\s+[A-Z_]+', line):
-                    line = line.strip()
-                    if ' ' in line:
-                        type_name, attributes = line.strip().split(' ', 1)
-                        if type_name == 'SG_':
-                            self.add_subrecord(self.SG_(attributes))
-                        else:
-                            self.add_subrecord({'type': type_name,
-                                                'attr': attributes})
-                    else:
-                        self.add_subrecord(line.strip())
-                    continue
-                raise Exception(f'Failed to parse: >{line}<')
+            with open(filename, 'r') as dbc_fh:
+                self.parse(dbc_fh)
+        self.resolve_values()
+
+    @classmethod
+    def load(cls, filename, cache_dir=None):
+        """
+        Return the DBC for the given file or text, from the compiled
+        cache when this exact content has been parsed before.
+        """
+        return cache.load(filename, cache_dir)
+
+    def compile(self):
+        """
+        Build the decoder of every message ahead of first use.
+        """
+        for bo in self.indexes.get(self.BO_, {}).values():
+            bo.compile()
+
+    def parse(self, dbc_fh):
+        """
+        Add the records of the .dbc text read from dbc_fh.
+        """
+        parser.parse(self, dbc_fh.read())
 
     def add_record(self, dbc_object):
         """
         Append a new record with the given name and attributes.
         """
         self.records.append(dbc_object)
+        self.index_record(dbc_object)
+
+    def index_record(self, dbc_object):
+        """
+        Register the record in the per-type index keyed by message id.
+        BO_ and BO_TX_BU_ records map an id to the first matching record,
+        CM_ and VAL_ records map an id to the list of records for it.
+        """
+        bo_id = self.record_id(dbc_object)
+        if bo_id is None:
+            return
+        index = self.indexes.setdefault(type(dbc_object), {})
+        if isinstance(dbc_object, (self.CM_, self.VAL_)):
+            index.setdefault(bo_id, []).append(dbc_object)
+        else:
+            index.setdefault(bo_id, dbc_object)
+        self.unknown_ids.discard(bo_id)
+
+    def resolve_values(self):
+        """
+        Attach every VAL_ value table to the SG_ it describes, once all
+        the records are in.
+        """
+        tables = {record.name: record for record in self.records
+                  if isinstance(record, self.VAL_TABLE_)}
+        for vals in self.indexes.get(self.VAL_, {}).values():
+            for val in vals:
+                self.resolve_value(val, tables)
+
+    def resolve_value(self, val, tables):
+        """
+        Set sg.values of the signal the VAL_ refers to, as a dict of
+        raw value => label, from its own rows or the VAL_TABLE_ it names
+        in tables, a {name: VAL_TABLE_} dict. Returns the SG_, or None
+        when the VAL_ matches no signal.
+        """
+        bo = self.indexes.get(self.BO_, {}).get(val.bo_id)
+        if bo is None:
+            return None
+        sg = next((sg for sg in bo.sgs if sg.name.split(' ', 1)[0] == val.signal), None)
+        if sg is None:
+            return None
+        if val.table is not None:
+            table = tables.get(val.table)
+            if table is None:
+                return None
+            rows = [(row['index'], row['type']) for row in table.rows]
+        else:
+            rows = [(row['name'], row['type']) for row in val.rows]
+        sg.values = {int(key): label for key, label in rows}
+        sg.decoder, bo.decoder = None, None
+        return sg
+
+    @staticmethod
+    def record_id(dbc_object):
+        """
+        Return the message id the record refers to, or None.
+        """
+        if isinstance(dbc_object, DBC.CM_):
+            return dbc_object.bo_id
+        if isinstance(dbc_object, DBC.VAL_):
+            bo_id = dbc_object.name.split(' ', 1)[0]
+            return int(bo_id) if bo_id.isdigit() else None
+        return getattr(dbc_object, 'id', None)
 
     def add_subrecord(self, dbc_object):
         """
@@ -254,36 +367,103 @@ class DBC:
         Search records and return the first one that matches the
         given type and event.id.
         """
+        index = self.indexes.get(type_name)
+        if index is not None:
+            return index.get(event.code)
         for record in [r for r in self.records if isinstance(r, type_name)]:
             if record.id == event.code:
                 return record
         return None
 
+    def query_all(self, type_name, code):
+        """
+        Return every CM_ or VAL_ record referring to the given message id.
+        """
+        index = self.indexes.get(type_name, {})
+        records = index.get(code, [])
+        if isinstance(records, list):
+            return records
+        return [records]
+
+    def decoder(self, code):
+        """
+        Return the MessageDecoder for the given message id, or None.
+        Unknown ids are remembered: every standard (11 bit) id, and up
+        to UNKNOWN_EXTENDED_IDS extended ones, so a bus full of fuzzed
+        extended ids cannot grow the set without limit.
+        """
+        if code in self.unknown_ids:
+            return None
+        bo = self.indexes.get(self.BO_, {}).get(code)
+        if bo is None:
+            if code <= 0x7FF:
+                self.unknown_ids.add(code)
+            elif self.unknown_extended < UNKNOWN_EXTENDED_IDS:
+                self.unknown_ids.add(code)
+                self.unknown_extended += 1
+            return None
+        return bo.compile()
+
+    def decode(self, event):
+        """
+        Given a CAN event this will return its signal values as numbers
+        in a Decoded tuple, or None when the message is not defined.
+        """
+        decoder = self.decoder(event.code)
+        if decoder is None:
+            return None
+        return decoder.decoded(event)
+
+    def encoder(self, message):
+        """
+        Return a MessageEncoder for the message id or name; see
+        DBC.encoder.MessageEncoder.
+        """
+        bos = self.indexes.get(self.BO_, {})
+        bo = bos.get(message)
+        if bo is None:
+            bo = next((bo for bo in bos.values() if bo.name == message), None)
+        if bo is None:
+            raise Exception(f'Unknown message: {message}')
+        return MessageEncoder(bo.compile())
+
+    def plan(self, messages=None, signals=None):
+        """
+        Return a DecodePlan limited to the given message names or ids
+        and signal names; see DBC.plan.DecodePlan.
+        """
+        return DecodePlan(self, messages, signals)
+
+    def predicate(self, expression):
+        """
+        Return the Predicate compiling the filter expression on signal
+        values; see DBC.predicate.Predicate.
+        """
+        return Predicate(self, expression)
+
+    def memoize(self, capacity=DECODE_CACHE_SIZE):
+        """
+        Return a DecodeCache answering repeated (id, payload) frames
+        from an LRU cache; see DBC.memo.DecodeCache.
+        """
+        return DecodeCache(self, capacity)
+
+    def decode_batch(self, codes, payloads, byte_n=None):
+        """
+        Decode NumPy arrays of message ids and payloads into one
+        column per signal; see DBC.batch.decode_batch().
+        """
+        return batch.decode_batch(self, codes, payloads, byte_n)
+
     def annotate(self, event):
         """
         Given a CAN event this will identify and
         return an annotated and decoded message.
         """
-        msg = {
-            'code': None,
-            'name': None,
-            'byte_n': None,
-            'from': None,
-            'fields': {}
-        }
-        bo = self.query(self.BO_, event)
-        if bo is not None:
-            msg['code'] = event.code
-            msg['name'], msg['byte_n'], msg['from'] = bo.name, bo.byte_n, bo.origin
-            for sg in bo.sgs:
-                msg['fields'][sg.name] = {
-                    'value': event.decode(sg),
-                    'to': sg.destination,
-                    'sg_': str(sg)
-                }
-        if msg['code'] is None:
+        decoder = self.decoder(event.code)
+        if decoder is None:
             return None
-        return msg
+        return decoder.annotate(event)
 
     def __str__(self):
         return 'FILE: {}\nVERSION: {}\n{}'.format(self.filename,
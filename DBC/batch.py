@@ -0,0 +1,129 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def as_payload_matrix(payloads):
+    """
+    Return the payloads as an (N, width) uint8 matrix. A one dimensional
+    uint64 array holds the integer value of each payload, the same value
+    CAN.get_value() returns, so shorter frames sit in the low bytes.
+    """
+    payloads = numpy.asarray(payloads)
+    if payloads.ndim == 1:
+        return payloads.astype('>u8').view(numpy.uint8).reshape(len(payloads), 8)
+    if payloads.ndim != 2:
+        raise Exception(f'Invalid payload array shape: {payloads.shape}')
+    return payloads.astype(numpy.uint8, copy=False)
+
+
+def extract_field(matrix, base, byte_n, endian, shift, bit_len):
+    """
+    Return the bit field of every row as uint64, reading the byte_n
+    bytes starting at column base of each row as one integer in the
+    given endian.
+    """
+    def column(k):
+        if k >= byte_n:
+            return None
+        index = k if endian == 0 else byte_n - 1 - k
+        return matrix[:, base + index].astype(numpy.uint64)
+
+    first, bit = shift // 8, shift % 8
+    field = numpy.zeros(len(matrix), dtype=numpy.uint64)
+    for j in range(min(8, (bit + bit_len + 7) // 8)):
+        byte = column(first + j)
+        if byte is not None:
+            field |= byte << numpy.uint64(8 * j)
+    field >>= numpy.uint64(bit)
+    if bit + bit_len > 64:
+        byte = column(first + 8)
+        if byte is not None:
+            field |= byte << numpy.uint64(64 - bit)
+    if bit_len < 64:
+        field &= numpy.uint64((1 << bit_len) - 1)
+    return field
+
+
+def decode_signal(signal, matrix, base, byte_n):
+    """
+    Vectorized SignalDecoder.decode() over every row of the matrix.
+    """
+    bit_len = signal.mask.bit_length()
+    if bit_len > 64:
+        values = []
+        for row in matrix:
+            data = bytes(row[base:base + byte_n])
+            value = int.from_bytes(data, 'big' if signal.endian else 'little')
+            values.append(signal.decode(value))
+        return numpy.array(values, dtype=numpy.float64)
+    field = extract_field(matrix, base, byte_n, signal.endian, signal.shift, bit_len)
+    negative = None
+    if signal.sign_bit:
+        sign_bit = numpy.uint64(signal.sign_bit)
+        negative = (field & sign_bit) != 0
+        field ^= sign_bit
+    values = signal.offset + signal.scale * field.astype(numpy.float64)
+    if negative is not None:
+        values = numpy.where(negative, -values, values)
+    if signal.clamp:
+        values = numpy.clip(values, signal.min_val, signal.max_val)
+    return values
+
+
+def decode_batch(dbc, codes, payloads, byte_n=None):
+    """
+    Decode arrays of message ids and payloads with the given DBC.
+    Returns a dict keyed by message id of annotate()-like dicts whose
+    'rows' are the input positions of that message and whose 'fields'
+    hold one float64 array per signal. byte_n optionally gives the
+    data length of every frame, otherwise the BO_ length is used.
+    """
+    if numpy is None:
+        raise Exception('decode_batch() requires numpy')
+    codes = numpy.asarray(codes)
+    right_aligned = numpy.asarray(payloads).ndim == 1
+    matrix = as_payload_matrix(payloads)
+    if len(codes) != len(matrix):
+        raise Exception(f'Got {len(codes)} ids for {len(matrix)} payloads')
+    if byte_n is not None:
+        byte_n = numpy.asarray(byte_n)
+    messages = {}
+    unique, inverse = numpy.unique(codes, return_inverse=True)
+    order = numpy.argsort(inverse, kind='stable')
+    bounds = numpy.cumsum(numpy.bincount(inverse, minlength=len(unique)))
+    start = 0
+    for code, end in zip(unique.tolist(), bounds.tolist()):
+        rows, start = order[start:end], end
+        decoder = dbc.decoder(code)
+        if decoder is None:
+            continue
+        groups = [(decoder.byte_n, rows)]
+        if byte_n is not None:
+            lengths = byte_n[rows]
+            groups = [(int(n), rows[lengths == n]) for n in numpy.unique(lengths)]
+        fields = {}
+        for length, group in groups:
+            length = min(length, matrix.shape[1])
+            base = matrix.shape[1] - length if right_aligned else 0
+            sub_matrix = matrix[group]
+            for signal in decoder.signals:
+                values = decode_signal(signal, sub_matrix, base, length)
+                if len(groups) == 1:
+                    fields[signal.name] = values
+                else:
+                    fields.setdefault(signal.name, []).append(values)
+        if len(groups) > 1:
+            rows = numpy.concatenate([group for _, group in groups])
+            in_order = numpy.argsort(rows, kind='stable')
+            rows = rows[in_order]
+            fields = {name: numpy.concatenate(parts)[in_order]
+                      for name, parts in fields.items()}
+        messages[code] = {
+            'code': code,
+            'name': decoder.name,
+            'rows': rows,
+            'fields': fields
+        }
+    return messages
@@ -0,0 +1,72 @@
+from .memo import DecodeCache, DECODE_CACHE_SIZE
+
+MISSING = object()
+
+
+class BusRouter:
+    """
+    Routes frames to the DBC of the bus they were captured on, by
+    their interface name, with default for the other interfaces. The
+    (interface, id) pairs seen are kept in a dispatch table, so each
+    frame costs one dict lookup whatever the number of buses. It offers
+    decode() and annotate() like DBC, and route() for the decoder.
+    """
+    def __init__(self, buses, default=None):
+        self.buses = dict(buses)
+        self.default = default
+        self.codes = None
+        self.table = {}
+
+    @classmethod
+    def load(cls, buses, default=None, cache=True):
+        """
+        Return the BusRouter of the {interface: .dbc filename} mapping,
+        with the default .dbc filename, if any, for other interfaces.
+        A file mapped to several interfaces is parsed once.
+        """
+        from . import DBC
+        loaded = {}
+
+        def load(filename):
+            if filename not in loaded:
+                loaded[filename] = DBC.load(filename) if cache else DBC(filename)
+            return loaded[filename]
+
+        return cls({interface: load(filename) for interface, filename in buses.items()},
+                   load(default) if default is not None else None)
+
+    def route(self, event):
+        """
+        Return the MessageDecoder of the event on its bus, or None.
+        """
+        key = (event.interface, event.code)
+        decoder = self.table.get(key, MISSING)
+        if decoder is MISSING:
+            dbc = self.buses.get(event.interface, self.default)
+            decoder = self.table[key] = dbc.decoder(event.code) if dbc is not None else None
+        return decoder
+
+    def memoize(self, capacity=DECODE_CACHE_SIZE):
+        """
+        Return a DecodeCache in front of this router.
+        """
+        return DecodeCache(self, capacity)
+
+    def decode(self, event):
+        decoder = self.route(event)
+        if decoder is None:
+            return None
+        return decoder.decoded(event)
+
+    def annotate(self, event):
+        """
+        Return the annotated message dict of the event, with the 'bus'
+        it was routed by, so per-message state downstream is kept apart
+        for buses sharing an id.
+        """
+        decoder = self.route(event)
+        if decoder is None:
+            return None
+        message = decoder.annotate(event)
+        message['bus'] = event.interface
+        return message
@@ -0,0 +1,150 @@
+import os
+import gc
+import hashlib
+import pickle
+
+PARSER_VERSION = 2
+CODE_DIGEST = None
+
+
+def default_dir():
+    """
+    Return the cache directory, $CAN_DECODE_CACHE or ~/.cache/can-decode.
+    """
+    if os.environ.get('CAN_DECODE_CACHE'):
+        return os.environ['CAN_DECODE_CACHE']
+    return os.path.join(os.path.expanduser('~'), '.cache', 'can-decode')
+
+
+def code_digest():
+    """
+    Return a hash of the modules whose classes end up in the pickle,
+    so editing them invalidates the cache as a version bump would.
+    """
+    global CODE_DIGEST
+    if CODE_DIGEST is None:
+        digest = hashlib.sha256()
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        for module in sorted(os.listdir(package_dir)):
+            if module.endswith('.py'):
+                with open(os.path.join(package_dir, module), 'rb') as module_fh:
+                    digest.update(module_fh.read())
+        CODE_DIGEST = digest.hexdigest()
+    return CODE_DIGEST
+
+
+def trusted(path):
+    """
+    True when path is owned by the current user and not writable by
+    group or others, so nobody else can have planted the pickle that
+    would be loaded from it. Always true where there are no uids.
+    """
+    if not hasattr(os, 'getuid'):
+        return True
+    stat = os.stat(path)
+    return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+
+
+def generation():
+    """
+    Return the prefix of the cache keys of this parser version and code.
+    """
+    return f'v{PARSER_VERSION}-{code_digest()[:16]}'
+
+
+def cache_key(text):
+    """
+    Return the cache key for the .dbc text under this parser version.
+    """
+    return f'{generation()}-{hashlib.sha256(text.encode()).hexdigest()}'
+
+
+def load(filename, cache_dir=None):
+    """
+    Return the compiled DBC for the file or text. A pickle of the parsed
+    and compiled database is stored under the content hash, so a changed
+    .dbc or a new parser version simply misses the cache. A cache entry
+    that cannot be unpickled, whatever the error, is a miss and is
+    rebuilt; one in a directory or file other users could have written
+    is not loaded at all.
+    """
+    from DBC import DBC
+    source = None
+    if "\n" in filename or not os.path.exists(filename):
+        text = filename
+    else:
+        source = filename
+        with open(filename, 'r') as dbc_fh:
+            text = dbc_fh.read()
+    cache_dir = cache_dir or default_dir()
+    cache_filename = os.path.join(cache_dir, f'{cache_key(text)}.pickle')
+    safe = False
+    try:
+        safe = not os.path.exists(cache_dir) or trusted(cache_dir)
+        if safe and os.path.exists(cache_filename) and trusted(cache_filename):
+            with open(cache_filename, 'rb') as cache_fh:
+                dbc = unpickle(cache_fh)
+            if isinstance(dbc, DBC):
+                dbc.filename = source
+                return dbc
+    except Exception:
+        pass
+    dbc = DBC(text)
+    dbc.compile()
+    if safe:
+        store(dbc, cache_filename)
+        prune(cache_dir)
+    dbc.filename = source
+    return dbc
+
+
+def unpickle(cache_fh):
+    """
+    Unpickle with the cyclic garbage collector paused; the database is
+    tens of thousands of small objects and none of them are garbage.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return pickle.load(cache_fh)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def store(dbc, cache_filename):
+    """
+    Write the pickled DBC atomically; a cache that cannot be written
+    is not an error.
+    """
+    temp_filename = f'{cache_filename}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(cache_filename), mode=0o700, exist_ok=True)
+        with open(os.open(temp_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600),
+                  'wb') as cache_fh:
+            pickle.dump(dbc, cache_fh, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_filename, cache_filename)
+    except OSError:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+
+
+def prune(cache_dir):
+    """
+    Remove the pickles of other parser versions or code, which no key
+    can reach any more. Only our own files are removed.
+    """
+    current = f'{generation()}-'
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return
+    for name in names:
+        if not name.endswith('.pickle') or name.startswith(current):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            if trusted(path):
+                os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,240 @@
+from collections import namedtuple
+
+DENSE_LABELS = 256
+
+
+class Decoded(namedtuple('Decoded', ['code', 'name', 'values', 'decoder', 'labels'])):
+    """
+    The numeric decode of one frame. values[i] belongs to
+    decoder.signals[i], which carries the name, units and SG_ text.
+    labels[i] is the VAL_ label of values[i], or None where there is
+    none; labels is None itself when no signal has a VAL_ table.
+    """
+    __slots__ = ()
+
+    def items(self):
+        """
+        Iterate (signal name, value) pairs.
+        """
+        return zip(self.decoder.names, self.values)
+
+    def signal(self, index):
+        """
+        Return the SignalDecoder describing values[index].
+        """
+        return self.decoder.signals[index]
+
+
+class SignalDecoder:
+    """
+    A DBC.SG_ compiled down to the integer constants needed to pull
+    the signal out of a payload value, so decoding a frame is a shift,
+    a mask and a little arithmetic instead of re-reading the SG_ text.
+    """
+    def __init__(self, sg):
+        bit_len = int(sg.bit_len)
+        self.sg = sg
+        self.name = sg.name
+        self.endian = sg.endian
+        self.shift = int(sg.start_bit)
+        self.mask = (1 << bit_len) - 1
+        self.sign_bit = (1 << (bit_len - 1)) if sg.signed else 0
+        self.scale = sg.scale
+        self.offset = sg.offset
+        self.clamp = sg.min_val < sg.max_val
+        self.min_val = sg.min_val
+        self.max_val = sg.max_val
+        self.integral = float(sg.scale).is_integer() \
+            and float(sg.offset).is_integer() \
+            and (not self.clamp or (float(sg.min_val).is_integer()
+                                    and float(sg.max_val).is_integer()))
+        self.units = sg.units
+        self.destination = sg.destination
+        self.labels, self.dense = None, False
+        if getattr(sg, 'values', None):
+            self.labels, self.dense = compile_labels(sg.values, self.mask)
+        self._sg_text = None
+
+    @property
+    def sg_text(self):
+        """
+        The SG_ definition as text, rendered on first use.
+        """
+        if self._sg_text is None:
+            self._sg_text = str(self.sg)
+        return self._sg_text
+
+    def raw(self, value):
+        """
+        Return the unscaled bit field of the signal in the payload value.
+        """
+        return (value >> self.shift) & self.mask
+
+    def physical(self, raw):
+        """
+        Apply sign, scale, offset and limits to the raw bit field.
+        """
+        negative = False
+        if self.sign_bit:
+            negative = raw & self.sign_bit
+            raw ^= self.sign_bit
+        value = self.offset + self.scale * raw
+        if negative:
+            value *= -1
+        if self.clamp:
+            if value < self.min_val:
+                value = self.min_val
+            elif value > self.max_val:
+                value = self.max_val
+        return value
+
+    def decode(self, value):
+        """
+        Decode the signal out of the payload value.
+        """
+        return self.physical((value >> self.shift) & self.mask)
+
+    def value(self, value):
+        """
+        Decode the signal out of the payload value as an int when the
+        scale, offset and limits are whole numbers, else as a float.
+        """
+        value = self.physical((value >> self.shift) & self.mask)
+        if self.integral:
+            return int(value)
+        return value
+
+    def label(self, value):
+        """
+        Return the VAL_ label of the signal in the payload value, or None.
+        """
+        raw = (value >> self.shift) & self.mask
+        if self.dense:
+            return self.labels[raw] if raw < len(self.labels) else None
+        return self.labels.get(raw)
+
+    def format(self, value):
+        """
+        Render the decoded value the way CAN.decode() always has.
+        """
+        text = str(value)
+        if text.endswith('.0'):
+            text = text[:-2]
+        if self.units != "":
+            return f'{text} {self.units}'
+        return text
+
+
+def compile_labels(values, mask):
+    """
+    Return (labels, dense) for a VAL_ table of raw value => label.
+    Negative raw values are masked to the field's bits and values the
+    field cannot hold are left out. Small tables of mostly consecutive
+    values become a tuple indexed by the raw value, the rest stay a dict.
+    """
+    labels = {key & mask: label for key, label in values.items() if key <= mask}
+    if len(labels) == 0:
+        return {}, False
+    top = max(labels)
+    if top < DENSE_LABELS and top < 2 * len(labels):
+        return tuple(labels.get(key) for key in range(top + 1)), True
+    return labels, False
+
+
+class MessageDecoder:
+    """
+    A DBC.BO_ compiled into its signal decoders. The payload is
+    converted to an integer once per frame and every signal is
+    decoded from it. Given signal names, only those signals are
+    decoded.
+    """
+    def __init__(self, bo, names=None):
+        self.code = bo.id
+        self.name = bo.name
+        self.byte_n = bo.byte_n
+        self.origin = bo.origin
+        self.signals = [sg.compile() for sg in bo.sgs if names is None or sg.name in names]
+        self.names = tuple(s.name for s in self.signals)
+        self.labelled = any(s.labels is not None for s in self.signals)
+        self.big_endian = any(s.endian != 0 for s in self.signals)
+        self.little_endian = any(s.endian == 0 for s in self.signals)
+
+    def unpack(self, payload):
+        """
+        Return the payload as the (endian 1, endian 0) integer pair.
+        """
+        big, little = 0, 0
+        if self.big_endian:
+            big = int.from_bytes(payload, 'big')
+        if self.little_endian:
+            little = int.from_bytes(payload, 'little')
+        return big, little
+
+    def decode(self, payload):
+        """
+        Return the decoded value of every signal, in SG_ order.
+        """
+        big, little = self.unpack(payload)
+        return [s.decode(big if s.endian else little) for s in self.signals]
+
+    def format(self, payload):
+        """
+        Return the formatted value of every signal, in SG_ order.
+        """
+        big, little = self.unpack(payload)
+        return [s.format(s.decode(big if s.endian else little)) for s in self.signals]
+
+    def values(self, payload):
+        """
+        Return the numeric value of every signal as a tuple, in SG_ order.
+        """
+        big, little = self.unpack(payload)
+        return tuple(s.value(big if s.endian else little) for s in self.signals)
+
+    def labels(self, payload):
+        """
+        Return the VAL_ label of every signal, or None where it has no
+        table or no label for the value, in SG_ order.
+        """
+        return self.unpacked_labels(*self.unpack(payload))
+
+    def unpacked_labels(self, big, little):
+        return tuple(s.label(big if s.endian else little) if s.labels is not None else None
+                     for s in self.signals)
+
+    def decoded(self, event):
+        """
+        Return the Decoded tuple of the event, with the labels of the
+        values when any signal has a VAL_ table.
+        """
+        big, little = self.unpack(event.payload)
+        values = tuple(s.value(big if s.endian else little) for s in self.signals)
+        labels = self.unpacked_labels(big, little) if self.labelled else None
+        return Decoded(event.code, self.name, values, self, labels)
+
+    def annotate(self, event):
+        """
+        Return the annotated message dict of the event. Signals with a
+        VAL_ table also get the 'label' of their value, None when the
+        table has none.
+        """
+        msg = {
+            'code': event.code,
+            'name': self.name,
+            'byte_n': self.byte_n,
+            'from': self.origin,
+            'fields': {}
+        }
+        fields = msg['fields']
+        big, little = self.unpack(event.payload)
+        for signal in self.signals:
+            fields[signal.name] = {
+                'value': signal.format(signal.decode(big if signal.endian else little)),
+                'to': signal.destination,
+                'sg_': signal.sg_text
+            }
+        if self.labelled:
+            for signal, label in zip(self.signals, self.unpacked_labels(big, little)):
+                if signal.labels is not None:
+                    fields[signal.name]['label'] = label
+        return msg
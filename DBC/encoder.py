@@ -0,0 +1,155 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class SignalEncoder:
+    """
+    The inverse of a SignalDecoder: packs a physical value into the
+    signal's bit field. The raw value is the one whose decode comes
+    closest to the physical value, so encode then decode is the
+    identity up to the scale's quantization and the signal's limits.
+
+    The decoder flips the sign bit of signed signals before scaling,
+    so a raw value u below the sign bit decodes to offset + scale *
+    (u + sign_bit) and sign_bit | u decodes to -(offset + scale * u).
+    Both candidates are worked out and the closer one is kept.
+    """
+    def __init__(self, decoder):
+        self.decoder = decoder
+        self.name = decoder.name
+        self.endian = decoder.endian
+        self.shift = decoder.shift
+        self.mask = decoder.mask
+        self.sign_bit = decoder.sign_bit
+        self.scale = decoder.scale
+        self.offset = decoder.offset
+
+    def steps(self, value, bias, top):
+        """
+        Return the raw count nearest (value - offset) / scale - bias,
+        limited to 0..top.
+        """
+        if self.scale == 0:
+            return 0
+        raw = round((value - self.offset) / self.scale - bias)
+        return min(max(raw, 0), top)
+
+    def raw(self, value):
+        """
+        Return the raw bit field that decodes closest to the value.
+        """
+        if not self.sign_bit:
+            return self.steps(value, 0, self.mask)
+        physical = self.decoder.physical
+        positive = self.steps(value, self.sign_bit, self.sign_bit - 1)
+        negative = self.sign_bit | self.steps(-value, 0, self.sign_bit - 1)
+        if abs(physical(negative) - value) < abs(physical(positive) - value):
+            return negative
+        return positive
+
+    def encode(self, value):
+        """
+        Return the value's bit field shifted into place in the payload value.
+        """
+        return self.raw(value) << self.shift
+
+    def raw_batch(self, values):
+        """
+        Vectorized raw() over a NumPy array of physical values, giving
+        a uint64 array. Fields over 64 bits are encoded one by one.
+        """
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if self.mask.bit_length() > 64:
+            return numpy.array([self.raw(value) for value in values.tolist()], dtype=object)
+        if not self.sign_bit:
+            return self.steps_batch(values, 0, self.mask)
+        sign_bit = self.sign_bit
+        positive = self.steps_batch(values, sign_bit, sign_bit - 1)
+        negative = self.steps_batch(-values, 0, sign_bit - 1)
+        positive_value = self.limit(self.offset + self.scale * (positive + float(sign_bit)))
+        negative_value = self.limit(-(self.offset + self.scale * negative.astype(numpy.float64)))
+        closer = numpy.abs(negative_value - values) < numpy.abs(positive_value - values)
+        return numpy.where(closer, negative | numpy.uint64(sign_bit), positive)
+
+    def steps_batch(self, values, bias, top):
+        if self.scale == 0:
+            return numpy.zeros(len(values), dtype=numpy.uint64)
+        raw = numpy.rint((values - self.offset) / self.scale - bias)
+        return numpy.clip(raw, 0, float(top)).astype(numpy.uint64)
+
+    def limit(self, values):
+        decoder = self.decoder
+        if decoder.clamp:
+            return numpy.clip(values, decoder.min_val, decoder.max_val)
+        return values
+
+
+class MessageEncoder:
+    """
+    A DBC.BO_ compiled into its signal encoders, building payloads from
+    physical values given by signal name. Signals left out are zero
+    bits. encode_batch() builds a payload matrix from NumPy columns.
+    """
+    def __init__(self, decoder):
+        self.code = decoder.code
+        self.name = decoder.name
+        self.byte_n = decoder.byte_n
+        self.signals = [SignalEncoder(signal) for signal in decoder.signals]
+        self.names = decoder.names
+
+    def pack(self, big, little):
+        """
+        Return the payload bytes of the (endian 1, endian 0) integer pair.
+        """
+        mask = (1 << (self.byte_n * 8)) - 1
+        little = int.from_bytes((little & mask).to_bytes(self.byte_n, 'little'), 'big')
+        return ((big & mask) | little).to_bytes(self.byte_n, 'big')
+
+    def encode(self, values):
+        """
+        Return the payload of a {signal name: physical value} dict.
+        """
+        big, little = 0, 0
+        for signal in self.signals:
+            value = values.get(signal.name)
+            if value is None:
+                continue
+            if signal.endian:
+                big |= signal.encode(value)
+            else:
+                little |= signal.encode(value)
+        return self.pack(big, little)
+
+    def encode_batch(self, columns):
+        """
+        Return the (N, byte_n) uint8 payload matrix of a {signal name:
+        array of N physical values} dict. Requires numpy.
+        """
+        if numpy is None:
+            raise Exception('encode_batch() requires numpy')
+        columns = {name: numpy.asarray(values) for name, values in columns.items()}
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) != 1:
+            raise Exception(f'Signal columns of {self.name} differ in length: {sorted(lengths)}')
+        count = lengths.pop()
+        if self.byte_n > 8:
+            rows = [dict(zip(columns, row)) for row in zip(*(values.tolist()
+                                                            for values in columns.values()))]
+            data = b''.join(self.encode(row) for row in rows)
+            return numpy.frombuffer(data, dtype=numpy.uint8).reshape(count, self.byte_n).copy()
+        big = numpy.zeros(count, dtype=numpy.uint64)
+        little = numpy.zeros(count, dtype=numpy.uint64)
+        for signal in self.signals:
+            values = columns.get(signal.name)
+            if values is None or signal.shift >= self.byte_n * 8:
+                continue
+            field = signal.raw_batch(values) << numpy.uint64(signal.shift)
+            if signal.endian:
+                big |= field
+            else:
+                little |= field
+        matrix = big.astype('>u8').view(numpy.uint8).reshape(count, 8)[:, 8 - self.byte_n:]
+        matrix = matrix | little.astype('<u8').view(numpy.uint8).reshape(count, 8)[:, :self.byte_n]
+        return numpy.ascontiguousarray(matrix)
@@ -0,0 +1,68 @@
+from collections import OrderedDict
+
+DECODE_CACHE_SIZE = 4096
+
+
+class DecodeCache:
+    """
+    An LRU cache of decode results keyed by (message id, payload) in
+    front of a DBC or DecodePlan. Status frames often repeat the same
+    payload for long stretches, and those repeats are answered without
+    decoding a signal. It offers decoder(), decode() and annotate() like
+    the DBC it wraps; the results are shared between hits and must be
+    treated as read-only. In front of a BusRouter the interface is part
+    of the key.
+    """
+    def __init__(self, dbc, capacity=DECODE_CACHE_SIZE):
+        if capacity < 1:
+            raise Exception(f'Invalid decode cache capacity: {capacity}')
+        self.dbc = dbc
+        self.capacity = capacity
+        self.codes = getattr(dbc, 'codes', None)
+        self.by_bus = hasattr(dbc, 'route')
+        if self.by_bus:
+            self.route = dbc.route
+        self.hits = 0
+        self.misses = 0
+        self.annotated = OrderedDict()
+        self.decoded = OrderedDict()
+
+    def decoder(self, code):
+        return self.dbc.decoder(code)
+
+    def lookup(self, results, decode, event):
+        """
+        Return the cached result for the event, decoding it on a miss.
+        Frames of ids without a decoder give None and bypass the cache,
+        so they neither evict entries nor count as hits or misses.
+        """
+        if self.by_bus:
+            key = (event.interface, event.code, event.payload)
+        else:
+            key = (event.code, event.payload)
+        result = results.get(key, results)
+        if result is not results:
+            self.hits += 1
+            results.move_to_end(key)
+            return result
+        if (self.route(event) if self.by_bus else self.dbc.decoder(event.code)) is None:
+            return None
+        self.misses += 1
+        result = results[key] = decode(event)
+        if len(results) > self.capacity:
+            results.popitem(last=False)
+        return result
+
+    def decode(self, event):
+        return self.lookup(self.decoded, self.dbc.decode, event)
+
+    def annotate(self, event):
+        return self.lookup(self.annotated, self.dbc.annotate, event)
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self):
+        return f'decode cache: {self.hits} hits, {self.misses} misses' \
+               f' ({self.hit_rate():.1%} hit rate), capacity {self.capacity}'
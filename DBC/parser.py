@@ -0,0 +1,104 @@
+import re
+
+TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.)*"|[^\s:;|@,()\[\]"]+|[:;|@,()\[\]]')
+
+STATEMENT_RE = re.compile(r'(?:"(?:[^"\\]|\\.)*"|[^"\n;]+|\n(?=[^\S\n]))+')
+
+OBJECT_TYPES = ('BU_', 'BO_', 'SG_', 'EV_')
+
+RECORD_TYPES = {'BO_TX_BU_', 'BA_DEF_', 'BA_DEF_DEF_', 'VAL_TABLE_', 'VAL_',
+                'BA_', 'CM_', 'SIG_GROUP_'}
+
+
+def tokenize(text):
+    """
+    Split .dbc text into tokens. Quoted strings, including ones that
+    span lines, are one token with their quotes, and punctuation is a
+    token of its own.
+    """
+    return TOKEN_RE.findall(text)
+
+
+def unquote(token):
+    """
+    Return the text of a quoted string token.
+    """
+    if len(token) > 1 and token[0] == '"' and token[-1] == '"':
+        return token[1:-1].replace('\\"', '"')
+    return token
+
+
+def split_list(tokens):
+    """
+    Return the tokens with the ',' separators dropped.
+    """
+    return [token for token in tokens if token != ',']
+
+
+def statements(text):
+    """
+    Yield the token list of every statement in the .dbc text. A
+    statement runs from the first column to the next ';' or the next
+    line that starts in the first column, so the indented SG_ lines of
+    a BO_ and the names of NS_ stay with it, while ';' and line breaks
+    inside quoted strings do not end it.
+    """
+    findall = TOKEN_RE.findall
+    for statement in STATEMENT_RE.findall(text):
+        tokens = findall(statement)
+        if tokens:
+            yield tokens
+
+
+def parse(dbc, text):
+    """
+    Add the records of the .dbc text to dbc. An SG_ statement of its
+    own, as left by a blank line inside a BO_ block, belongs to the BO_
+    just before it; anywhere else it is an error.
+    """
+    bo = None
+    for tokens in statements(text):
+        type_name = tokens[0]
+        if type_name == 'BO_':
+            bo = parse_bo(dbc, tokens)
+            continue
+        if type_name == 'SG_':
+            if bo is None:
+                raise Exception(f'SG_ outside of a BO_: >{" ".join(tokens)}<')
+            parse_sgs(dbc, bo, tokens)
+            continue
+        bo = None
+        if type_name in RECORD_TYPES:
+            dbc.add_record(getattr(dbc, type_name)(None, tokens[1:]))
+        elif type_name == 'VERSION':
+            dbc.version = unquote(tokens[1]) if len(tokens) > 1 else ""
+        elif len(tokens) > 1 and tokens[1] == ':':
+            record = dbc.LIST_(type_name)
+            record.items = split_list(tokens[2:])
+            dbc.add_record(record)
+        elif type_name.endswith('_') and type_name.isupper():
+            dbc.add_record(dbc.RAW_(type_name, tokens[1:]))
+        else:
+            raise Exception(f'Failed to parse: >{" ".join(tokens)}<')
+
+
+def parse_bo(dbc, tokens):
+    """
+    Add a BO_ record and the SG_ records that follow it, and return it.
+    """
+    sg_start = tokens.index('SG_') if 'SG_' in tokens else len(tokens)
+    bo = dbc.BO_(None, tokens[1:sg_start])
+    dbc.add_record(bo)
+    parse_sgs(dbc, bo, tokens[sg_start:])
+    return bo
+
+
+def parse_sgs(dbc, bo, tokens):
+    """
+    Append the SG_ records of the tokens, which start with SG_, to bo.
+    """
+    sg_starts = [i for i, token in enumerate(tokens) if token == 'SG_']
+    sg_starts.append(len(tokens))
+    for start, end in zip(sg_starts, sg_starts[1:]):
+        bo.append(dbc.SG_(None, tokens[start + 1:end]))
+
@@ -0,0 +1,72 @@
+from .decoder import MessageDecoder
+from .memo import DecodeCache, DECODE_CACHE_SIZE
+
+
+class DecodePlan:
+    """
+    A projection of a DBC onto the messages and signals of interest.
+    Only the selected messages get a decoder and each decoder only
+    holds the selected signals. codes is the set of message ids worth
+    parsing a payload for. It offers decoder(), decode() and annotate()
+    like DBC, so it can stand in for one in the pipeline.
+
+    messages holds message names or ids; signals holds signal names,
+    either plain or qualified as "<message>.<signal>".
+    """
+    def __init__(self, dbc, messages=None, signals=None):
+        self.dbc = dbc
+        self.decoders = {}
+        messages = set(messages) if messages is not None else None
+        signals = set(signals) if signals is not None else None
+        matched = set()
+        for bo in dbc.indexes.get(dbc.BO_, {}).values():
+            if messages is not None:
+                if bo.name not in messages and bo.id not in messages:
+                    continue
+                matched.update([bo.name, bo.id])
+            names = None
+            if signals is not None:
+                names = set()
+                for sg in bo.sgs:
+                    for name in (sg.name, f'{bo.name}.{sg.name}'):
+                        if name in signals:
+                            names.add(sg.name)
+                            matched.add(name)
+                if len(names) == 0:
+                    continue
+            self.decoders[bo.id] = MessageDecoder(bo, names)
+        if messages is not None and messages - matched:
+            raise Exception(f'Unknown messages: {sorted(map(str, messages - matched))}')
+        if signals is not None and signals - matched:
+            raise Exception(f'Unknown signals: {sorted(signals - matched)}')
+        self.codes = frozenset(self.decoders)
+
+    def decoder(self, code):
+        """
+        Return the MessageDecoder for the given message id, or None.
+        """
+        return self.decoders.get(code)
+
+    def memoize(self, capacity=DECODE_CACHE_SIZE):
+        """
+        Return a DecodeCache in front of this plan.
+        """
+        return DecodeCache(self, capacity)
+
+    def decode(self, event):
+        """
+        Return the Decoded tuple of the selected signals, or None.
+        """
+        decoder = self.decoders.get(event.code)
+        if decoder is None:
+            return None
+        return decoder.decoded(event)
+
+    def annotate(self, event):
+        """
+        Return the annotated message with the selected signals, or None.
+        """
+        decoder = self.decoders.get(event.code)
+        if decoder is None:
+            return None
+        return decoder.annotate(event)
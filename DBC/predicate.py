@@ -0,0 +1,209 @@
+import ast
+import operator
+
+OPERATORS = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+FLIPPED = {ast.Lt: ast.Gt, ast.LtE: ast.GtE, ast.Gt: ast.Lt, ast.GtE: ast.LtE,
+           ast.Eq: ast.Eq, ast.NotEq: ast.NotEq}
+
+
+class Predicate:
+    """
+    A filter expression on physical signal values, such as
+    'VehicleSpeed > 80 and Gear == D', compiled to tests on the raw bit
+    fields. Signals are named plainly or as "<message>.<signal>", and
+    can be compared with numbers or, for signals with a VAL_ table,
+    with == and != against a label.
+
+    For unsigned signals the physical value only ever grows (or only
+    shrinks) with the raw value, so each comparison becomes a range of
+    raw values found once by bisection with the signal's own decoder,
+    limits and scale sign included. Signed signals are compared on
+    their decoded value.
+
+    The last raw value of every signal is kept, so update() can tell
+    for any frame whether the expression holds at that point of the log.
+    """
+    def __init__(self, dbc, expression):
+        self.expression = expression
+        self.dbc = dbc
+        self.slots = {}
+        self.fields = {}
+        try:
+            tree = ast.parse(expression, mode='eval')
+        except SyntaxError as exc:
+            raise Exception(f'Invalid filter expression: {expression}: {exc.msg}')
+        self.test = self.compile_node(tree.body)
+        self.values = [None] * len(self.slots)
+        self.codes = frozenset(self.fields)
+        self.state = False
+
+    def update(self, event):
+        """
+        Take the referenced signals of the event and return whether
+        the expression holds after it.
+        """
+        fields = self.fields.get(event.code)
+        if fields is not None:
+            payload = event.payload
+            big, little = None, None
+            values = self.values
+            for slot, signal in fields:
+                if signal.endian:
+                    if big is None:
+                        big = int.from_bytes(payload, 'big')
+                    value = big
+                else:
+                    if little is None:
+                        little = int.from_bytes(payload, 'little')
+                    value = little
+                values[slot] = (value >> signal.shift) & signal.mask
+            self.state = self.test(values)
+        return self.state
+
+    def resolve(self, node):
+        """
+        Return (slot, SignalDecoder) of the signal the name node refers
+        to, or None when it names no signal.
+        """
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+            message, name = node.value.id, node.attr
+        elif isinstance(node, ast.Name):
+            message, name = None, node.id
+        else:
+            return None
+        found = []
+        for bo in self.dbc.indexes.get(self.dbc.BO_, {}).values():
+            if message is not None and bo.name != message:
+                continue
+            for sg in bo.sgs:
+                if name in (sg.name, sg.name.split(' ', 1)[0]):
+                    found.append((bo, sg))
+        if len(found) == 0:
+            return None
+        if len(found) > 1:
+            names = ', '.join(f'{bo.name}.{sg.name}' for bo, sg in found)
+            raise Exception(f'Ambiguous signal in filter: {name} ({names})')
+        bo, sg = found[0]
+        key = (bo.id, sg.name)
+        signal = sg.compile()
+        if key not in self.slots:
+            self.slots[key] = len(self.slots)
+            self.fields.setdefault(bo.id, []).append((self.slots[key], signal))
+        return self.slots[key], signal
+
+    def compile_node(self, node):
+        """
+        Return a function of the raw values list for the expression node.
+        """
+        if isinstance(node, ast.BoolOp):
+            tests = [self.compile_node(value) for value in node.values]
+            if isinstance(node.op, ast.And):
+                return lambda values: all(test(values) for test in tests)
+            return lambda values: any(test(values) for test in tests)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            test = self.compile_node(node.operand)
+            return lambda values: not test(values)
+        if isinstance(node, ast.Compare):
+            tests = []
+            left = node.left
+            for op, right in zip(node.ops, node.comparators):
+                tests.append(self.compile_compare(left, op, right))
+                left = right
+            if len(tests) == 1:
+                return tests[0]
+            return lambda values: all(test(values) for test in tests)
+        raise Exception(f'Unsupported filter expression: {ast.unparse(node)}')
+
+    def compile_compare(self, left, op, right):
+        """
+        Return the test for one "<signal> <op> <value>" comparison,
+        the operands being in either order.
+        """
+        if type(op) not in OPERATORS:
+            raise Exception(f'Unsupported filter comparison: {ast.unparse(op)}')
+        op = type(op)
+        signal = self.resolve(left)
+        if signal is None:
+            left, right, op = right, left, FLIPPED[op]
+            signal = self.resolve(left)
+        if signal is None:
+            raise Exception(f'No signal in filter comparison: {ast.unparse(left)}')
+        slot, decoder = signal
+        value = self.constant(right, decoder)
+        if isinstance(value, str):
+            return self.compile_label(slot, decoder, op, value)
+        if decoder.sign_bit:
+            compare = OPERATORS[op]
+            physical = decoder.physical
+            return lambda values: values[slot] is not None \
+                and compare(physical(values[slot]), value)
+        if op is ast.NotEq:
+            low, high = raw_range(decoder, ast.Eq, value)
+            return lambda values: values[slot] is not None \
+                and not low <= values[slot] <= high
+        low, high = raw_range(decoder, op, value)
+        return lambda values: values[slot] is not None and low <= values[slot] <= high
+
+    def constant(self, node, decoder):
+        """
+        Return the number or label the node stands for.
+        """
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            value = self.constant(node.operand, decoder)
+            if not isinstance(value, str):
+                return -value if isinstance(node.op, ast.USub) else value
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)) \
+                and not isinstance(node.value, bool):
+            return node.value
+        if isinstance(node, ast.Name) and decoder.labels is not None:
+            return node.id
+        raise Exception(f'Invalid filter value: {ast.unparse(node)}')
+
+    def compile_label(self, slot, decoder, op, label):
+        """
+        Return the test comparing the signal with a VAL_ label.
+        """
+        if op not in (ast.Eq, ast.NotEq):
+            raise Exception(f'Labels only compare with == and !=: {decoder.name} {label}')
+        labels = decoder.labels
+        items = enumerate(labels) if decoder.dense else labels.items()
+        raws = frozenset(raw for raw, text in items if text == label)
+        if len(raws) == 0:
+            raise Exception(f'No label {label} for signal {decoder.name}')
+        if op is ast.Eq:
+            return lambda values: values[slot] in raws
+        return lambda values: values[slot] is not None and values[slot] not in raws
+
+
+def raw_range(decoder, op, value):
+    """
+    Return the (low, high) raw values of the unsigned signal whose
+    physical value compares true with value, (1, 0) when there are none.
+    The physical value is monotonic in the raw value, so every
+    comparison holds on one run of raw values at one end of the range.
+    """
+    if op is ast.Eq:
+        low, high = raw_range(decoder, ast.GtE, value)
+        low_2, high_2 = raw_range(decoder, ast.LtE, value)
+        return max(low, low_2), min(high, high_2)
+    compare, physical, top = OPERATORS[op], decoder.physical, decoder.mask
+    first, last = compare(physical(0), value), compare(physical(top), value)
+    if first == last:
+        return (0, top) if first else (1, 0)
+    low, high = 0, top
+    while high - low > 1:
+        middle = (low + high) // 2
+        if compare(physical(middle), value) == first:
+            low = middle
+        else:
+            high = middle
+    if first:
+        return 0, low
+    return high, top
@@ -0,0 +1,152 @@
+"""
+Streaming aggregation of decoded signals over time windows. Signals
+are summarized as count, min, max, mean and last value per window,
+with one row per signal and window, so a long capture reduces to a
+small table without keeping the decoded stream around.
+
+Windows are built from panes of step seconds. A tumbling window is a
+single pane (step == width); a sliding window of width seconds spans
+width / step panes, one row set being emitted every step seconds.
+The sliding windows that would start before the first pane start with
+it instead. Only the statistics of the panes of one window are held,
+whatever the length of the log. The time is the candump timestamp
+when the log has one, otherwise the frame number.
+
+    rows = aggregate(pipeline.decode_values(frames, dbc), 60, 10)
+    print_windows(rows)
+"""
+import sys
+import math
+from collections import deque, namedtuple
+
+WindowRow = namedtuple('WindowRow', ['start', 'end', 'code', 'message', 'signal',
+                                     'count', 'min', 'max', 'mean', 'last', 'interface'],
+                       defaults=(None,))
+
+
+class WindowAggregator:
+    """
+    Folds (time, Decoded) pairs into per-signal pane statistics and
+    returns the rows of every window that closes. The signals of frames
+    added with an interface are kept apart per interface, for the
+    buses of a BusRouter that share a DBC.
+    """
+    def __init__(self, width, step=None):
+        step = step or width
+        if width <= 0 or step <= 0:
+            raise Exception(f'Invalid window: {width} step {step}')
+        pane_n = round(width / step)
+        if pane_n < 1 or not math.isclose(pane_n * step, width):
+            raise Exception(f'The window width {width} is not a multiple of the step {step}')
+        self.width, self.step, self.pane_n = width, step, pane_n
+        self.pane = None
+        self.first = None
+        self.current = {}
+        self.history = deque(maxlen=pane_n - 1)
+        self.names = {}
+
+    def add(self, time, decoded, interface=None):
+        """
+        Add the values of a decoded frame and return the rows of the
+        windows closed by its time. Frames older than the current pane
+        are counted in it.
+        """
+        rows = []
+        pane = math.floor(time / self.step)
+        if self.pane is None:
+            self.pane = self.first = pane
+        elif pane > self.pane:
+            gap = pane - self.pane - 1
+            rows.extend(self.close_pane())
+            for _ in range(min(gap, self.pane_n - 1)):
+                self.pane += 1
+                rows.extend(self.close_pane())
+            self.pane = pane
+        current, source = self.current, (interface, decoded.decoder)
+        for name, value in zip(decoded.decoder.names, decoded.values):
+            stats = current.get((source, name))
+            if stats is None:
+                if (source, name) not in self.names:
+                    self.names[source, name] = (len(self.names), decoded.name)
+                current[source, name] = [1, value, value, value, value]
+                continue
+            stats[0] += 1
+            if value < stats[1]:
+                stats[1] = value
+            elif value > stats[2]:
+                stats[2] = value
+            stats[3] += value
+            stats[4] = value
+        return rows
+
+    def close_pane(self):
+        """
+        Return the rows of the window ending with the current pane and
+        move the pane into the history. Only the signals seen in the
+        window's panes are visited, in the order they were first seen.
+        """
+        end = (self.pane + 1) * self.step
+        start = max(end - self.width, self.first * self.step)
+        panes = list(self.history) + [self.current]
+        names = self.names
+        keys = set(self.current).union(*self.history) if self.history else self.current
+        rows = []
+        for key in sorted(keys, key=lambda key: names[key][0]):
+            count, low, high, total, last = 0, None, None, 0, None
+            for pane in panes:
+                stats = pane.get(key)
+                if stats is None:
+                    continue
+                count += stats[0]
+                low = stats[1] if low is None or stats[1] < low else low
+                high = stats[2] if high is None or stats[2] > high else high
+                total += stats[3]
+                last = stats[4]
+            if count > 0:
+                rows.append(WindowRow(start, end, key[0][1].code, names[key][1], key[1],
+                                      count, low, high, total / count, last, key[0][0]))
+        self.history.append(self.current)
+        self.current = {}
+        return rows
+
+    def flush(self):
+        """
+        Return the rows of the window ending with the last pane.
+        """
+        if self.pane is None or len(self.current) == 0:
+            return []
+        return self.close_pane()
+
+
+def aggregate(decoded, width, step=None, by_bus=False):
+    """
+    Yield the WindowRows of the (line, event, decoded) items of
+    pipeline.decode_values() over windows of width seconds, every
+    step seconds (tumbling windows when step is None). With by_bus,
+    the frames of a BusRouter, the rows are per interface.
+    """
+    aggregator = WindowAggregator(width, step)
+    for index, (_, event, values) in enumerate(decoded):
+        if values is None:
+            continue
+        time = getattr(event, 'timestamp', None)
+        if time is None:
+            time = index
+        yield from aggregator.add(time, values, event.interface if by_bus else None)
+    yield from aggregator.flush()
+
+
+def print_windows(rows, out=None, by_bus=False):
+    """
+    Print the window rows as CSV, with an interface column after the
+    window bounds when by_bus is set.
+    """
+    out = out or sys.stdout
+    if by_bus:
+        out.write('start,end,interface,code,message,signal,count,min,max,mean,last\n')
+    else:
+        out.write('start,end,code,message,signal,count,min,max,mean,last\n')
+    for row in rows:
+        bus = f'{row.interface},' if by_bus else ''
+        out.write(f'{row.start!r},{row.end!r},{bus}{row.code},{row.message},{row.signal},'
+                  f'{row.count},{row.min!r},{row.max!r},{row.mean!r},{row.last!r}\n')
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+This benchmarks decoding of a synthetic candump log against a
+synthetic .dbc file, comparing the original per-signal decode
+with the compiled message decoders used by DBC.annotate().
+
+    bench_decode.py [message_n signal_n frame_n]
+    bench_decode.py parse [message_n signal_n]
+    bench_decode.py suite [message_n signal_n frame_n] [--json FILE]
+    bench_decode.py compare <before>.json <after>.json
+    bench_decode.py generate <directory> [message_n signal_n frame_n]
+
+The suite times each stage of decoding on its own (DBC parse, line
+parse, lookup, decode and output) and records frames/sec and peak
+traced memory per stage, optionally as JSON to compare between commits.
+"""
+import io
+import os
+import re
+import sys
+import json
+import random
+import platform
+import subprocess
+import time
+import tracemalloc
+from DBC import DBC
+from CAN import CAN
+import pipeline
+
+
+def make_dbc_text(message_n, signal_n):
+    """
+    Return the text of a .dbc file with message_n 8 byte messages
+    each holding signal_n signals, plus the node list, comments,
+    attributes and value tables an OEM database carries.
+    """
+    rand = random.Random(message_n * 1000 + signal_n)
+    lines = ['VERSION "synthetic"', '', 'NS_ :', '\tCM_', '\tBA_DEF_', '\tBA_', '\tVAL_', '',
+             'BS_:', '', 'BU_: ' + ' '.join(f'ECU_{n}' for n in range(7)), '']
+    tail = ['BA_DEF_ BO_ "GenMsgCycleTime" INT 0 65535;',
+            'BA_DEF_ SG_ "SigType" ENUM "Normal","Special value";',
+            'BA_DEF_DEF_ "GenMsgCycleTime" 100;']
+    bit_len = max(1, 64 // signal_n)
+    for m in range(message_n):
+        lines.append(f'BO_ {100 + m} Message_{m}: 8 ECU_{m % 7}')
+        for s in range(signal_n):
+            endian = rand.choice('01')
+            sign = rand.choice('+-')
+            scale = rand.choice(['1', '0.1', '0.5', '2.5'])
+            offset = rand.choice(['0', '-40', '150'])
+            lines.append(f' SG_ Signal_{m}_{s} : {s * bit_len}|{bit_len}@{endian}{sign}'
+                         f' ({scale},{offset}) [0|0] "unit" ECU_{s % 5}')
+            if s == 0:
+                tail.append(f'CM_ SG_ {100 + m} Signal_{m}_{s} "First signal of\n'
+                            f'message {m}; spans two lines";')
+                tail.append(f'VAL_ {100 + m} Signal_{m}_{s} 0 "Off" 1 "On" 2 "Error state" ;')
+        lines.append('')
+        tail.append(f'CM_ BO_ {100 + m} "Message {m}";')
+        tail.append(f'BA_ "GenMsgCycleTime" BO_ {100 + m} {rand.choice([10, 20, 100])};')
+    return "\n".join(lines + tail) + "\n"
+
+
+def make_can_lines(message_n, frame_n):
+    """
+    Return frame_n candump lines for random ids among message_n messages.
+    """
+    rand = random.Random(frame_n)
+    lines = []
+    for _ in range(frame_n):
+        code = 100 + rand.randrange(message_n)
+        data = ' '.join(f'{rand.randrange(256):02X}' for _ in range(8))
+        lines.append(f'  can0  {code:03X}   [8]  {data}')
+    return lines
+
+
+def legacy_decode(event, sg):
+    """
+    The CAN.decode() implementation this benchmark is measured against.
+    """
+    sign = 0
+    value = int(event.get_value(sg.endian))
+    bitmask = (pow(2, int(sg.bit_len)) - 1) << int(sg.start_bit)
+    value = (value & bitmask)
+    value = value >> int(sg.start_bit)
+    if sg.signed:
+        first_bitmask = pow(2, int(sg.bit_len) - 1)
+        sign = (value & first_bitmask) >> (int(sg.bit_len) - 1)
+        value = first_bitmask ^ value
+    value = sg.offset + sg.scale * value
+    if sign == 1:
+        value *= -1
+    if sg.min_val < sg.max_val:
+        value = max(value, sg.min_val)
+    if sg.max_val > sg.min_val:
+        value = min(sg.max_val, value)
+    value = re.sub(r'[.]0$', "", str(value))
+    if sg.units != "":
+        return f'{value} {sg.units}'
+    return value
+
+
+def legacy_annotate(dbc, event):
+    """
+    The DBC.annotate() implementation this benchmark is measured against.
+    """
+    bo = None
+    for record in [r for r in dbc.records if isinstance(r, DBC.BO_)]:
+        if record.id == event.code:
+            bo = record
+            break
+    if bo is None:
+        return None
+    msg = {'code': event.code, 'name': bo.name, 'byte_n': bo.byte_n,
+           'from': bo.origin, 'fields': {}}
+    for sg in bo.sgs:
+        msg['fields'][sg.name] = {
+            'value': legacy_decode(event, sg),
+            'to': sg.destination,
+            'sg_': str(sg)
+        }
+    return msg
+
+
+def measure(name, annotate, dbc, lines):
+    """
+    Decode every line with the given annotate function and
+    return the frames/sec rate.
+    """
+    start = time.perf_counter()
+    for line in lines:
+        annotate(dbc, CAN(line))
+    elapsed = time.perf_counter() - start
+    rate = len(lines) / elapsed
+    print(f'{name: <10} {len(lines)} frames in {elapsed:.3f}s = {rate:,.0f} frames/sec')
+    return rate
+
+
+def run_parse(message_n, signal_n):
+    """
+    Time DBC parsing of a generated database.
+    """
+    text = make_dbc_text(message_n, signal_n)
+    line_n = text.count("\n")
+    start = time.perf_counter()
+    DBC(text)
+    elapsed = time.perf_counter() - start
+    print(f'parse      {line_n} lines in {elapsed:.3f}s = {line_n / elapsed:,.0f} lines/sec')
+    return True
+
+
+def write_fixtures(directory, message_n, signal_n, frame_n):
+    """
+    Write a generated synthetic.dbc and synthetic.log to the directory
+    and return their filenames.
+    """
+    os.makedirs(directory, exist_ok=True)
+    dbc_filename = os.path.join(directory, 'synthetic.dbc')
+    can_filename = os.path.join(directory, 'synthetic.log')
+    with open(dbc_filename, 'w') as dbc_fh:
+        dbc_fh.write(make_dbc_text(message_n, signal_n))
+    with open(can_filename, 'w') as can_fh:
+        can_fh.write("\n".join(make_can_lines(message_n, frame_n)) + "\n")
+    return dbc_filename, can_filename
+
+
+def measure_stage(name, stage, item_n):
+    """
+    Run the stage once for time and once more under tracemalloc for
+    the peak memory it allocates, and return the stage's result dict.
+    """
+    start = time.perf_counter()
+    stage()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        stage()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    result = {'stage': name, 'items': item_n, 'seconds': elapsed,
+              'rate': item_n / elapsed if elapsed > 0 else 0.0, 'peak_bytes': peak}
+    print(f'{name: <10} {item_n} items in {elapsed:.3f}s = {result["rate"]:,.0f} items/sec,'
+          f' peak {peak / 1024:,.0f} KiB')
+    return result
+
+
+def git_revision():
+    """
+    Return the short hash of the checked out commit, or None.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(message_n, signal_n, frame_n, json_filename=None):
+    """
+    Time every decoding stage separately. The parse stage counts .dbc
+    lines, the others count candump frames.
+    """
+    dbc_text = make_dbc_text(message_n, signal_n)
+    lines = make_can_lines(message_n, frame_n)
+    dbc = DBC(dbc_text)
+    events = [CAN(line) for line in lines]
+    bos = [dbc.query(DBC.BO_, event) for event in events]
+    messages = [(line, event, dbc.annotate(event)) for line, event in zip(lines, events)]
+
+    def decode():
+        for event, bo in zip(events, bos):
+            for sg in bo.sgs:
+                event.decode(sg)
+
+    stages = [
+        measure_stage('parse', lambda: DBC(dbc_text), dbc_text.count("\n")),
+        measure_stage('line', lambda: [CAN(line) for line in lines], frame_n),
+        measure_stage('lookup', lambda: [dbc.query(DBC.BO_, event) for event in events], frame_n),
+        measure_stage('decode', decode, frame_n),
+        measure_stage('output', lambda: pipeline.print_default(messages, io.StringIO()), frame_n),
+    ]
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'message_n': message_n,
+        'signal_n': signal_n,
+        'frame_n': frame_n,
+        'stages': stages,
+    }
+    if json_filename is not None:
+        with open(json_filename, 'w') as json_fh:
+            json.dump(results, json_fh, indent=2)
+    return results
+
+
+def compare(before_filename, after_filename):
+    """
+    Print the per-stage rate and peak memory change between two suite runs.
+    """
+    with open(before_filename) as before_fh, open(after_filename) as after_fh:
+        before, after = json.load(before_fh), json.load(after_fh)
+    print(f'{before["revision"]} => {after["revision"]}')
+    before_stages = {stage['stage']: stage for stage in before['stages']}
+    for stage in after['stages']:
+        old = before_stages.get(stage['stage'])
+        if old is None:
+            continue
+        speedup = stage['rate'] / old['rate'] if old['rate'] else float('inf')
+        print(f'{stage["stage"]: <10} {old["rate"]:>12,.0f} => {stage["rate"]:>12,.0f} items/sec'
+              f' ({speedup:.2f}x), peak {old["peak_bytes"] / 1024:,.0f}'
+              f' => {stage["peak_bytes"] / 1024:,.0f} KiB')
+    return True
+
+
+def run(message_n, signal_n, frame_n):
+
+    dbc = DBC(make_dbc_text(message_n, signal_n))
+    lines = make_can_lines(message_n, frame_n)
+
+    for line in lines[0:100]:
+        event = CAN(line)
+        message = dbc.annotate(event)
+        for field in message['fields'].values():
+            field.pop('label', None)
+        if legacy_annotate(dbc, event) != message:
+            raise Exception(f'Decoders disagree on: {line}')
+
+    legacy = measure('legacy', legacy_annotate, dbc, lines)
+    compiled = measure('compiled', DBC.annotate, dbc, lines)
+    print(f'speedup    {compiled / legacy:.1f}x')
+
+    return True
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'parse':
+        args = [int(arg) for arg in sys.argv[2:]]
+        message_n, signal_n = (args + [4000, 10][len(args):])[0:2]
+        run_parse(message_n, signal_n)
+    elif len(sys.argv) > 1 and sys.argv[1] == 'suite':
+        args = sys.argv[2:]
+        json_filename = None
+        if '--json' in args:
+            i = args.index('--json')
+            json_filename = args[i + 1]
+            del args[i:i + 2]
+        args = [int(arg) for arg in args]
+        message_n, signal_n, frame_n = (args + [300, 8, 20000][len(args):])[0:3]
+        run_suite(message_n, signal_n, frame_n, json_filename)
+    elif len(sys.argv) == 4 and sys.argv[1] == 'compare':
+        compare(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) > 2 and sys.argv[1] == 'generate':
+        args = [int(arg) for arg in sys.argv[3:]]
+        message_n, signal_n, frame_n = (args + [300, 8, 20000][len(args):])[0:3]
+        print(*write_fixtures(sys.argv[2], message_n, signal_n, frame_n))
+    else:
+        args = [int(arg) for arg in sys.argv[1:]]
+        message_n, signal_n, frame_n = (args + [300, 8, 20000][len(args):])[0:3]
+        run(message_n, signal_n, frame_n)
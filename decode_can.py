@@ -8,59 +8,423 @@ the module from => to relationship.
 import os
 import re
 import sys
+import json
+import time
 from pprint import pprint, pformat
-from DBC import DBC
-from CAN import CAN
-
-
-def run(dbc_filename, can_filename, verbose, annotation):
-
-    dbc = DBC(dbc_filename)
-
-    with open(can_filename, 'r') as can_fh:
-        for line in can_fh:
-            event = CAN(line)
-            message = dbc.annotate(event)
-            if message is not None:
-                code, name, from_node, fields = message['code'], \
-                                                message['name'], \
-                                                message['from'], \
-                                                message['fields']
-                for field_name in fields:
-                    value, to_node, sg_ = fields[field_name]['value'], \
-                                          fields[field_name]['to'],    \
-                                          fields[field_name]['sg_']
-                    if verbose:
-                        bin_str = event.get_binary_str()
-                        sg_rule = ' '.join(sg_.split(':')[1].lstrip().split(' ')[0:3])
-                        print(f'[{code}] {name}:{field_name}\n{bin_str} : <{sg_rule}> : {value}')
-                    elif annotation:
-                        line = line.strip()
-                        print(f'{line: <40} #  {name}:{field_name} = {value}')
-                    else:
-                        print(f'[{code}] {name}:{field_name} = {value} ({from_node} => {to_node})')
-            elif verbose:
-                print(f'NO DECODE FOR: {event}')
+from DBC import DBC, BusRouter
+from CAN.reader import map_lines
+import pipeline
+import parallel
+import export
+import sidecar
+import stats as run_stats
+import aggregate
+import follow
+
+
+def load_dbc(dbc_filename, cache=True, messages=None, signals=None, decode_cache=0,
+             buses=None, stats=None):
+    """
+    Return the DBC, or its DecodePlan when messages or signals are given,
+    behind a DecodeCache of decode_cache entries when that is not 0.
+    With buses, an {interface: .dbc filename} mapping, it is the
+    BusRouter of the buses instead, dbc_filename (possibly None) being
+    the DBC of the other interfaces. The time taken is the load stage
+    of stats when a stats.Stats is given.
+    """
+    started = time.perf_counter()
+    if buses is not None:
+        dbc = BusRouter.load(buses, dbc_filename, cache)
+    else:
+        dbc = DBC.load(dbc_filename) if cache else DBC(dbc_filename)
+    if messages is not None or signals is not None:
+        dbc = dbc.plan(messages, signals)
+    if decode_cache > 0:
+        dbc = dbc.memoize(decode_cache)
+    if stats is not None:
+        stats.times['load'] += time.perf_counter() - started
+    return dbc
+
+
+def select_frames(can_filename, dbc, codes=None, start=None, end=None, predicate=None,
+                  stats=None):
+    """
+    Return the (line, frame) source for the candump file, going through
+    the sidecar index when ids or a time range are selected. Frames a
+    DecodePlan has no decoder for are dropped as soon as their id is read,
+    unless the DBC.Predicate needs them, and only the frames seen while
+    the predicate holds are kept. The lines read, dropped or not, are
+    counted in stats when a stats.Stats is given.
+    """
+    keep = getattr(dbc, 'codes', None)
+    if codes is not None:
+        keep = set(codes) if keep is None else set(codes) & keep
+    read = keep
+    if predicate is not None and read is not None:
+        read = set(read) | predicate.codes
+    count = stats.count_lines if stats is not None else None
+    if codes is None and start is None and end is None:
+        lines = map_lines(can_filename)
+        if count is not None:
+            lines = count(lines)
+    else:
+        lines, read = sidecar.query_lines(can_filename, read, start, end, stage=count), None
+    frames = pipeline.parse_bytes(lines, read)
+    if predicate is not None:
+        frames = pipeline.filter_predicate(frames, predicate, keep)
+    return frames
+
+
+def load_predicate(dbc, expression):
+    """
+    Return the DBC.Predicate of the filter expression, or None.
+    """
+    if expression is None:
+        return None
+    while not isinstance(dbc, DBC):
+        dbc = dbc.dbc
+    return dbc.predicate(expression)
+
+
+def decode_stage(frames, dbc, stats=None, values=False):
+    """
+    Return the decode stage over the frames, counted and timed in
+    stats when a stats.Stats is given.
+    """
+    if stats is not None:
+        return stats.decode_frames(stats.count_frames(frames), dbc, values)
+    if values:
+        return pipeline.decode_values(frames, dbc)
+    return pipeline.decode_frames(frames, dbc)
+
+
+def run(dbc_filename, can_filename, verbose, annotation, out=None, jobs=1, cache=True,
+        codes=None, start=None, end=None, messages=None, signals=None,
+        decode_cache=0, changes_only=False, stats=None, json_lines=False, where=None,
+        buses=None):
+
+    selected = codes is not None or start is not None or end is not None or where is not None
+    if jobs > 1 and not selected and not changes_only:
+        return parallel.run(dbc_filename, can_filename, verbose, annotation, jobs, out, cache,
+                            messages, signals, decode_cache, stats, json_lines, buses)
+
+    dbc = load_dbc(dbc_filename, cache, messages, signals, decode_cache, buses, stats)
+
+    frames = select_frames(can_filename, dbc, codes, start, end, load_predicate(dbc, where),
+                           stats)
+    messages = decode_stage(frames, dbc, stats, values=json_lines)
+    if changes_only:
+        messages = pipeline.changes_only(messages)
+    pipeline.select_sink(verbose, annotation, json_lines)(messages, out)
+
+    if stats is not None:
+        stats.stop()
+
+    return True
+
+
+def run_export(dbc_filename, can_filename, export_format, path, cache=True,
+               codes=None, start=None, end=None, messages=None, signals=None,
+               decode_cache=0, stats=None, where=None, buses=None):
+
+    dbc = load_dbc(dbc_filename, cache, messages, signals, decode_cache, buses, stats)
+
+    frames = select_frames(can_filename, dbc, codes, start, end, load_predicate(dbc, where),
+                           stats)
+    with export.WRITERS[export_format](path) as writer:
+        export.export(decode_stage(frames, dbc, stats, values=True), writer,
+                      by_bus=buses is not None)
+
+    if stats is not None:
+        stats.stop()
 
     return True
 
 
+def run_windows(dbc_filename, can_filename, width, step=None, out=None, cache=True,
+                codes=None, start=None, end=None, messages=None, signals=None,
+                decode_cache=0, stats=None, where=None, buses=None):
+
+    dbc = load_dbc(dbc_filename, cache, messages, signals, decode_cache, buses, stats)
+
+    frames = select_frames(can_filename, dbc, codes, start, end, load_predicate(dbc, where),
+                           stats)
+    rows = aggregate.aggregate(decode_stage(frames, dbc, stats, values=True), width, step,
+                               by_bus=buses is not None)
+    aggregate.print_windows(rows, out, by_bus=buses is not None)
+
+    if stats is not None:
+        stats.stop()
+
+    return True
+
+
+def run_follow(dbc_filename, can_filename, verbose, annotation, out=None, cache=True,
+               codes=None, messages=None, signals=None, decode_cache=0, stats=None,
+               json_lines=False, where=None, buses=None, checkpoint=None, poll=False,
+               idle=None):
+    """
+    Decode the candump file as it grows, chunk by chunk, flushing the
+    output after every chunk. With a checkpoint filename the offset of
+    the last decoded line is saved there after each chunk, and a rerun
+    resumes from it.
+    """
+    out = out or sys.stdout
+    dbc = load_dbc(dbc_filename, cache, messages, signals, decode_cache, buses, stats)
+    keep = getattr(dbc, 'codes', None)
+    if codes is not None:
+        keep = set(codes) if keep is None else set(codes) & keep
+    predicate = load_predicate(dbc, where)
+    read = keep
+    if predicate is not None and read is not None:
+        read = set(read) | predicate.codes
+    sink = pipeline.select_sink(verbose, annotation, json_lines)
+    checkpoint = follow.Checkpoint(checkpoint) if checkpoint is not None else None
+    offset = checkpoint.resume(can_filename) if checkpoint is not None else 0
+    watcher = follow.make_watcher(can_filename, poll=poll)
+
+    try:
+        for lines, offset, inode in follow.follow_chunks(can_filename, offset, watcher, idle):
+            if stats is not None:
+                lines = stats.count_lines(lines)
+            frames = pipeline.parse_bytes(lines, read)
+            if predicate is not None:
+                frames = pipeline.filter_predicate(frames, predicate, keep)
+            sink(decode_stage(frames, dbc, stats, values=json_lines), out)
+            out.flush()
+            if checkpoint is not None:
+                checkpoint.save(can_filename, offset, inode)
+    finally:
+        if stats is not None:
+            stats.stop()
+
+    return True
+
+
+VALUE_OPTIONS = {
+    '--jobs': 'jobs',
+    '--output': 'output',
+    '--export': 'export',
+    '--id': 'codes',
+    '--start': 'start',
+    '--end': 'end',
+    '--messages': 'messages',
+    '--signals': 'signals',
+    '--decode-cache': 'decode_cache',
+    '--stats-json': 'stats_json',
+    '--window': 'window',
+    '--step': 'step',
+    '--filter': 'where',
+    '--bus-config': 'bus_config',
+    '--checkpoint': 'checkpoint',
+    '--idle-exit': 'idle',
+}
+
+
+def parse_buses(text, buses=None):
+    """
+    Add the "IFACE=FILE[,IFACE=FILE...]" mapping of a --bus option to
+    buses and return it.
+    """
+    buses = {} if buses is None else buses
+    for item in text.split(','):
+        interface, _, filename = item.partition('=')
+        if not interface or not filename:
+            raise Exception(f'Invalid --bus mapping: {item}')
+        buses[interface.strip()] = filename.strip()
+    return buses
+
+
+def read_bus_config(filename, buses=None):
+    """
+    Add the interface to .dbc file mapping of a config file to buses and
+    return it. Each line is "<interface> = <filename>.dbc", relative file
+    names being taken from the config file's directory; blank lines and
+    lines starting with # are skipped.
+    """
+    buses = {} if buses is None else buses
+    directory = os.path.dirname(filename)
+    with open(filename) as config_fh:
+        for line_n, line in enumerate(config_fh, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            interface, _, dbc_filename = line.partition('=')
+            interface, dbc_filename = interface.strip(), dbc_filename.strip()
+            if not interface or not dbc_filename:
+                raise Exception(f'Invalid bus mapping at {filename}:{line_n}: {line}')
+            buses[interface] = os.path.join(directory, dbc_filename)
+    return buses
+
+
+def parse_args(argv):
+    """
+    Return the dbc filename, candump filename and options given on the
+    command line.
+    """
+    if len(argv) < 3:
+        raise Exception(f'USAGE {argv[0]} <filename>.dbc <candump-ouput> [-v] [-a] [--json]'
+                        ' [--jobs N] [--output FILE] [--no-cache]'
+                        ' [--export csv|npz|parquet --output PATH]'
+                        ' [--id ID[,ID...]] [--start TIME] [--end TIME]'
+                        ' [--messages NAME[,NAME...]] [--signals NAME[,NAME...]]'
+                        ' [--decode-cache N] [--changes-only]'
+                        ' [--stats] [--stats-json FILE] [--window SECONDS [--step SECONDS]]'
+                        ' [--filter EXPRESSION]'
+                        ' [--bus IFACE=FILE[,IFACE=FILE...]] [--bus-config FILE]'
+                        ' [--follow [--checkpoint FILE] [--poll] [--idle-exit SECONDS]]')
+    if not os.path.exists(argv[1]) and argv[1] != '-':
+        raise Exception(f'No such file: {argv[1]}')
+    options = {'verbose': False, 'annotation': False, 'cache': True, 'jobs': 1,
+               'decode_cache': 0, 'changes_only': False, 'stats': False, 'json_lines': False,
+               'follow': False, 'poll': False}
+    options.update({key: None for key in VALUE_OPTIONS.values() if key not in options})
+    bus_mappings = []
+    args = iter(argv[3:])
+    for arg in args:
+        if arg == '-v':
+            options['verbose'] = True
+        elif arg == '-a':
+            options['annotation'] = True
+        elif arg == '--no-cache':
+            options['cache'] = False
+        elif arg == '--changes-only':
+            options['changes_only'] = True
+        elif arg == '--stats':
+            options['stats'] = True
+        elif arg == '--json':
+            options['json_lines'] = True
+        elif arg == '--follow':
+            options['follow'] = True
+        elif arg == '--poll':
+            options['poll'] = True
+        elif arg == '--bus':
+            value = next(args, None)
+            if value is None:
+                raise Exception(f'Missing value for option: {arg}')
+            bus_mappings.append(value)
+        elif arg in VALUE_OPTIONS:
+            value = next(args, None)
+            if value is None:
+                raise Exception(f'Missing value for option: {arg}')
+            options[VALUE_OPTIONS[arg]] = value
+        else:
+            raise Exception(f'Unrecognized option: {arg}')
+    if not options['follow'] and not os.path.exists(argv[2]):
+        raise Exception(f'No such file: {argv[2]}')
+    if options['verbose'] + options['annotation'] + options['json_lines'] > 1:
+        raise Exception('The -v, -a and --json options are mutually exclusive.')
+    if options['changes_only'] and options['json_lines']:
+        raise Exception('The --changes-only option does not apply to --json.')
+    for key in ('window', 'step'):
+        if options[key] is not None:
+            options[key] = float(options[key])
+    if options['step'] is not None and options['window'] is None:
+        raise Exception('The --step option requires --window.')
+    if options['window'] is not None:
+        if options['export'] is not None or options['changes_only'] \
+                or options['verbose'] or options['annotation'] or options['json_lines']:
+            raise Exception('The --window option prints its own rows; it does not combine'
+                            ' with -v, -a, --json, --changes-only or --export.')
+    if options['export'] is not None:
+        if options['export'] not in export.WRITERS:
+            raise Exception(f'Unrecognized export format: {options["export"]}')
+        if options['output'] is None:
+            raise Exception('The --export option requires --output PATH.')
+    options['jobs'] = int(options['jobs'])
+    if options['jobs'] < 1:
+        raise Exception(f'Invalid --jobs value: {options["jobs"]}')
+    options['decode_cache'] = int(options['decode_cache'])
+    if options['decode_cache'] < 0:
+        raise Exception(f'Invalid --decode-cache value: {options["decode_cache"]}')
+    if options['changes_only'] and options['export'] is not None:
+        raise Exception('The --changes-only option does not apply to --export.')
+    if options['codes'] is not None:
+        options['codes'] = [int(code, 0) for code in options['codes'].split(',')]
+    for key in ('start', 'end'):
+        if options[key] is not None:
+            options[key] = float(options[key])
+    if options['messages'] is not None:
+        options['messages'] = [int(name, 0) if name[0].isdigit() else name
+                               for name in options['messages'].split(',')]
+    if options['signals'] is not None:
+        options['signals'] = options['signals'].split(',')
+    if options['idle'] is not None:
+        options['idle'] = float(options['idle'])
+    if not options['follow'] and (options['checkpoint'] is not None or options['poll']
+                                  or options['idle'] is not None):
+        raise Exception('The --checkpoint, --poll and --idle-exit options require --follow.')
+    if options['follow']:
+        if options['export'] is not None or options['window'] is not None \
+                or options['changes_only'] or options['jobs'] > 1 \
+                or options['start'] is not None or options['end'] is not None:
+            raise Exception('The --follow option decodes as lines arrive; it does not combine'
+                            ' with --export, --window, --changes-only, --jobs, --start or --end.')
+    options['buses'] = None
+    if options['bus_config'] is not None:
+        options['buses'] = read_bus_config(options['bus_config'])
+    for value in bus_mappings:
+        options['buses'] = parse_buses(value, options['buses'])
+    dbc_filename = argv[1]
+    if options['buses'] is not None:
+        if options['messages'] is not None or options['signals'] is not None \
+                or options['where'] is not None:
+            raise Exception('The --messages, --signals and --filter options name signals'
+                            ' of one DBC; they do not combine with --bus or --bus-config.')
+        for filename in options['buses'].values():
+            if not os.path.exists(filename):
+                raise Exception(f'No such file: {filename}')
+        if dbc_filename == '-':
+            dbc_filename = None
+    elif dbc_filename == '-':
+        raise Exception('A .dbc file is required without --bus or --bus-config.')
+    return dbc_filename, argv[2], options
+
+
 if __name__ == '__main__':
-    if len(sys.argv) < 3:
-        raise Exception(f'USAGE {sys.argv[0]} <filename>.dbc <candump-ouput> [-v] [-a]')
-    if not os.path.exists(sys.argv[1]):
-        raise Exception(f'No such file: {sys.argv[1]}')
-    if not os.path.exists(sys.argv[2]):
-        raise Exception(f'No such file: {sys.argv[2]}')
-    verbose, annotation = False, False
-    if len(sys.argv) > 3:
-        for argc in range(3, len(sys.argv)):
-            if sys.argv[argc] == '-v':
-                verbose = True
-            elif sys.argv[argc] == '-a':
-                annotation = True
-            else:
-                raise Exception(f'Unrecognized option: {sys.argv[3]}')
-    if verbose and annotation:
-        raise Exception('The -v and -a options are mutually exclusive.')
-    run(sys.argv[1], sys.argv[2], verbose, annotation)
+    dbc_filename, can_filename, options = parse_args(sys.argv)
+    selection = {key: options[key]
+                 for key in ('cache', 'codes', 'start', 'end', 'messages', 'signals',
+                             'decode_cache', 'where', 'buses')}
+    stats = None
+    if options['stats'] or options['stats_json'] is not None or options['decode_cache']:
+        stats = selection['stats'] = run_stats.Stats()
+    if options['follow']:
+        del selection['start'], selection['end']
+        out_fh = open(options['output'], 'a') if options['output'] is not None else sys.stdout
+        try:
+            run_follow(dbc_filename, can_filename, options['verbose'], options['annotation'],
+                       out=out_fh, json_lines=options['json_lines'],
+                       checkpoint=options['checkpoint'], poll=options['poll'],
+                       idle=options['idle'], **selection)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if out_fh is not sys.stdout:
+                out_fh.close()
+    elif options['export'] is not None:
+        run_export(dbc_filename, can_filename, options['export'], options['output'], **selection)
+    elif options['window'] is not None:
+        out_fh = open(options['output'], 'w') if options['output'] is not None else sys.stdout
+        try:
+            run_windows(dbc_filename, can_filename, options['window'], options['step'],
+                        out=out_fh, **selection)
+        finally:
+            if out_fh is not sys.stdout:
+                out_fh.close()
+    elif options['output'] is not None:
+        with open(options['output'], 'w') as out_fh:
+            run(dbc_filename, can_filename, options['verbose'], options['annotation'],
+                out=out_fh, jobs=options['jobs'], changes_only=options['changes_only'],
+                json_lines=options['json_lines'], **selection)
+    else:
+        run(dbc_filename, can_filename, options['verbose'], options['annotation'],
+            jobs=options['jobs'], changes_only=options['changes_only'],
+            json_lines=options['json_lines'], **selection)
+    if options['stats']:
+        print(stats.report(), file=sys.stderr)
+    elif stats is not None and stats.decode_cache is not None:
+        print(stats.decode_cache_report(), file=sys.stderr)
+    if options['stats_json'] is not None:
+        with open(options['stats_json'], 'w') as json_fh:
+            json.dump(stats.as_dict(), json_fh, indent=2)
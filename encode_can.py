@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+This generates a candump log of synthetic traffic for the messages of
+the given .dbc file, for replay and load tests. Every signal follows a
+random walk within its range, is encoded with the DBC's own SG_
+definitions and comes back unchanged, up to its scale, when the log
+is decoded with decode_can.py. Each message is sent --rate times a
+second, and the log uses the "candump -l" layout with timestamps.
+
+    encode_can.py <filename>.dbc <output> [--messages NAME[,NAME...]]
+                  [--frames N] [--rate HZ] [--start TIME]
+                  [--interface NAME] [--seed N]
+"""
+import sys
+from DBC import DBC
+from CAN.writer import format_lines, write_lines
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+FRAMES = 1000
+RATE = 100.0
+WALK_STEPS = 100
+
+
+def signal_range(decoder):
+    """
+    Return the (low, high) physical values the signal can take.
+    """
+    if decoder.clamp:
+        return decoder.min_val, decoder.max_val
+    raws = [0, decoder.mask]
+    if decoder.sign_bit:
+        raws += [decoder.sign_bit - 1, decoder.sign_bit]
+    values = [decoder.physical(raw) for raw in raws]
+    return min(values), max(values)
+
+
+def random_walk(rng, low, high, frame_n):
+    """
+    Return frame_n values walking from a random start within low..high
+    in steps of about 1/WALK_STEPS of the range.
+    """
+    start = rng.uniform(low, high)
+    steps = rng.normal(0, (high - low) / WALK_STEPS, frame_n)
+    steps[0] = 0
+    return numpy.clip(start + numpy.cumsum(steps), low, high)
+
+
+def generate(dbc, messages=None, frame_n=FRAMES, rate=RATE, start=0.0, seed=None):
+    """
+    Return the (timestamps, codes, payloads) arrays of frame_n frames of
+    each message, by name or id (all of them when messages is None),
+    in timestamp order. payloads is a list of bytes.
+    """
+    if numpy is None:
+        raise Exception('encode_can.py requires numpy')
+    if messages is None:
+        messages = sorted(dbc.indexes.get(dbc.BO_, {}))
+    rng = numpy.random.default_rng(seed)
+    timestamps, codes, payloads = [], [], []
+    for index, message in enumerate(messages):
+        encoder = dbc.encoder(message)
+        columns = {signal.name: random_walk(rng, *signal_range(signal.decoder), frame_n)
+                   for signal in encoder.signals}
+        phase = index / (rate * len(messages))
+        timestamps.append(start + phase + numpy.arange(frame_n) / rate)
+        codes.append(numpy.full(frame_n, encoder.code, dtype=numpy.int64))
+        matrix = encoder.encode_batch(columns) if columns \
+            else numpy.zeros((frame_n, encoder.byte_n), dtype=numpy.uint8)
+        data, width = matrix.tobytes(), encoder.byte_n
+        payloads.extend(data[row:row + width] for row in range(0, len(data), width))
+    timestamps = numpy.concatenate(timestamps) if timestamps else numpy.zeros(0)
+    codes = numpy.concatenate(codes) if codes else numpy.zeros(0, dtype=numpy.int64)
+    order = numpy.argsort(timestamps, kind='stable')
+    return timestamps[order], codes[order], [payloads[row] for row in order.tolist()]
+
+
+def run(dbc_filename, out_filename, messages=None, frame_n=FRAMES, rate=RATE, start=0.0,
+        interface='can0', seed=None):
+    dbc = DBC.load(dbc_filename)
+    timestamps, codes, payloads = generate(dbc, messages, frame_n, rate, start, seed)
+    with open(out_filename, 'w') as out_fh:
+        return write_lines(format_lines(codes, payloads, timestamps, interface), out_fh)
+
+
+def parse_args(argv):
+    """
+    Return the dbc filename, output filename and options given on the
+    command line.
+    """
+    if len(argv) < 3:
+        raise Exception(f'USAGE {argv[0]} <filename>.dbc <output> [--messages NAME[,NAME...]]'
+                        ' [--frames N] [--rate HZ] [--start TIME] [--interface NAME]'
+                        ' [--seed N]')
+    options = {'messages': None, 'frame_n': FRAMES, 'rate': RATE, 'start': 0.0,
+               'interface': 'can0', 'seed': None}
+    keys = {'--messages': 'messages', '--frames': 'frame_n', '--rate': 'rate',
+            '--start': 'start', '--interface': 'interface', '--seed': 'seed'}
+    args = iter(argv[3:])
+    for arg in args:
+        if arg not in keys:
+            raise Exception(f'Unrecognized option: {arg}')
+        value = next(args, None)
+        if value is None:
+            raise Exception(f'Missing value for option: {arg}')
+        options[keys[arg]] = value
+    if options['messages'] is not None:
+        options['messages'] = [int(name, 0) if name[0].isdigit() else name
+                               for name in options['messages'].split(',')]
+    options['frame_n'] = int(options['frame_n'])
+    options['rate'] = float(options['rate'])
+    options['start'] = float(options['start'])
+    if options['seed'] is not None:
+        options['seed'] = int(options['seed'])
+    if options['frame_n'] < 1 or options['rate'] <= 0:
+        raise Exception('The --frames and --rate values must be positive.')
+    return argv[1], argv[2], options
+
+
+if __name__ == '__main__':
+    dbc_filename, out_filename, options = parse_args(sys.argv)
+    run(dbc_filename, out_filename, **options)
@@ -0,0 +1,211 @@
+"""
+Columnar export of decoded signals. Every signal becomes its own time
+series of (time, value) rows, buffered per signal in fixed-size chunks
+and written out whenever a chunk fills up. The rows buffered over all
+signals are bounded too, so memory stays bounded no matter how long
+the log is or how many signals the DBC has. The time is the candump
+timestamp when the log has one, otherwise the frame number.
+
+    CSV      a directory with one <message>.<signal>.csv per signal
+    NPZ      one .npz file with <message>.<signal>.time/.value arrays
+    Parquet  a directory with one <message>.<signal>.parquet per signal
+             (requires pyarrow)
+"""
+import os
+import re
+import sys
+import shutil
+import struct
+import tempfile
+import zipfile
+from array import array
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+CHUNK_SIZE = 65536
+BUFFER_ROWS = 1024 * 1024
+
+
+def column_name(message_name, signal_name):
+    """
+    Return the file-system safe name of a signal's series.
+    """
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', f'{message_name}.{signal_name}')
+
+
+class ColumnWriter:
+    """
+    Buffers (time, value) rows per signal and hands full chunks to
+    write_chunk(), which the format classes implement. Once buffer_rows
+    rows are buffered over all signals, the largest buffers are written
+    out until at most half of that is left.
+    """
+    def __init__(self, path, chunk_size=CHUNK_SIZE, buffer_rows=BUFFER_ROWS):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.buffer_rows = buffer_rows
+        self.buffered = 0
+        self.buffers = {}
+
+    def add(self, name, time, value):
+        buffer = self.buffers.get(name)
+        if buffer is None:
+            buffer = self.buffers[name] = (array('d'), array('d'))
+        buffer[0].append(time)
+        buffer[1].append(value)
+        self.buffered += 1
+        if len(buffer[0]) >= self.chunk_size:
+            self.flush(name)
+        elif self.buffered >= self.buffer_rows:
+            self.flush_largest()
+
+    def flush(self, name):
+        times, values = self.buffers[name]
+        if len(times) > 0:
+            self.write_chunk(name, times, values)
+            self.buffers[name] = (array('d'), array('d'))
+            self.buffered -= len(times)
+
+    def flush_largest(self):
+        """
+        Write out the largest buffers until at most half of buffer_rows
+        rows are left.
+        """
+        sizes = sorted(((len(times), name) for name, (times, _) in self.buffers.items()),
+                       reverse=True)
+        for _, name in sizes:
+            if self.buffered <= self.buffer_rows // 2:
+                break
+            self.flush(name)
+
+    def close(self):
+        for name in list(self.buffers):
+            self.flush(name)
+
+    def write_chunk(self, name, times, values):
+        raise Exception(f'{__class__.__name__} does not write a format')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class CSVWriter(ColumnWriter):
+    def __init__(self, path, chunk_size=CHUNK_SIZE, buffer_rows=BUFFER_ROWS):
+        super().__init__(path, chunk_size, buffer_rows)
+        os.makedirs(path, exist_ok=True)
+        self.started = set()
+
+    def write_chunk(self, name, times, values):
+        filename = os.path.join(self.path, f'{name}.csv')
+        mode = 'a' if name in self.started else 'w'
+        with open(filename, mode) as csv_fh:
+            if mode == 'w':
+                csv_fh.write('time,value\n')
+            csv_fh.write(''.join([f'{t!r},{v!r}\n' for t, v in zip(times, values)]))
+        self.started.add(name)
+
+
+class NPZWriter(ColumnWriter):
+    """
+    Writes a NumPy .npz archive without needing NumPy: chunks are
+    appended to raw scratch files and wrapped in .npy headers on close.
+    """
+    def __init__(self, path, chunk_size=CHUNK_SIZE, buffer_rows=BUFFER_ROWS):
+        super().__init__(path, chunk_size, buffer_rows)
+        self.scratch_dir = tempfile.mkdtemp(prefix='can-decode-')
+        self.counts = {}
+
+    def write_chunk(self, name, times, values):
+        for suffix, column in (('time', times), ('value', values)):
+            if sys.byteorder != 'little':
+                column = array('d', column)
+                column.byteswap()
+            with open(os.path.join(self.scratch_dir, f'{name}.{suffix}'), 'ab') as raw_fh:
+                column.tofile(raw_fh)
+        self.counts[name] = self.counts.get(name, 0) + len(times)
+
+    def close(self):
+        super().close()
+        try:
+            with zipfile.ZipFile(self.path, 'w', zipfile.ZIP_STORED, allowZip64=True) as npz:
+                for name in sorted(self.counts):
+                    for suffix in ('time', 'value'):
+                        with npz.open(f'{name}.{suffix}.npy', 'w', force_zip64=True) as npy_fh:
+                            npy_fh.write(npy_header(self.counts[name]))
+                            raw_filename = os.path.join(self.scratch_dir, f'{name}.{suffix}')
+                            with open(raw_filename, 'rb') as raw_fh:
+                                shutil.copyfileobj(raw_fh, npy_fh)
+        finally:
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+
+def npy_header(length):
+    """
+    Return the .npy version 1.0 header of a little-endian float64 vector.
+    """
+    header = f"{{'descr': '<f8', 'fortran_order': False, 'shape': ({length},), }}"
+    header += ' ' * (63 - (10 + len(header)) % 64) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+class ParquetWriter(ColumnWriter):
+    def __init__(self, path, chunk_size=CHUNK_SIZE, buffer_rows=BUFFER_ROWS):
+        if pyarrow is None:
+            raise Exception('Parquet export requires pyarrow')
+        super().__init__(path, chunk_size, buffer_rows)
+        os.makedirs(path, exist_ok=True)
+        self.schema = pyarrow.schema([('time', pyarrow.float64()), ('value', pyarrow.float64())])
+        self.writers = {}
+
+    def write_chunk(self, name, times, values):
+        writer = self.writers.get(name)
+        if writer is None:
+            filename = os.path.join(self.path, f'{name}.parquet')
+            writer = self.writers[name] = pyarrow.parquet.ParquetWriter(filename, self.schema)
+        table = pyarrow.Table.from_arrays([pyarrow.array(times, pyarrow.float64()),
+                                           pyarrow.array(values, pyarrow.float64())],
+                                          schema=self.schema)
+        writer.write_table(table)
+
+    def close(self):
+        super().close()
+        for writer in self.writers.values():
+            writer.close()
+
+
+WRITERS = {
+    'csv': CSVWriter,
+    'npz': NPZWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def export(decoded, writer, by_bus=False):
+    """
+    Feed the (line, event, decoded) items of pipeline.decode_values()
+    to the writer, one row per signal. With by_bus, the frames of a
+    BusRouter, the series are named <interface>.<message>.<signal>.
+    """
+    names = {}
+    for index, (_, event, values) in enumerate(decoded):
+        if values is None:
+            continue
+        time = getattr(event, 'timestamp', None)
+        if time is None:
+            time = index
+        key = (event.interface, values.decoder) if by_bus else values.decoder
+        columns = names.get(key)
+        if columns is None:
+            message_name = f'{event.interface}.{values.name}' if by_bus else values.name
+            columns = names[key] = [column_name(message_name, signal_name)
+                                    for signal_name in values.decoder.names]
+        for name, value in zip(columns, values.values):
+            writer.add(name, time, value)
+    return writer
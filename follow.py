@@ -0,0 +1,239 @@
+"""
+Tailing of a growing candump file, as written by "candump -l". New
+complete lines are handed out in chunks together with the byte offset
+just past them; the offset is stored in a checkpoint file once a chunk
+has been decoded and written, so a restarted decoder resumes from the
+last line it finished:
+
+    checkpoint = Checkpoint('candump.log.ckpt')
+    offset = checkpoint.resume('candump.log')
+    for lines, offset, inode in follow_chunks('candump.log', offset):
+        ...
+        checkpoint.save('candump.log', offset, inode)
+
+The file is watched with inotify on Linux and polled elsewhere. When
+it is renamed away and a new file takes its name (log rotation), the
+rest of the old file is read before the new one is followed from its
+start; when it shrinks (truncation) it is read again from the start.
+"""
+import os
+import sys
+import json
+import time
+import select
+import ctypes
+import ctypes.util
+
+POLL_INTERVAL = 0.5
+READ_SIZE = 1024 * 1024
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO \
+    | IN_CREATE | IN_DELETE
+
+
+class PollWatcher:
+    """
+    Waits a fixed interval between looks at the file.
+    """
+    def __init__(self, filename, interval=POLL_INTERVAL):
+        self.interval = interval
+
+    def wait(self, timeout=None):
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Waits for inotify events on the directory of the file, which also
+    reports the creation and renames that come with log rotation. The
+    events only wake the reader up, so they are drained, not parsed.
+    The wait is still bounded by interval in case an event is missed.
+    """
+    def __init__(self, filename, interval=POLL_INTERVAL, libc=None):
+        self.interval = interval
+        self.libc = libc or load_libc()
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        directory = os.path.dirname(os.path.abspath(filename))
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'inotify_add_watch failed: {directory}')
+
+    def wait(self, timeout=None):
+        timeout = self.interval if timeout is None else min(timeout, self.interval)
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+def load_libc():
+    """
+    Return the C library, or None when it has no inotify.
+    """
+    name = ctypes.util.find_library('c')
+    if name is None:
+        return None
+    libc = ctypes.CDLL(name, use_errno=True)
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+    return libc
+
+
+def make_watcher(filename, interval=POLL_INTERVAL, poll=False):
+    """
+    Return an InotifyWatcher of the file, or a PollWatcher when poll is
+    set or inotify is not available.
+    """
+    if not poll:
+        try:
+            if load_libc() is not None:
+                return InotifyWatcher(filename, interval)
+        except OSError:
+            pass
+    return PollWatcher(filename, interval)
+
+
+class Checkpoint:
+    """
+    The byte offset reached in a candump file, with the file's inode so
+    that a checkpoint of a file since rotated away is not applied to its
+    successor. Saving replaces the checkpoint file atomically.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """
+        Return the saved {'filename', 'inode', 'offset'} dict, or None
+        when there is none. A checkpoint that cannot be read or lacks
+        the inode or offset is reported on stderr and taken as none.
+        """
+        try:
+            with open(self.path) as checkpoint_fh:
+                state = json.load(checkpoint_fh)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as exc:
+            print(f'Ignoring unreadable checkpoint {self.path}: {exc}', file=sys.stderr)
+            return None
+        if not isinstance(state, dict) or not isinstance(state.get('inode'), int) \
+                or not isinstance(state.get('offset'), int) or state['offset'] < 0:
+            print(f'Ignoring invalid checkpoint {self.path}: {state!r}', file=sys.stderr)
+            return None
+        return state
+
+    def resume(self, filename):
+        """
+        Return the offset to resume the file from: the saved one when it
+        is of this very file and no larger than it, else 0.
+        """
+        state = self.load()
+        if state is None:
+            return 0
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            return 0
+        if state['inode'] != stat.st_ino or state['offset'] > stat.st_size:
+            return 0
+        return state['offset']
+
+    def save(self, filename, offset, inode=None):
+        """
+        Write the checkpoint to a temporary file, sync it to disk and
+        rename it over the old one, so a crash leaves either checkpoint.
+        """
+        if inode is None:
+            inode = os.stat(filename).st_ino
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as checkpoint_fh:
+            json.dump({'filename': filename, 'inode': inode, 'offset': offset}, checkpoint_fh)
+            checkpoint_fh.flush()
+            os.fsync(checkpoint_fh.fileno())
+        os.replace(temp_path, self.path)
+
+
+def follow_chunks(filename, offset=0, watcher=None, idle=None, read_size=READ_SIZE):
+    """
+    Yield (lines, offset, inode) for the complete lines appended to the
+    file from offset on, lines being a list of bytes and offset the
+    position just past the last of them in the file of that inode. A
+    line still being written is held back until its newline arrives.
+    The generator waits for more data forever, or returns once idle
+    seconds pass without any when idle is given. It closes the watcher.
+    """
+    watcher = watcher or make_watcher(filename)
+    can_fh = None
+    waited = 0.0
+    try:
+        while can_fh is None:
+            try:
+                can_fh = open(filename, 'rb')
+            except FileNotFoundError:
+                if idle is not None and waited >= idle:
+                    return
+                start = time.monotonic()
+                watcher.wait(None if idle is None else idle - waited)
+                waited += time.monotonic() - start
+        inode = os.fstat(can_fh.fileno()).st_ino
+        if offset > os.fstat(can_fh.fileno()).st_size:
+            offset = 0
+        can_fh.seek(offset)
+        pending = b''
+        waited = 0.0
+        while True:
+            data = can_fh.read(read_size)
+            if data:
+                waited = 0.0
+                data = pending + data
+                end = data.rfind(b'\n') + 1
+                pending = data[end:]
+                offset += end
+                if end:
+                    yield data[:end].splitlines(keepends=True), offset, inode
+                continue
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                stat = None
+            if stat is not None and stat.st_ino != inode:
+                data = pending + can_fh.read()
+                if data:
+                    offset += len(data)
+                    yield data.splitlines(keepends=True), offset, inode
+                can_fh.close()
+                can_fh = open(filename, 'rb')
+                inode = os.fstat(can_fh.fileno()).st_ino
+                offset, pending = 0, b''
+                continue
+            if stat is not None and stat.st_size < offset + len(pending):
+                can_fh.seek(0)
+                offset, pending = 0, b''
+                continue
+            if idle is not None and waited >= idle:
+                return
+            start = time.monotonic()
+            watcher.wait(None if idle is None else idle - waited)
+            waited += time.monotonic() - start
+    finally:
+        if can_fh is not None:
+            can_fh.close()
+        watcher.close()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Decoding of a live candump feed with asyncio. Lines are read from
+stdin, a pipe, or a TCP/UDP socket carrying candump lines or the
+socketcand "< frame id seconds.useconds data >" text stream, decoded
+with the DBC as they arrive and handed to async consumers through
+bounded queues:
+
+    queue = LiveQueue(1024, 'drop-oldest')
+    task = asyncio.create_task(decode_stream(tcp_lines(host, port), dbc, queue))
+    async for line, event, message in queue:
+        ...
+
+A full queue either blocks the reader ('block'), discards its oldest
+item ('drop-oldest') or only lets every Nth new item in ('sample').
+
+    live.py <filename>.dbc [-|--tcp HOST:PORT|--udp HOST:PORT] [-v] [-a]
+            [--channel NAME] [--queue N] [--policy block|drop-oldest|sample]
+"""
+import sys
+import asyncio
+from DBC import DBC
+from CAN.reader import Frame, parse_line
+import pipeline
+
+POLICIES = ('block', 'drop-oldest', 'sample')
+QUEUE_SIZE = 1024
+SAMPLE_N = 10
+READ_SIZE = 65536
+
+
+class LiveQueue:
+    """
+    A bounded asyncio queue with an overflow policy. Iterating it with
+    "async for" yields items until the producer closes it. dropped
+    counts the items the policy discarded.
+    """
+    END = object()
+
+    def __init__(self, maxsize=QUEUE_SIZE, policy='block', sample_n=SAMPLE_N):
+        if policy not in POLICIES:
+            raise Exception(f'Unrecognized queue policy: {policy}')
+        if maxsize < 1:
+            raise Exception(f'Invalid queue size: {maxsize}')
+        self.queue = asyncio.Queue(maxsize)
+        self.policy = policy
+        self.sample_n = sample_n
+        self.dropped = 0
+        self.overflow_n = 0
+
+    async def put(self, item):
+        if self.policy == 'block':
+            await self.queue.put(item)
+        else:
+            self.put_nowait(item)
+
+    def put_nowait(self, item):
+        """
+        Put the item without waiting for room. When the queue is full
+        the policy applies, except that block cannot wait and drops the
+        item instead.
+        """
+        queue = self.queue
+        if not queue.full():
+            queue.put_nowait(item)
+        elif self.policy == 'block':
+            self.dropped += 1
+        elif self.policy == 'drop-oldest':
+            self.replace_oldest(item)
+        else:
+            self.overflow_n += 1
+            if self.overflow_n % self.sample_n == 0:
+                self.replace_oldest(item)
+            else:
+                self.dropped += 1
+
+    def replace_oldest(self, item):
+        self.queue.get_nowait()
+        self.dropped += 1
+        self.queue.put_nowait(item)
+
+    async def close(self):
+        """
+        Mark the end of the stream, after the items already queued.
+        """
+        if self.policy == 'block' or not self.queue.full():
+            await self.queue.put(self.END)
+        else:
+            self.replace_oldest(self.END)
+
+    def close_nowait(self):
+        """
+        Mark the end of the stream without waiting for room, dropping
+        the oldest item when the queue is full, whatever the policy.
+        """
+        if self.queue.full():
+            self.replace_oldest(self.END)
+        else:
+            self.queue.put_nowait(self.END)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self.queue.get()
+        if item is self.END:
+            raise StopAsyncIteration
+        return item
+
+
+def split_records(buffer):
+    """
+    Return the complete records at the front of the buffer, and the
+    incomplete rest. A record is a newline terminated candump line or
+    a socketcand "< ... >" element, which need not end with a newline.
+    """
+    records, start, size = [], 0, len(buffer)
+    while start < size:
+        while start < size and buffer[start] in b' \t\r\n':
+            start += 1
+        if start == size:
+            break
+        end = buffer.find(b'>' if buffer[start] == 0x3C else b'\n', start)
+        if end < 0:
+            break
+        records.append(buffer[start:end + 1])
+        start = end + 1
+    return records, buffer[start:]
+
+
+def parse_socketcand(record, interface='can0'):
+    """
+    Parse a socketcand "< frame 123 23.424242 11223344 >" element into a
+    Frame. Other elements ("< hi >", "< ok >", ...) return None.
+    """
+    tokens = record.split()
+    if len(tokens) < 4 or tokens[1] != b'frame':
+        return None
+    payload = bytes.fromhex(b''.join(tokens[4:-1]).decode())
+    return Frame(float(tokens[3]), interface, int(tokens[2], 16), len(payload), payload)
+
+
+def parse_record(record, codes=None, interface='can0'):
+    """
+    Return the Frame of a candump line or socketcand element given as
+    bytes, or None when it holds no frame or its id is not in codes.
+    """
+    if record.lstrip()[0:1] == b'<':
+        frame = parse_socketcand(record, interface)
+        if frame is None or (codes is not None and frame.code not in codes):
+            return None
+        return frame
+    return parse_line(record, codes)
+
+
+async def reader_lines(reader):
+    """
+    Yield the records read from an asyncio StreamReader.
+    """
+    buffer = b''
+    while True:
+        data = await reader.read(READ_SIZE)
+        if not data:
+            break
+        records, buffer = split_records(buffer + data)
+        for record in records:
+            yield record
+    if buffer.strip():
+        yield buffer
+
+
+async def pipe_lines(pipe=None):
+    """
+    Yield the records of a pipe or file object, stdin by default.
+    Regular files cannot be polled by the event loop, so they are read
+    in a worker thread instead.
+    """
+    pipe = pipe or sys.stdin.buffer
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    try:
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    except ValueError:
+        while True:
+            line = await asyncio.to_thread(pipe.readline)
+            if not line:
+                break
+            yield line
+        return
+    async for record in reader_lines(reader):
+        yield record
+
+
+async def tcp_lines(host, port, channel=None):
+    """
+    Yield the records of a TCP stream. With channel, the server is
+    taken to be socketcand and is asked to open it in raw mode.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        if channel is not None:
+            writer.write(f'< open {channel} >< rawmode >'.encode())
+            await writer.drain()
+        async for record in reader_lines(reader):
+            yield record
+    finally:
+        writer.close()
+
+
+class DatagramQueue(asyncio.DatagramProtocol):
+    """
+    Passes the records of received datagrams to a LiveQueue. A sender
+    cannot be made to wait, so a full queue applies its policy at once.
+    """
+    def __init__(self, queue):
+        self.queue = queue
+
+    def datagram_received(self, data, addr):
+        for record in split_records(data + b'\n')[0]:
+            self.queue.put_nowait(record)
+
+    def connection_lost(self, exc):
+        self.queue.close_nowait()
+
+
+async def udp_lines(host, port, ready=None, queue=None):
+    """
+    Yield the records of the datagrams sent to host:port. ready, when
+    given, is an asyncio.Future set to the bound (host, port). The
+    records wait in queue, a LiveQueue, until they are taken; records
+    that arrive while it is full are dropped by its policy.
+    """
+    loop = asyncio.get_running_loop()
+    queue = queue or LiveQueue()
+    transport, _ = await loop.create_datagram_endpoint(lambda: DatagramQueue(queue),
+                                                       local_addr=(host, port))
+    if ready is not None:
+        ready.set_result(transport.get_extra_info('sockname')[0:2])
+    try:
+        async for record in queue:
+            yield record
+    finally:
+        transport.close()
+
+
+async def decode_stream(lines, dbc, *queues, values=False, interface='can0'):
+    """
+    Decode the records of an async line source and put (line, event,
+    message) on every queue, the same items pipeline.decode_frames()
+    yields, or those of pipeline.decode_values() when values is set.
+    The queues are closed when the source ends. When the stream is
+    cancelled or fails they are closed without waiting, since nothing
+    may be left to make room in a full queue.
+    """
+    codes = getattr(dbc, 'codes', None)
+    decode = dbc.decode if values else dbc.annotate
+    try:
+        async for record in lines:
+            frame = parse_record(record, codes, interface)
+            if frame is None:
+                continue
+            item = (record.decode(), frame, decode(frame))
+            for queue in queues:
+                await queue.put(item)
+    except BaseException:
+        for queue in queues:
+            queue.close_nowait()
+        raise
+    for queue in queues:
+        await queue.close()
+
+
+async def print_stream(queue, sink, out=None):
+    """
+    Print the items of the queue with one of the pipeline sinks.
+    """
+    out = out or sys.stdout
+    async for item in queue:
+        sink([item], out)
+        out.flush()
+
+
+async def run(dbc_filename, source, verbose, annotation, channel=None,
+              maxsize=QUEUE_SIZE, policy='block'):
+
+    dbc = DBC.load(dbc_filename)
+
+    queue = LiveQueue(maxsize, policy)
+    received = LiveQueue(maxsize, policy)
+    if source[0] == 'tcp':
+        lines = tcp_lines(source[1], source[2], channel)
+    elif source[0] == 'udp':
+        lines = udp_lines(source[1], source[2], queue=received)
+    else:
+        lines = pipe_lines()
+
+    printer = asyncio.create_task(print_stream(queue, pipeline.select_sink(verbose, annotation)))
+    await decode_stream(lines, dbc, queue, interface=channel or 'can0')
+    await printer
+    dropped = queue.dropped + received.dropped
+    if dropped > 0:
+        print(f'{dropped} frames dropped', file=sys.stderr)
+
+    return True
+
+
+def parse_args(argv):
+    """
+    Return the dbc filename, the source and options given on the command line.
+    """
+    if len(argv) < 2:
+        raise Exception(f'USAGE {argv[0]} <filename>.dbc [-|--tcp HOST:PORT|--udp HOST:PORT]'
+                        ' [-v] [-a] [--channel NAME] [--queue N]'
+                        ' [--policy block|drop-oldest|sample]')
+    source = ('pipe',)
+    options = {'verbose': False, 'annotation': False, 'channel': None,
+               'maxsize': QUEUE_SIZE, 'policy': 'block'}
+    args = iter(argv[2:])
+    for arg in args:
+        if arg == '-':
+            source = ('pipe',)
+        elif arg == '-v':
+            options['verbose'] = True
+        elif arg == '-a':
+            options['annotation'] = True
+        elif arg in ('--tcp', '--udp', '--channel', '--queue', '--policy'):
+            value = next(args, None)
+            if value is None:
+                raise Exception(f'Missing value for option: {arg}')
+            if arg in ('--tcp', '--udp'):
+                host, _, port = value.rpartition(':')
+                source = (arg[2:], host or '127.0.0.1', int(port))
+            elif arg == '--queue':
+                options['maxsize'] = int(value)
+                if options['maxsize'] < 1:
+                    raise Exception(f'Invalid --queue value: {value}')
+            else:
+                options[arg[2:]] = value
+        else:
+            raise Exception(f'Unrecognized option: {arg}')
+    if options['verbose'] and options['annotation']:
+        raise Exception('The -v and -a options are mutually exclusive.')
+    if options['policy'] not in POLICIES:
+        raise Exception(f'Unrecognized queue policy: {options["policy"]}')
+    return argv[1], source, options
+
+
+if __name__ == '__main__':
+    dbc_filename, source, options = parse_args(sys.argv)
+    asyncio.run(run(dbc_filename, source, options['verbose'], options['annotation'],
+                    options['channel'], options['maxsize'], options['policy']))
@@ -0,0 +1,128 @@
+"""
+Decode a candump file on several cores. The file is cut into
+line-aligned byte ranges, each range is decoded and formatted by a
+worker process holding its own parsed DBC, and the formatted text is
+written back in the original order, so the output matches a serial run
+byte for byte.
+"""
+import io
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from DBC import DBC, BusRouter
+import pipeline
+import stats as run_stats
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+worker_dbc = None
+worker_codes = None
+worker_load_time = 0.0
+
+
+def split_ranges(can_filename, chunk_n):
+    """
+    Return up to chunk_n (start, end) byte ranges covering the file,
+    each ending just after a newline.
+    """
+    size = os.path.getsize(can_filename)
+    bounds = [0]
+    with open(can_filename, 'rb') as can_fh:
+        for i in range(1, chunk_n):
+            offset = max(size * i // chunk_n, bounds[-1])
+            if offset > 0:
+                can_fh.seek(offset - 1)
+                can_fh.readline()
+            offset = can_fh.tell()
+            if offset >= size:
+                break
+            if offset > bounds[-1]:
+                bounds.append(offset)
+    bounds.append(size)
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)
+            if bounds[i + 1] > bounds[i]]
+
+
+def init_worker(dbc_filename, cache, messages=None, signals=None, decode_cache=0,
+                buses=None):
+    """
+    Load the DBC, or the BusRouter of the buses, and compile the
+    projection if any, once per worker.
+    """
+    global worker_dbc, worker_codes, worker_load_time
+    started = time.perf_counter()
+    if buses is not None:
+        worker_dbc = BusRouter.load(buses, dbc_filename, cache)
+    else:
+        worker_dbc = DBC.load(dbc_filename) if cache else DBC(dbc_filename)
+    if messages is not None or signals is not None:
+        worker_dbc = worker_dbc.plan(messages, signals)
+        worker_codes = worker_dbc.codes
+    if decode_cache > 0:
+        worker_dbc = worker_dbc.memoize(decode_cache)
+    worker_load_time = time.perf_counter() - started
+
+
+def decode_range(can_filename, start, end, verbose, annotation, with_stats=False,
+                 json_lines=False):
+    """
+    Decode the lines in the byte range and return the formatted output,
+    and the chunk's stats.Stats when with_stats is set. The stats of the
+    first chunk of a worker carry its DBC load time.
+    """
+    global worker_load_time
+    with open(can_filename, 'rb') as can_fh:
+        can_fh.seek(start)
+        data = can_fh.read(end - start)
+    lines = io.BytesIO(data)
+    if with_stats:
+        stats = run_stats.Stats()
+        frames = pipeline.parse_bytes(stats.count_lines(lines), worker_codes)
+        messages = stats.decode_frames(stats.count_frames(frames), worker_dbc, json_lines)
+    elif json_lines:
+        messages = pipeline.decode_values(pipeline.parse_bytes(lines, worker_codes), worker_dbc)
+    else:
+        messages = pipeline.decode_frames(pipeline.parse_bytes(lines, worker_codes), worker_dbc)
+    out = io.StringIO()
+    pipeline.select_sink(verbose, annotation, json_lines)(messages, out)
+    if with_stats:
+        stats.stop()
+        stats.times['load'], worker_load_time = worker_load_time, 0.0
+        return out.getvalue(), stats
+    return out.getvalue()
+
+
+def run(dbc_filename, can_filename, verbose, annotation, jobs, out=None, cache=True,
+        messages=None, signals=None, decode_cache=0, stats=None, json_lines=False,
+        buses=None):
+    """
+    Decode the candump file with a pool of jobs worker processes.
+    At most two chunks per worker are in flight, which bounds the
+    memory held by results waiting for their turn to be written.
+    The stats of every chunk are merged into stats when given, so
+    its stage times add up the workers' time.
+    """
+    out = out or sys.stdout
+    chunk_n = max(jobs * 4, os.path.getsize(can_filename) // CHUNK_SIZE)
+    ranges = deque(split_ranges(can_filename, chunk_n))
+    pending = deque()
+    with ProcessPoolExecutor(jobs, initializer=init_worker,
+                             initargs=(dbc_filename, cache, messages, signals,
+                                       decode_cache, buses)) as executor:
+        while ranges or pending:
+            while ranges and len(pending) < jobs * 2:
+                start, end = ranges.popleft()
+                pending.append(executor.submit(decode_range, can_filename, start, end,
+                                               verbose, annotation, stats is not None,
+                                               json_lines))
+            result = pending.popleft().result()
+            if stats is not None:
+                result, chunk_stats = result
+                stats.merge(chunk_stats)
+            out.write(result)
+    if stats is not None:
+        stats.workers = jobs
+        stats.elapsed = time.perf_counter() - stats.started
+    return True
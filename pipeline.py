@@ -0,0 +1,261 @@
+"""
+Generator stages for decoding candump logs. Each stage takes the
+iterator produced by the previous one, so a log of any size is
+decoded one line at a time:
+
+    frames = map_frames('candump.log')
+    messages = decode_frames(frames, dbc)
+    for message, field_name, field in iter_signals(messages):
+        ...
+
+The sinks at the bottom are the output modes of decode_can.py. They
+build each line from text cached per signal and write the output in
+blocks of BUFFER_LINES lines.
+"""
+import sys
+import json
+from CAN import CAN
+from CAN.reader import map_lines, parse_line, frame_text
+
+BUFFER_LINES = 4096
+
+
+def read_lines(filename):
+    """
+    Yield the lines of the candump file.
+    """
+    with open(filename, 'r') as can_fh:
+        for line in can_fh:
+            yield line
+
+
+def parse_frames(lines):
+    """
+    Yield (line, event) for every candump line.
+    """
+    for line in lines:
+        yield line, CAN(line)
+
+
+def parse_bytes(lines, codes=None):
+    """
+    Yield (line, frame) for every non-blank candump line given as bytes,
+    dropping lines whose id is not in codes before their payload is read.
+    """
+    for line in lines:
+        frame = parse_line(line, codes)
+        if frame is not None:
+            yield line.decode(), frame
+
+
+def map_frames(filename, codes=None):
+    """
+    Yield (line, frame) for the candump file, read through a memory map.
+    """
+    return parse_bytes(map_lines(filename), codes)
+
+
+def filter_ids(frames, codes):
+    """
+    Yield only the (line, event) pairs whose message id is in codes.
+    """
+    codes = set(codes)
+    for line, event in frames:
+        if event.code in codes:
+            yield line, event
+
+
+def filter_predicate(frames, predicate, codes=None):
+    """
+    Yield the (line, event) pairs seen while the DBC.Predicate holds,
+    feeding it every frame and only yielding ids in codes when given.
+    """
+    update = predicate.update
+    for line, event in frames:
+        if update(event) and (codes is None or event.code in codes):
+            yield line, event
+
+
+def decode_frames(frames, dbc):
+    """
+    Yield (line, event, message) where message is the annotate()
+    result, or None when the DBC does not define the id.
+    """
+    for line, event in frames:
+        yield line, event, dbc.annotate(event)
+
+
+def decode_values(frames, dbc):
+    """
+    Yield (line, event, decoded) where decoded is the numeric
+    DBC.decode() result, or None when the DBC does not define the id.
+    """
+    for line, event in frames:
+        yield line, event, dbc.decode(event)
+
+
+def changes_only(messages):
+    """
+    Yield (line, event, message) keeping only the signals whose value
+    differs from the previous frame of the same id, and dropping the
+    frames where nothing changed. Undecoded frames pass through. The
+    frames of a BusRouter are compared per bus.
+    """
+    last = {}
+    for line, event, message in messages:
+        if message is None:
+            yield line, event, message
+            continue
+        key = (message.get('bus'), message['code'])
+        previous = last.get(key)
+        last[key] = message
+        if previous is None:
+            yield line, event, message
+            continue
+        if previous is message:
+            continue
+        previous_fields = previous['fields']
+        fields = {}
+        for field_name, field in message['fields'].items():
+            previous_field = previous_fields.get(field_name)
+            if previous_field is None or previous_field['value'] != field['value']:
+                fields[field_name] = field
+        if fields:
+            yield line, event, dict(message, fields=fields)
+
+
+def iter_signals(messages):
+    """
+    Yield (message, field_name, field) for every decoded signal.
+    """
+    for _, _, message in messages:
+        if message is None:
+            continue
+        for field_name, field in message['fields'].items():
+            yield message, field_name, field
+
+
+def field_value(field):
+    """
+    Return the formatted value of the field, followed by its quoted
+    VAL_ label when it has one.
+    """
+    label = field.get('label')
+    if label is None:
+        return field['value']
+    return f'{field["value"]} "{label}"'
+
+
+def print_default(messages, out=None):
+    """
+    Print one line per signal with the module from => to relationship.
+    """
+    out = out or sys.stdout
+    texts, parts = {}, []
+    for _, _, message in messages:
+        if message is None:
+            continue
+        code, name, bus = message['code'], message['name'], message.get('bus')
+        for field_name, field in message['fields'].items():
+            text = texts.get((bus, code, name, field_name))
+            if text is None:
+                text = texts[bus, code, name, field_name] = \
+                    (f'[{code}] {name}:{field_name} = ', f' ({message["from"]} => {field["to"]})\n')
+            parts.append(f'{text[0]}{field_value(field)}{text[1]}')
+        if len(parts) >= BUFFER_LINES:
+            out.write(''.join(parts))
+            parts.clear()
+    out.write(''.join(parts))
+
+
+def print_verbose(messages, out=None):
+    """
+    Print the payload bits and SG_ rule next to every signal, and
+    report the frames that could not be decoded.
+    """
+    out = out or sys.stdout
+    texts, parts = {}, []
+    for line, event, message in messages:
+        if message is None:
+            parts.append(f'NO DECODE FOR: {frame_text(line, event)}\n')
+            continue
+        code, name, bus = message['code'], message['name'], message.get('bus')
+        bin_str = event.get_binary_str()
+        for field_name, field in message['fields'].items():
+            text = texts.get((bus, code, name, field_name))
+            if text is None:
+                sg_rule = ' '.join(field['sg_'].split(':')[1].lstrip().split(' ')[0:3])
+                text = texts[bus, code, name, field_name] = \
+                    (f'[{code}] {name}:{field_name}\n', f' : <{sg_rule}> : ')
+            parts.append(f'{text[0]}{bin_str}{text[1]}{field_value(field)}\n')
+        if len(parts) >= BUFFER_LINES:
+            out.write(''.join(parts))
+            parts.clear()
+    out.write(''.join(parts))
+
+
+def print_annotated(messages, out=None):
+    """
+    Print every decoded signal as a comment after its candump line.
+    """
+    out = out or sys.stdout
+    texts, parts = {}, []
+    for line, _, message in messages:
+        if message is None:
+            continue
+        line = f'{line.strip(): <40} #  '
+        code, name = message['code'], message['name']
+        for field_name, field in message['fields'].items():
+            text = texts.get((code, name, field_name))
+            if text is None:
+                text = texts[code, name, field_name] = f'{name}:{field_name} = '
+            parts.append(f'{line}{text}{field_value(field)}\n')
+        if len(parts) >= BUFFER_LINES:
+            out.write(''.join(parts))
+            parts.clear()
+    out.write(''.join(parts))
+
+
+def print_json(decoded, out=None):
+    """
+    Print one JSON object per decoded frame, from the (line, event,
+    decoded) items of decode_values(), with the numeric signal values
+    and the VAL_ labels of the signals that have one.
+    """
+    out = out or sys.stdout
+    parts = []
+    for _, event, values in decoded:
+        if values is None:
+            continue
+        frame = {
+            'timestamp': getattr(event, 'timestamp', None),
+            'interface': event.interface,
+            'code': values.code,
+            'name': values.name,
+            'values': dict(zip(values.decoder.names, values.values)),
+        }
+        if values.labels is not None:
+            frame['labels'] = {name: label for name, label
+                               in zip(values.decoder.names, values.labels)
+                               if label is not None}
+        parts.append(json.dumps(frame))
+        parts.append('\n')
+        if len(parts) >= BUFFER_LINES:
+            out.write(''.join(parts))
+            parts.clear()
+    out.write(''.join(parts))
+
+
+def select_sink(verbose, annotation, json_lines=False):
+    """
+    Return the sink for the decode_can.py output mode. The JSON lines
+    sink takes the items of decode_values(), the others those of
+    decode_frames().
+    """
+    if json_lines:
+        return print_json
+    if verbose:
+        return print_verbose
+    if annotation:
+        return print_annotated
+    return print_default
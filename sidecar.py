@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+A sidecar index over a candump file, stored next to it as
+<candump>.idx. It holds the byte offset of every line grouped by
+message id, delta and varint encoded, plus a sparse table of
+(timestamp, offset) samples taken every STRIDE lines, so selecting a
+few ids or a time range seeks straight to the matching lines instead
+of reading the whole capture.
+
+    python3 sidecar.py <candump-output>     builds or refreshes the index
+"""
+import os
+import sys
+import mmap
+import struct
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from CAN.reader import parse_key, parse_line
+
+INDEX_MAGIC = b'CANIDX\x00\x02'
+HEADER = struct.Struct('<8sQdIII')
+SECTION = struct.Struct('<IQQQ')
+STRIDE = 1024
+
+
+def encode_offsets(offsets):
+    """
+    Return the ascending offsets as LEB128 varints of their deltas.
+    """
+    out = bytearray()
+    previous = 0
+    for offset in offsets:
+        delta = offset - previous
+        previous = offset
+        while delta >= 0x80:
+            out.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return bytes(out)
+
+
+def decode_offsets(data, count):
+    """
+    Return the array of count offsets encoded by encode_offsets().
+    """
+    offsets = array('Q')
+    append = offsets.append
+    offset, delta, shift = 0, 0, 0
+    for byte in data:
+        delta |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        offset += delta
+        append(offset)
+        delta, shift = 0, 0
+    if len(offsets) != count:
+        raise ValueError(f'Corrupt index section: {len(offsets)} offsets for {count}')
+    return offsets
+
+
+class Index:
+    """
+    The per-id offset lists and sparse time table of one candump file.
+    A saved index is a header, the time table, a table of one (id,
+    count, start, length) entry per id and then one section per id of
+    delta/varint encoded offsets. Loading reads the tables only; the
+    section of an id is read and decoded when a query asks for it, so
+    a query costs time in proportion to the lines it matches.
+    """
+    def __init__(self, can_filename):
+        self.can_filename = can_filename
+        self.index_filename = None
+        self.size, self.mtime = None, None
+        self.offsets = {}
+        self.sections = {}
+        self.times = array('d')
+        self.time_offsets = array('Q')
+
+    def build(self, stride=STRIDE):
+        """
+        Scan the candump file once, reading only ids and timestamps.
+        """
+        stat = os.stat(self.can_filename)
+        self.size, self.mtime = stat.st_size, stat.st_mtime
+        self.offsets, self.sections = {}, {}
+        self.times, self.time_offsets = array('d'), array('Q')
+        if self.size == 0:
+            return self
+        offsets = self.offsets
+        with open(self.can_filename, 'rb') as can_fh:
+            with mmap.mmap(can_fh.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                readline, tell = data.readline, data.tell
+                line_n, offset = 0, 0
+                line = readline()
+                while line:
+                    key = parse_key(line)
+                    if key is not None:
+                        timestamp, code = key
+                        code_offsets = offsets.get(code)
+                        if code_offsets is None:
+                            code_offsets = offsets[code] = array('Q')
+                        code_offsets.append(offset)
+                        if timestamp is not None and line_n % stride == 0:
+                            self.times.append(timestamp)
+                            self.time_offsets.append(offset)
+                        line_n += 1
+                    offset = tell()
+                    line = readline()
+        return self
+
+    def is_current(self):
+        """
+        True when the candump file is unchanged since the index was built.
+        """
+        stat = os.stat(self.can_filename)
+        return (stat.st_size, stat.st_mtime) == (self.size, self.mtime)
+
+    def counts(self):
+        """
+        Return {id: number of lines} of the index.
+        """
+        counts = {code: count for code, (count, _, _) in self.sections.items()}
+        counts.update((code, len(offsets)) for code, offsets in self.offsets.items())
+        return counts
+
+    def code_offsets(self, code):
+        """
+        Return the offsets of the lines with the id, reading its section
+        of the saved index when it was loaded. None for an unknown id.
+        """
+        offsets = self.offsets.get(code)
+        if offsets is not None:
+            return offsets
+        section = self.sections.get(code)
+        if section is None:
+            return None
+        count, start, length = section
+        with open(self.index_filename, 'rb') as index_fh:
+            index_fh.seek(start)
+            data = index_fh.read(length)
+        if len(data) != length:
+            raise ValueError(f'Truncated index: {self.index_filename}')
+        return decode_offsets(data, count)
+
+    def byte_range(self, start=None, end=None):
+        """
+        Return the (first, last) byte offsets that can hold lines with
+        timestamps between start and end, from the sparse time table.
+        """
+        first, last = 0, self.size
+        if start is not None or end is not None:
+            if len(self.times) == 0:
+                raise Exception(f'No timestamps in {self.can_filename}')
+        if start is not None:
+            i = bisect_left(self.times, start) - 1
+            if i >= 0:
+                first = self.time_offsets[i]
+        if end is not None:
+            i = bisect_right(self.times, end)
+            if i < len(self.times):
+                last = self.time_offsets[i]
+        return first, last
+
+    def query(self, codes=None, start=None, end=None):
+        """
+        Return the sorted offsets of the lines that can match the ids
+        and time range; the timestamps are checked when reading.
+        """
+        first, last = self.byte_range(start, end)
+        if codes is None:
+            return None, first, last
+        slices = []
+        for code in codes:
+            offsets = self.code_offsets(code)
+            if offsets is not None:
+                slices.append(offsets[bisect_left(offsets, first):bisect_left(offsets, last)])
+        return heapq.merge(*slices), first, last
+
+    def save(self, index_filename):
+        counts = self.counts()
+        codes = sorted(counts)
+        sections = [encode_offsets(self.code_offsets(code)) for code in codes]
+        time_n = len(self.times)
+        start = HEADER.size + time_n * 16 + len(codes) * SECTION.size
+        table = []
+        for code, section in zip(codes, sections):
+            table.append(SECTION.pack(code, counts[code], start, len(section)))
+            start += len(section)
+        temp_filename = f'{index_filename}.tmp'
+        with open(temp_filename, 'wb') as index_fh:
+            index_fh.write(HEADER.pack(INDEX_MAGIC, self.size, self.mtime, time_n, len(codes), 0))
+            index_fh.write(self.times.tobytes())
+            index_fh.write(self.time_offsets.tobytes())
+            index_fh.write(b''.join(table))
+            index_fh.write(b''.join(sections))
+        os.replace(temp_filename, index_filename)
+
+    @classmethod
+    def load(cls, can_filename, index_filename):
+        """
+        Return the index saved in index_filename, with its header and
+        tables read. Raises ValueError (or struct.error, OSError) when
+        the file is not a valid index.
+        """
+        with open(index_filename, 'rb') as index_fh:
+            magic, size, mtime, time_n, code_n, _ = HEADER.unpack(index_fh.read(HEADER.size))
+            if magic != INDEX_MAGIC:
+                raise ValueError(f'Not a candump index, or of another version: {index_filename}')
+            index = cls(can_filename)
+            index.index_filename = index_filename
+            index.size, index.mtime = size, mtime
+            index.times.frombytes(index_fh.read(time_n * 8))
+            index.time_offsets.frombytes(index_fh.read(time_n * 8))
+            table = index_fh.read(code_n * SECTION.size)
+            if len(index.time_offsets) != time_n or len(table) != code_n * SECTION.size:
+                raise ValueError(f'Truncated index: {index_filename}')
+            end = index_fh.seek(0, os.SEEK_END)
+        for code, count, start, length in SECTION.iter_unpack(table):
+            if start + length > end:
+                raise ValueError(f'Truncated index: {index_filename}')
+            index.sections[code] = (count, start, length)
+        return index
+
+
+def index_filename_for(can_filename):
+    return f'{can_filename}.idx'
+
+
+def open_index(can_filename, index_filename=None):
+    """
+    Return the current index of the candump file, loading the sidecar
+    when it is up to date and building (and saving) it otherwise.
+    """
+    index_filename = index_filename or index_filename_for(can_filename)
+    try:
+        index = Index.load(can_filename, index_filename)
+        if index.is_current():
+            return index
+    except (OSError, ValueError, struct.error):
+        pass
+    index = Index(can_filename).build()
+    try:
+        index.save(index_filename)
+    except OSError:
+        pass
+    return index
+
+
+def range_lines(data, first, last):
+    """
+    Yield the lines of the memory map that start before byte last.
+    """
+    data.seek(first)
+    while data.tell() < last:
+        line = data.readline()
+        if not line:
+            break
+        yield line
+
+
+def line_at(data, offset):
+    """
+    Return the line of the memory map that starts at offset.
+    """
+    end = data.find(b'\n', offset)
+    if end < 0:
+        return data[offset:]
+    return data[offset:end + 1]
+
+
+def query_lines(can_filename, codes=None, start=None, end=None, index=None, stage=None):
+    """
+    Yield the candump lines, as bytes, with the given ids whose
+    timestamps fall between start and end (inclusive). The lines read
+    from the file go through the stage generator, when given, before
+    they are filtered, e.g. to count them.
+    """
+    codes = set(codes) if codes is not None else None
+    index = index or open_index(can_filename)
+    offsets, first, last = index.query(codes, start, end)
+    if first >= last:
+        return
+    timed = start is not None or end is not None
+    with open(can_filename, 'rb') as can_fh:
+        with mmap.mmap(can_fh.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if offsets is None:
+                lines = range_lines(data, first, last)
+            else:
+                lines = (line_at(data, offset) for offset in offsets)
+            if stage is not None:
+                lines = stage(lines)
+            for line in lines:
+                key = parse_key(line)
+                if key is None:
+                    continue
+                timestamp, code = key
+                if codes is not None and code not in codes:
+                    continue
+                if timed:
+                    if timestamp is None:
+                        continue
+                    if start is not None and timestamp < start:
+                        continue
+                    if end is not None and timestamp > end:
+                        continue
+                yield line
+
+
+def query_frames(can_filename, codes=None, start=None, end=None, index=None):
+    """
+    Yield (line, frame) for the lines query_lines() selects.
+    """
+    for line in query_lines(can_filename, codes, start, end, index):
+        yield line.decode(), parse_line(line)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        raise Exception(f'USAGE {sys.argv[0]} <candump-ouput>')
+    index = Index(sys.argv[1]).build()
+    index.save(index_filename_for(sys.argv[1]))
+    print(f'{index_filename_for(sys.argv[1])}: {sum(index.counts().values())} lines,'
+          f' {len(index.offsets)} ids, {len(index.times)} time samples')
@@ -0,0 +1,218 @@
+"""
+Statistics of a decode run: frames read, selected and decoded, the
+most frequent ids the DBC does not define, per-message frame counts
+and rates, and the cumulative time spent loading the DBC, parsing
+lines, looking up and decoding messages and writing the output. The
+frames read are the candump lines read from the log; those selected
+are the ones left for the decode stage once --id, --messages,
+--signals, --filter or a time range dropped the others. The stages
+below stand in for the pipeline source and decode stage:
+
+    stats = Stats()
+    lines = stats.count_lines(map_lines('candump.log'))
+    frames = stats.count_frames(pipeline.parse_bytes(lines, dbc.codes))
+    messages = stats.decode_frames(frames, dbc)
+    pipeline.print_default(messages)
+    stats.stop()
+    print(stats.report(), file=sys.stderr)
+
+Output time is whatever is left of the run once the other stages are
+accounted for. The stats of a parallel run merge those of its workers,
+so the stage times are summed over the workers rather than wall time.
+"""
+import time
+from collections import Counter
+
+TOP_N = 10
+STAGES = ('load', 'parse', 'lookup', 'decode', 'output')
+
+
+class Stats:
+    def __init__(self):
+        self.frames_read = 0
+        self.frames_selected = 0
+        self.frames_decoded = 0
+        self.unknown_ids = Counter()
+        self.messages = {}
+        self.times = dict.fromkeys(STAGES, 0.0)
+        self.elapsed = 0.0
+        self.decode_cache = None
+        self.workers = 1
+        self.started = time.perf_counter()
+
+    def count_lines(self, lines):
+        """
+        Pass the candump lines read through, counting them.
+        """
+        line_n = 0
+        try:
+            for line in lines:
+                line_n += 1
+                yield line
+        finally:
+            self.frames_read += line_n
+
+    def count_frames(self, frames):
+        """
+        Pass (line, frame) pairs through, timing the parse of each.
+        """
+        clock = time.perf_counter
+        frames = iter(frames)
+        parse_time, frame_n = 0.0, 0
+        try:
+            while True:
+                start = clock()
+                try:
+                    item = next(frames)
+                except StopIteration:
+                    parse_time += clock() - start
+                    break
+                parse_time += clock() - start
+                frame_n += 1
+                yield item
+        finally:
+            self.times['parse'] += parse_time
+            self.frames_selected += frame_n
+
+    def decode_frames(self, frames, dbc, values=False):
+        """
+        Yield what pipeline.decode_frames() (or decode_values() when
+        values is set) would, timing the lookup and the decode apart.
+        """
+        clock = time.perf_counter
+        decode = dbc.decode if values else dbc.annotate
+        route = getattr(dbc, 'route', None)
+        lookup = route or dbc.decoder
+        unknown_ids, messages = self.unknown_ids, self.messages
+        lookup_time, decode_time = 0.0, 0.0
+        try:
+            for line, event in frames:
+                start = clock()
+                decoder = lookup(event if route else event.code)
+                looked_up = clock()
+                lookup_time += looked_up - start
+                if decoder is None:
+                    unknown_ids[event.code] += 1
+                    yield line, event, None
+                    continue
+                message = decode(event)
+                decode_time += clock() - looked_up
+                timestamp = getattr(event, 'timestamp', None)
+                key = (event.interface, event.code) if route else event.code
+                counts = messages.get(key)
+                if counts is None:
+                    counts = messages[key] = [decoder.name, 0, timestamp, timestamp]
+                counts[1] += 1
+                counts[3] = timestamp
+                yield line, event, message
+        finally:
+            self.times['lookup'] += lookup_time
+            self.times['decode'] += decode_time
+            self.frames_decoded = sum(counts[1] for counts in messages.values())
+            if hasattr(dbc, 'hits'):
+                self.decode_cache = {'hits': dbc.hits, 'misses': dbc.misses}
+
+    def stop(self):
+        """
+        Close the run: the time not spent in the other stages is output.
+        """
+        self.elapsed = time.perf_counter() - self.started
+        accounted = sum(self.times[stage] for stage in STAGES if stage != 'output')
+        self.times['output'] = max(0.0, self.elapsed - accounted)
+        return self
+
+    def merge(self, other):
+        """
+        Add the counts and times of another run, e.g. of a worker's chunk.
+        """
+        self.frames_read += other.frames_read
+        self.frames_selected += other.frames_selected
+        self.frames_decoded += other.frames_decoded
+        self.unknown_ids.update(other.unknown_ids)
+        for key, (name, count, first, last) in other.messages.items():
+            counts = self.messages.get(key)
+            if counts is None:
+                self.messages[key] = [name, count, first, last]
+                continue
+            counts[1] += count
+            if first is not None and (counts[2] is None or first < counts[2]):
+                counts[2] = first
+            if last is not None and (counts[3] is None or last > counts[3]):
+                counts[3] = last
+        for stage in STAGES:
+            self.times[stage] += other.times[stage]
+        if other.decode_cache is not None:
+            decode_cache = self.decode_cache or {'hits': 0, 'misses': 0}
+            for key in ('hits', 'misses'):
+                decode_cache[key] += other.decode_cache[key]
+            self.decode_cache = decode_cache
+        return self
+
+    def rate(self, key):
+        """
+        Return frames/sec of the message: over its candump timestamps when
+        the log has them, else over the run time.
+        """
+        _, count, first, last = self.messages[key]
+        if first is not None and last is not None and last > first:
+            return (count - 1) / (last - first)
+        if self.elapsed > 0:
+            return count / self.elapsed
+        return 0.0
+
+    def as_dict(self, top_n=TOP_N):
+        """
+        Return the statistics as a JSON-ready dict.
+        """
+        return {
+            'frames_read': self.frames_read,
+            'frames_selected': self.frames_selected,
+            'frames_decoded': self.frames_decoded,
+            'frames_unknown': sum(self.unknown_ids.values()),
+            'unknown_ids': [{'code': code, 'frames': count}
+                            for code, count in self.unknown_ids.most_common(top_n)],
+            'messages': [dict(message_key(key), name=counts[0], frames=counts[1],
+                              rate=self.rate(key))
+                         for key, counts in sorted(self.messages.items())],
+            'seconds': dict(self.times, total=self.elapsed),
+            'workers': self.workers,
+            'decode_cache': self.decode_cache,
+        }
+
+    def report(self, top_n=TOP_N):
+        """
+        Return the statistics as text.
+        """
+        lines = [f'frames read: {self.frames_read}',
+                 f'frames selected: {self.frames_selected}',
+                 f'frames decoded: {self.frames_decoded}',
+                 f'frames unknown: {sum(self.unknown_ids.values())}']
+        for code, count in self.unknown_ids.most_common(top_n):
+            lines.append(f'  unknown id {code} (0x{code:X}): {count} frames')
+        for key, counts in sorted(self.messages.items()):
+            label = ' '.join(str(part) for part in message_key(key).values())
+            lines.append(f'  [{label}] {counts[0]}: {counts[1]} frames, {self.rate(key):,.1f}/sec')
+        summed = f' (summed over {self.workers} workers)' if self.workers > 1 else ''
+        for stage in STAGES:
+            lines.append(f'{stage} time{summed}: {self.times[stage]:.3f}s')
+        lines.append(f'total time: {self.elapsed:.3f}s')
+        if self.decode_cache is not None:
+            lines.append(self.decode_cache_report())
+        return "\n".join(lines)
+
+    def decode_cache_report(self):
+        """
+        Return the hits and misses of the decode cache as text.
+        """
+        return f'decode cache: {self.decode_cache["hits"]} hits,' \
+               f' {self.decode_cache["misses"]} misses'
+
+
+def message_key(key):
+    """
+    Return the {'code'} dict of a messages key, with the 'interface'
+    too for the (interface, code) keys of a BusRouter run.
+    """
+    if isinstance(key, tuple):
+        return {'interface': key[0], 'code': key[1]}
+    return {'code': key}
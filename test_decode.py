@@ -1,7 +1,56 @@
 #!/usr/bin/env python3
-from DBC import DBC
+from DBC import DBC, DecodeCache, BusRouter, cache, UNKNOWN_EXTENDED_IDS
 from CAN import CAN
+from CAN.reader import parse_line, read_frames
+from CAN.store import FrameStore
+from CAN.writer import format_lines
 import unittest
+import random
+import io
+import os
+import tempfile
+import pipeline
+import parallel
+import decode_can
+import export
+import sidecar
+import live
+import asyncio
+import json
+import contextlib
+import pickle
+import bench_decode
+import stats
+import aggregate
+import follow
+import encode_can
+import time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CACHE_DIR = None
+USER_CACHE_DIR = None
+
+
+def setUpModule():
+    """
+    Keep the compiled DBC cache of the runs under test out of the
+    user's own cache directory.
+    """
+    global CACHE_DIR, USER_CACHE_DIR
+    CACHE_DIR = tempfile.TemporaryDirectory()
+    USER_CACHE_DIR = os.environ.get('CAN_DECODE_CACHE')
+    os.environ['CAN_DECODE_CACHE'] = CACHE_DIR.name
+
+
+def tearDownModule():
+    if USER_CACHE_DIR is None:
+        del os.environ['CAN_DECODE_CACHE']
+    else:
+        os.environ['CAN_DECODE_CACHE'] = USER_CACHE_DIR
+    CACHE_DIR.cleanup()
 
 
 class TestANDecode(unittest.TestCase):
@@ -178,6 +227,1074 @@ class TestANDecode(unittest.TestCase):
 
         self.run_dbc_decode(dbc_text, can_text, expect)
 
+    def test_indexed_query(self):
+        dbc_text = 'BO_ 1000 XYZ_message: 6 ABC\n' \
+                   '    SG_ XYZ_messageID A : 0|16@1+ (1,0) [255|257] "MPH" XYZ\n' \
+                   'BO_ 1001 ABC_message: 2 XYZ\n' \
+                   '    SG_ ABC_messageID A : 0|8@1+ (1,0) [0|0] "" ABC\n' \
+                   'BO_TX_BU_ 1001 : XYZ,DEF;\n' \
+                   'CM_ BO_ 1001 "Second message";\n'
+
+        dbc = DBC(dbc_text)
+
+        self.assertEqual(dbc.query(DBC.BO_, CAN("can0 3E9 [2] 01 02")).name, "ABC_message")
+        self.assertEqual(dbc.query(DBC.BO_, CAN("can0 3E8 [2] 01 02")).name, "XYZ_message")
+        self.assertEqual(dbc.query(DBC.BO_TX_BU_, CAN("can0 3E9 [2] 01 02")).modules, ["XYZ", "DEF"])
+        self.assertEqual([cm.text for cm in dbc.query_all(DBC.CM_, 1001)], ["Second message"])
+
+        unknown = CAN("can0 7FF [2] 01 02")
+        self.assertIsNone(dbc.query(DBC.BO_, unknown))
+        self.assertIsNone(dbc.annotate(unknown))
+        self.assertIn(0x7FF, dbc.unknown_ids)
+
+        dbc.add_record(DBC.BO_('2047 Late_message: 2 ABC'))
+        self.assertNotIn(0x7FF, dbc.unknown_ids)
+        self.assertEqual(dbc.annotate(unknown)['name'], "Late_message")
+
+        for code in range(0x10000000, 0x10000000 + 2 * UNKNOWN_EXTENDED_IDS):
+            self.assertIsNone(dbc.decoder(code))
+        for code in range(0x7FF):
+            dbc.decoder(code)
+        self.assertEqual(sum(code > 0x7FF for code in dbc.unknown_ids), UNKNOWN_EXTENDED_IDS)
+        self.assertIn(0x7FE, dbc.unknown_ids)
+
+    def test_compiled_message_decoder(self):
+        dbc_text = 'BO_ 1001 XYZ_message: 6 ABC\n' \
+                   '    SG_ XYZ_messageID A : 0|16@1+ (1,0) [255|257] "MPH" XYZ\n' \
+                   '    SG_ XYZ_messageID B : 2|15@1- (2.5,150) [-3000|4] "MPH" XYZ\n' \
+                   '    SG_ XYZ_messageID C : 2|15@0- (2.5,150) [-3000|4] "" XYZ\n'
+
+        dbc = DBC(dbc_text)
+        event = CAN(" can0 3E9 [6] FF FF FF FF 04 03")
+        bo = dbc.query(DBC.BO_, event)
+        decoder = bo.compile()
+
+        self.assertIs(decoder, bo.compile())
+        self.assertEqual(decoder.format(event.payload), [event.decode(sg) for sg in bo.sgs])
+        self.assertEqual(decoder.format(event.payload), ['257 MPH', '-790 MPH', '-3000'])
+
+        fields = dbc.annotate(event)['fields']
+        self.assertEqual(fields['XYZ_messageID B']['value'], '-790 MPH')
+        self.assertEqual(fields['XYZ_messageID B']['sg_'], str(bo.sgs[1]))
+
+    def test_numeric_decode(self):
+        dbc_text = 'BO_ 1001 XYZ_message: 6 ABC\n' \
+                   '    SG_ XYZ_messageID A : 0|16@1+ (1,0) [255|257] "MPH" XYZ\n' \
+                   '    SG_ XYZ_messageID B : 2|15@1- (2.5,150) [-3000|4] "MPH" XYZ\n'
+
+        dbc = DBC(dbc_text)
+        decoded = dbc.decode(CAN(" can0 3E9 [6] FF FF FF FF 04 03"))
+
+        self.assertEqual(decoded.code, 1001)
+        self.assertEqual(decoded.name, "XYZ_message")
+        self.assertEqual(decoded.values, (257, -790.0))
+        self.assertIsInstance(decoded.values[0], int)
+        self.assertIsInstance(decoded.values[1], float)
+        self.assertEqual(dict(decoded.items()), {'XYZ_messageID A': 257, 'XYZ_messageID B': -790.0})
+        self.assertEqual(decoded.signal(1).units, "MPH")
+        self.assertEqual(decoded.signal(1).sg_text, str(dbc.query(DBC.BO_, decoded).sgs[1]))
+
+        self.assertIsNone(dbc.decode(CAN(" can0 3E8 [6] FF FF FF FF 04 03")))
+
+    @unittest.skipUnless(numpy, 'requires numpy')
+    def test_batch_decode(self):
+        dbc_text = 'BO_ 1001 XYZ_message: 6 ABC\n' \
+                   '    SG_ XYZ_messageID A : 0|16@1+ (1,0) [255|257] "MPH" XYZ\n' \
+                   '    SG_ XYZ_messageID B : 2|15@1- (2.5,150) [-3000|4] "MPH" XYZ\n' \
+                   '    SG_ XYZ_messageID C : 5|40@0- (0.1,-40) [0|0] "" XYZ\n' \
+                   'BO_ 1002 FD_message: 64 ABC\n' \
+                   '    SG_ FD_messageID A : 300|64@0+ (1,0) [0|0] "" XYZ\n' \
+                   '    SG_ FD_messageID B : 61|37@1- (3,7) [0|0] "" XYZ\n'
+
+        dbc = DBC(dbc_text)
+        rand = random.Random(4)
+        codes, rows, events = [], [], []
+        for _ in range(200):
+            code = rand.choice([1001, 1002, 1003])
+            byte_n = 64 if code == 1002 else 6
+            data = [rand.randrange(256) for _ in range(byte_n)]
+            codes.append(code)
+            rows.append(data + [0] * (64 - byte_n))
+            events.append(CAN(f'can0 {code:X} [{byte_n}] ' + ' '.join(f'{b:02X}' for b in data)))
+
+        messages = dbc.decode_batch(numpy.array(codes, dtype=numpy.uint32),
+                                    numpy.array(rows, dtype=numpy.uint8))
+
+        self.assertEqual(sorted(messages), [1001, 1002])
+        for code, message in messages.items():
+            decoder = dbc.decoder(code)
+            for i, row in enumerate(message['rows'].tolist()):
+                expect = decoder.decode(events[row].payload)
+                for name, value in zip(decoder.names, expect):
+                    self.assertEqual(message['fields'][name][i], value)
+
+        payload = numpy.array([0xFFFFFFFF0403], dtype=numpy.uint64)
+        message = dbc.decode_batch([1001], payload, byte_n=[6])[1001]
+        self.assertEqual(message['fields']['XYZ_messageID B'].tolist(), [-790.0])
+
+    def test_pipeline(self):
+        dbc = DBC('BO_ 1000 XYZ_message: 6 ABC\n'
+                  '    SG_ XYZ_messageID A : 0|16@1+ (1,0) [255|257] "MPH" XYZ\n')
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            can_filename = os.path.join(tmp_dir, 'candump.log')
+            with open(can_filename, 'w') as can_fh:
+                can_fh.write(" can0 3E8 [6] FF FF FF FF 01 00\n"
+                             " can0 3E9 [6] FF FF FF FF 01 00\n"
+                             " can0 3E8 [6] FF FF FF FF 01 01\n")
+
+            frames = pipeline.parse_frames(pipeline.read_lines(can_filename))
+            frames = pipeline.filter_ids(frames, [1000])
+            signals = pipeline.iter_signals(pipeline.decode_frames(frames, dbc))
+            self.assertEqual([field['value'] for _, _, field in signals], ['256 MPH', '257 MPH'])
+
+            frames = pipeline.parse_frames(pipeline.read_lines(can_filename))
+            out = io.StringIO()
+            pipeline.print_default(pipeline.decode_frames(frames, dbc), out)
+            self.assertEqual(out.getvalue(),
+                             '[1000] XYZ_message:XYZ_messageID A = 256 MPH (ABC => XYZ)\n'
+                             '[1000] XYZ_message:XYZ_messageID A = 257 MPH (ABC => XYZ)\n')
+
+    def test_parallel_matches_serial(self):
+        dbc_text = 'BO_ 1000 XYZ_message: 6 ABC\n' \
+                   '    SG_ XYZ_messageID A : 0|16@1+ (1,0) [255|257] "MPH" XYZ\n' \
+                   '    SG_ XYZ_messageID B : 2|15@1- (2.5,150) [-3000|4] "MPH" XYZ\n'
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            can_filename = os.path.join(tmp_dir, 'candump.log')
+            with open(can_filename, 'w') as can_fh:
+                for i in range(500):
+                    can_fh.write(f" can0 {0x3E8 + i % 2:X} [6] FF FF FF {i % 256:02X} 04 03\n")
+
+            ranges = parallel.split_ranges(can_filename, 7)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], os.path.getsize(can_filename))
+            with open(can_filename, 'rb') as can_fh:
+                data = can_fh.read()
+            for start, end in ranges:
+                self.assertEqual(data[end - 1:end], b'\n')
+
+            for verbose, annotation in [(False, False), (True, False), (False, True)]:
+                serial, jobs = io.StringIO(), io.StringIO()
+                decode_can.run(dbc_text, can_filename, verbose, annotation, out=serial)
+                decode_can.run(dbc_text, can_filename, verbose, annotation, out=jobs, jobs=3)
+                self.assertEqual(serial.getvalue(), jobs.getvalue())
+
+    def test_bytes_reader(self):
+        frame = parse_line(b" can0 3E9 [6] FF FF FF FF 04 03\n")
+        event = CAN(" can0 3E9 [6] FF FF FF FF 04 03\n")
+        self.assertEqual((frame.interface, frame.code, frame.byte_n), ("can0", 1001, 6))
+        self.assertEqual(frame.payload, event.payload)
+        self.assertEqual(str(frame), str(event))
+        self.assertEqual(frame.get_binary_str(), event.get_binary_str())
+        self.assertIsNone(frame.timestamp)
+
+        frame = parse_line(b"(1436509052.249713) vcan0 3E9#FFFFFFFF0403\n")
+        self.assertEqual((frame.timestamp, frame.interface, frame.code, frame.byte_n),
+                         (1436509052.249713, "vcan0", 1001, 6))
+        self.assertEqual(frame.payload, event.payload)
+
+        frame = parse_line(b"(0.000100) can1 123##1AABB\n")
+        self.assertEqual((frame.code, frame.payload), (0x123, b'\xaa\xbb'))
+        self.assertIsNone(parse_line(b"  \n"))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            can_filename = os.path.join(tmp_dir, 'candump.log')
+            with open(can_filename, 'wb') as can_fh:
+                can_fh.write(b"(1.5) can0 3E8#0100\n\n can0 3E9 [2] 01 02")
+            frames = list(read_frames(can_filename))
+            self.assertEqual([(f.timestamp, f.code, f.payload) for f in frames],
+                             [(1.5, 1000, b'\x01\x00'), (None, 1001, b'\x01\x02')])
+
+    def test_compiled_cache(self):
+        dbc_text = 'BO_ 1000 XYZ_message: 6 ABC\n' \
+                   '    SG_ XYZ_messageID A : 0|16@1+ (1,0) [255|257] "MPH" XYZ\n'
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            dbc_filename = os.path.join(tmp_dir, 'test.dbc')
+            with open(dbc_filename, 'w') as dbc_fh:
+                dbc_fh.write(dbc_text)
+
+            dbc = DBC.load(dbc_filename, cache_dir)
+            self.assertEqual(dbc.filename, dbc_filename)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+            cached = DBC.load(dbc_filename, cache_dir)
+            self.assertIsNot(cached, dbc)
+            self.assertEqual(cached.filename, dbc_filename)
+            self.assertIsNotNone(cached.query(DBC.BO_, CAN("can0 3E8 [6] FF FF FF FF 01 00")).decoder)
+            self.assertEqual(cached.annotate(CAN("can0 3E8 [6] FF FF FF FF 01 00")),
+                             dbc.annotate(CAN("can0 3E8 [6] FF FF FF FF 01 00")))
+
+            stale = ['v1-0123456789abcdef-' + '0' * 64 + '.pickle', 'f' * 64 + '.pickle']
+            for name in stale + ['notes.txt']:
+                with open(os.path.join(cache_dir, name), 'wb') as stale_fh:
+                    stale_fh.write(b'stale')
+            with open(dbc_filename, 'w') as dbc_fh:
+                dbc_fh.write(dbc_text.replace('XYZ_message:', 'New_message:'))
+            changed = DBC.load(dbc_filename, cache_dir)
+            self.assertEqual(changed.query(DBC.BO_, CAN("can0 3E8 [2] 01 00")).name, "New_message")
+            self.assertEqual(len(os.listdir(cache_dir)), 3)
+            self.assertTrue(all(name.startswith(cache.generation()) or name == 'notes.txt'
+                                for name in os.listdir(cache_dir)))
+
+            cache_filename = os.path.join(cache_dir, f'{cache.cache_key(dbc_text)}.pickle')
+            for data in (b'\x80\x09', pickle.dumps(0)[:2] + b'cbuiltins\nint\n(Vx\ntR.',
+                         b'\x80\x04\x95\xff\xff\xff\xff\xff\xff\xff\x7f'):
+                with open(cache_filename, 'wb') as cache_fh:
+                    cache_fh.write(data)
+                self.assertEqual(DBC.load(dbc_text, cache_dir).annotate(
+                    CAN("can0 3E8 [6] FF FF FF FF 01 00")), dbc.annotate(
+                    CAN("can0 3E8 [6] FF FF FF FF 01 00")))
+                with open(cache_filename, 'rb') as cache_fh:
+                    self.assertIsInstance(pickle.load(cache_fh), DBC)
+
+            if hasattr(os, 'getuid'):
+                planted = DBC(dbc_text.replace('XYZ_message:', 'Planted:'))
+                with open(cache_filename, 'wb') as cache_fh:
+                    pickle.dump(planted, cache_fh)
+                os.chmod(cache_filename, 0o666)
+                self.assertFalse(cache.trusted(cache_filename))
+                self.assertEqual(DBC.load(dbc_text, cache_dir).decoder(1000).name, 'XYZ_message')
+
+    def test_tokenized_parse(self):
+        dbc_text = 'VERSION "1.0"\n' \
+                   '\n' \
+                   'NS_ :\n' \
+                   '\tCM_\n' \
+                   '\tBA_DEF_\n' \
+                   '\n' \
+                   'BS_:\n' \
+                   'BU_: ECU1 ECU2 GTW\n' \
+                   'VAL_TABLE_ GearTable 0 "P" 1 "R" 3 "D" ;\n' \
+                   'BO_ 100 Speed: 8 ECU1\n' \
+                   ' SG_ VehicleSpeed : 0|16@1+ (0.01,0) [0|300] "km/h" GTW,ECU2\n' \
+                   ' SG_ Mode M : 16|2@0- (1,-1) [-1|2] "" GTW\n' \
+                   '\n' \
+                   'CM_ "Global; comment";\n' \
+                   'CM_ SG_ 100 VehicleSpeed "Vehicle speed\n' \
+                   'over ground; at the wheels";\n' \
+                   'BA_DEF_ SG_ "SigType" ENUM "Normal","Special value";\n' \
+                   'BA_ "GenMsgCycleTime" BO_ 100 10;\n' \
+                   'VAL_ 100 Mode 0 "Off" 1 "Fully on" ;\n' \
+                   'SIG_VALTYPE_ 100 Mode : 1;\n'
+
+        dbc = DBC(dbc_text)
+
+        self.assertEqual(dbc.version, "1.0")
+        lists = {r.name: r.items for r in dbc.records if isinstance(r, DBC.LIST_)}
+        self.assertEqual(lists, {'NS_': ['CM_', 'BA_DEF_'], 'BS_': [], 'BU_': ['ECU1', 'ECU2', 'GTW']})
+
+        bo = dbc.query(DBC.BO_, CAN("can0 64 [8] 00 00 00 00 00 00 00 00"))
+        self.assertEqual([sg.name for sg in bo.sgs], ['VehicleSpeed', 'Mode M'])
+        self.assertEqual(bo.sgs[0].destination, 'GTW,ECU2')
+        self.assertEqual(bo.sgs[0].source_txt, 'VehicleSpeed : 0|16@1+ (0.01,0) [0|300] "km/h" GTW,ECU2')
+        self.assertEqual((bo.sgs[1].endian, bo.sgs[1].signed, bo.sgs[1].offset), (0, True, -1.0))
+
+        comments = [r for r in dbc.records if isinstance(r, DBC.CM_)]
+        self.assertEqual(comments[0].text, "Global; comment")
+        self.assertEqual((comments[1].bo_id, comments[1].signal), (100, 'VehicleSpeed'))
+        self.assertEqual(comments[1].text, "Vehicle speed\nover ground; at the wheels")
+
+        ba_def = [r for r in dbc.records if isinstance(r, DBC.BA_DEF_)][0]
+        self.assertEqual((ba_def.object_type, ba_def.name, ba_def.data_type, ba_def.library),
+                         ('SG_', 'SigType', 'ENUM', ['Normal', 'Special value']))
+
+        table = [r for r in dbc.records if isinstance(r, DBC.VAL_TABLE_)][0]
+        self.assertEqual(table.rows, [{'type': 'P', 'index': '0'}, {'type': 'R', 'index': '1'},
+                                      {'type': 'D', 'index': '3'}])
+        val = dbc.query_all(DBC.VAL_, 100)[0]
+        self.assertEqual((val.signal, val.rows[1]), ('Mode', {'type': 'Fully on', 'name': '1'}))
+
+        self.assertEqual([r.tokens for r in dbc.records if isinstance(r, DBC.RAW_)],
+                         [['100', 'Mode', ':', '1']])
+
+        dbc = DBC('BO_ 200 Split: 2 ECU1\n'
+                  ' SG_ S1 : 0|8@1+ (1,0) [0|0] "" GTW\n'
+                  '\n'
+                  ' SG_ S2 : 8|8@1+ (1,0) [0|0] "" GTW\n'
+                  '\n'
+                  ' SG_ S3 : 8|4@1+ (1,0) [0|0] "" GTW\n')
+        self.assertEqual([type(r).__name__ for r in dbc.records], ['BO_'])
+        self.assertEqual([sg.name for sg in dbc.records[0].sgs], ['S1', 'S2', 'S3'])
+        with self.assertRaises(Exception):
+            DBC('CM_ "Comment";\n SG_ S1 : 0|8@1+ (1,0) [0|0] "" GTW\n')
+
+    def test_columnar_export(self):
+        dbc = DBC('BO_ 1000 XYZ_message: 2 ABC\n'
+                  '    SG_ XYZ_messageID A : 0|8@1+ (0.5,0) [0|0] "MPH" XYZ\n'
+                  '    SG_ XYZ_messageID B : 8|8@1+ (1,0) [0|0] "" XYZ\n')
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            can_filename = os.path.join(tmp_dir, 'candump.log')
+            with open(can_filename, 'w') as can_fh:
+                for i in range(5):
+                    can_fh.write(f"({i}.5) can0 3E8#{i:02X}{i + 1:02X}\n")
+                can_fh.write("(9.5) can0 3E9#0102\n")
+
+            csv_dir = os.path.join(tmp_dir, 'csv')
+            with export.CSVWriter(csv_dir, chunk_size=2) as writer:
+                export.export(pipeline.decode_values(pipeline.map_frames(can_filename), dbc), writer)
+            self.assertEqual(sorted(os.listdir(csv_dir)),
+                             ['XYZ_message.XYZ_messageID_A.csv', 'XYZ_message.XYZ_messageID_B.csv'])
+            with open(os.path.join(csv_dir, 'XYZ_message.XYZ_messageID_A.csv')) as csv_fh:
+                self.assertEqual(csv_fh.read(), 'time,value\n0.5,0.5\n1.5,1.0\n2.5,1.5\n'
+                                                '3.5,2.0\n4.5,2.5\n')
+
+            npz_filename = os.path.join(tmp_dir, 'signals.npz')
+            with export.NPZWriter(npz_filename, chunk_size=3) as writer:
+                export.export(pipeline.decode_values(pipeline.map_frames(can_filename), dbc), writer)
+            if numpy is not None:
+                with numpy.load(npz_filename) as npz:
+                    self.assertEqual(npz['XYZ_message.XYZ_messageID_B.value'].tolist(),
+                                     [0.0, 1.0, 2.0, 3.0, 4.0])
+                    self.assertEqual(npz['XYZ_message.XYZ_messageID_B.time'].tolist(),
+                                     [0.5, 1.5, 2.5, 3.5, 4.5])
+
+            budget_dir = os.path.join(tmp_dir, 'budget')
+            with export.CSVWriter(budget_dir, buffer_rows=3) as writer:
+                buffered = []
+                for item in pipeline.decode_values(pipeline.map_frames(can_filename), dbc):
+                    export.export([item], writer)
+                    buffered.append(writer.buffered)
+            self.assertLessEqual(max(buffered), 2)
+            for name in os.listdir(csv_dir):
+                with open(os.path.join(csv_dir, name)) as csv_fh, \
+                        open(os.path.join(budget_dir, name)) as budget_fh:
+                    self.assertEqual(budget_fh.read(), csv_fh.read())
+
+    @unittest.skipIf(export.pyarrow is None, 'requires pyarrow')
+    def test_parquet_export(self):
+        dbc = DBC('BO_ 1000 XYZ_message: 2 ABC\n'
+                  '    SG_ XYZ_messageID A : 0|8@1+ (0.5,0) [0|0] "MPH" XYZ\n'
+                  '    SG_ XYZ_messageID B : 8|8@1- (1,-2) [0|0] "" XYZ\n')
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            can_filename = os.path.join(tmp_dir, 'candump.log')
+            with open(can_filename, 'w') as can_fh:
+                for i in range(7):
+                    can_fh.write(f"({i}.25) can0 3E8#{i:02X}{0x7E + i:02X}\n")
+            parquet_dir = os.path.join(tmp_dir, 'parquet')
+            with export.ParquetWriter(parquet_dir, chunk_size=3, buffer_rows=4) as writer:
+                export.export(pipeline.decode_values(pipeline.map_frames(can_filename), dbc), writer)
+            self.assertEqual(sorted(os.listdir(parquet_dir)),
+                             ['XYZ_message.XYZ_messageID_A.parquet',
+                              'XYZ_message.XYZ_messageID_B.parquet'])
+
+            expected = {'A': [], 'B': []}
+            for item in pipeline.decode_values(pipeline.map_frames(can_filename), dbc):
+                for name, value in zip('AB', item[2].values):
+                    expected[name].append(value)
+            for name in 'AB':
+                filename = os.path.join(parquet_dir, f'XYZ_message.XYZ_messageID_{name}.parquet')
+                table = export.pyarrow.parquet.read_table(filename)
+                self.assertEqual(table.schema.names, ['time', 'value'])
+                self.assertEqual(table.column('time').to_pylist(),
+                                 [0.25, 1.25, 2.25, 3.25, 4.25, 5.25, 6.25])
+                self.assertEqual(table.column('value').to_pylist(), expected[name])
+
+    def test_sidecar_index(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            can_filename = os.path.join(tmp_dir, 'candump.log')
+            lines = [f"({i / 10:.6f}) can0 {0x100 + i % 7:03X}#{i:04X}\n".encode() for i in range(300)]
+            with open(can_filename, 'wb') as can_fh:
+                can_fh.write(b''.join(lines))
+
+            index = sidecar.Index(can_filename).build(stride=16)
+            self.assertEqual(len(index.times), 19)
+
+            def expect(codes, start, end):
+                return [line for i, line in enumerate(lines)
+                        if (codes is None or 0x100 + i % 7 in codes)
+                        and (start is None or i / 10 >= start) and (end is None or i / 10 <= end)]
+
+            for codes, start, end in [([0x101], None, None), ([0x102, 0x105], 3.2, 9.6),
+                                      (None, 0.0, 1.6), (None, 28.0, None), ([0x103], 40.0, 50.0)]:
+                self.assertEqual(list(sidecar.query_lines(can_filename, codes, start, end, index)),
+                                 expect(codes, start, end))
+
+            self.assertFalse(os.path.exists(sidecar.index_filename_for(can_filename)))
+            frames = list(sidecar.query_frames(can_filename, [0x106], 0.0, 2.0))
+            self.assertEqual([frame.payload for _, frame in frames],
+                             [b'\x00\x06', b'\x00\x0d', b'\x00\x14'])
+            self.assertTrue(sidecar.open_index(can_filename).is_current())
+
+            index_filename = sidecar.index_filename_for(can_filename)
+            loaded = sidecar.Index.load(can_filename, index_filename)
+            self.assertEqual(loaded.offsets, {})
+            self.assertEqual(loaded.counts(), sidecar.Index(can_filename).build().counts())
+            self.assertLess(os.path.getsize(index_filename), 300 * 8)
+            self.assertEqual(list(sidecar.query_lines(can_filename, [0x102, 0x105], 3.2, 9.6,
+                                                      loaded)), expect([0x102, 0x105], 3.2, 9.6))
+            with open(index_filename, 'rb') as index_fh:
+                saved = index_fh.read()
+            for data in (pickle.dumps({'version': 1}), b'', saved[:-3]):
+                with open(index_filename, 'wb') as index_fh:
+                    index_fh.write(data)
+                index = sidecar.open_index(can_filename)
+                self.assertEqual(list(sidecar.query_lines(can_filename, [0x101], index=index)),
+                                 expect([0x101], None, None))
+
+    def test_decode_plan(self):
+        dbc_text = 'BO_ 1000 XYZ_message: 6 ABC\n' \
+                   '    SG_ XYZ_messageID A : 0|16@1+ (1,0) [255|257] "MPH" XYZ\n' \
+                   'BO_ 1001 ABC_message: 6 XYZ\n' \
+                   '    SG_ ABC_messageID A : 0|16@1+ (1,0) [255|257] "MPH" XYZ\n' \
+                   '    SG_ ABC_messageID B : 2|15@1- (2.5,150) [-3000|4] "MPH" XYZ\n'
+
+        dbc = DBC(dbc_text)
+        plan = dbc.plan(signals=['ABC_message.ABC_messageID B'])
+        self.assertEqual(plan.codes, {1001})
+
+        event = CAN(" can0 3E9 [6] FF FF FF FF 04 03")
+        self.assertEqual(plan.decode(event).values, (-790.0,))
+        self.assertEqual(list(plan.annotate(event)['fields']), ['ABC_messageID B'])
+        self.assertIsNone(plan.annotate(CAN(" can0 3E8 [6] FF FF FF FF 04 03")))
+        self.assertEqual(dbc.plan(messages=['XYZ_message', 1001]).codes, {1000, 1001})
+
+        with self.assertRaises(Exception):
+            dbc.plan(signals=['No_signal'])
+
+        self.assertIsNone(parse_line(b" can0 3E8 [6] FF FF FF FF 04 03", plan.codes))
+        self.assertEqual(parse_line(b" can0 3E9 [6] FF FF FF FF 04 03", plan.codes).code, 1001)
+
+    def test_decode_cache(self):
+        dbc_text = 'BO_ 1001 XYZ_message: 6 ABC\n' \
+                   '    SG_ XYZ_messageID A : 0|16@1+ (1,0) [255|257] "MPH" XYZ\n' \
+                   '    SG_ XYZ_messageID B : 2|15@1- (2.5,150) [-3000|4] "MPH" XYZ\n'
+        dbc = DBC(dbc_text)
+        memo = dbc.memoize(2)
+        payloads = ["FF FF FF FF 04 03", "FF FF FF FF 04 03", "FF FF FF FF 01 00",
+                    "FF FF FF FF 01 00", "FF FF FF FF 05 03", "FF FF FF FF 04 03"]
+        lines = [f" can0 3E9 [6] {payload}" for payload in payloads] + [" can0 7FF [2] 01 02"]
+
+        for line in lines:
+            self.assertEqual(memo.annotate(CAN(line)), dbc.annotate(CAN(line)))
+        self.assertEqual((memo.hits, memo.misses), (2, 4))
+        self.assertEqual([key[0] for key in memo.annotated], [1001, 1001])
+        self.assertEqual(memo.decode(CAN(lines[0])).values, dbc.decode(CAN(lines[0])).values)
+
+        frames = pipeline.parse_frames(lines)
+        changes = list(pipeline.changes_only(pipeline.decode_frames(frames, dbc.memoize())))
+        self.assertEqual([(line, list(message['fields']) if message else None)
+                          for line, _, message in changes],
+                         [(lines[0], ['XYZ_messageID A', 'XYZ_messageID B']),
+                          (lines[2], ['XYZ_messageID A', 'XYZ_messageID B']),
+                          (lines[4], ['XYZ_messageID A', 'XYZ_messageID B']),
+                          (lines[5], ['XYZ_messageID B']),
+                          (lines[6], None)])
+
+    def test_value_tables(self):
+        dbc_text = 'BO_ 100 Gear: 2 ECU\n' \
+                   ' SG_ Gear : 0|4@1+ (1,0) [0|0] "" X\n' \
+                   ' SG_ Mode m1 : 4|4@1- (1,0) [0|0] "" X\n' \
+                   ' SG_ Speed : 8|8@1+ (1,0) [0|0] "kph" X\n' \
+                   'VAL_TABLE_ Modes 1 "Eco" 2 "Sport" -1 "Fault";\n' \
+                   'VAL_ 100 Gear 0 "P" 1 "R" 2 "N" 3 "D" 1000 "Invalid";\n' \
+                   'VAL_ 100 Mode Modes;\n' \
+                   'VAL_ 100 Speed 200 "Max";\n'
+        dbc = DBC(dbc_text)
+        bo = dbc.query(DBC.BO_, CAN(" can0 064 [2] 05 F3"))
+        self.assertEqual(bo.sgs[0].values, {0: "P", 1: "R", 2: "N", 3: "D", 1000: "Invalid"})
+        self.assertEqual(bo.sgs[1].values, {1: "Eco", 2: "Sport", -1: "Fault"})
+        self.assertEqual(bo.compile().signals[0].labels, ("P", "R", "N", "D"))
+        self.assertEqual(bo.compile().signals[1].labels, {1: "Eco", 2: "Sport", 15: "Fault"})
+
+        fields = dbc.annotate(CAN(" can0 064 [2] 05 F3"))['fields']
+        self.assertEqual([(field['value'], field.get('label')) for field in fields.values()],
+                         [('3', "D"), ('-7', "Fault"), ('5 kph', None)])
+        self.assertEqual(bo.compile().signals[2].labels, {200: "Max"})
+        self.assertEqual(bo.compile().labels(bytes([0xC8, 0x17])), (None, "Eco", "Max"))
+        self.assertEqual(dbc.decode(CAN(" can0 064 [2] 05 F3")).labels, ("D", "Fault", None))
+        self.assertIsNone(DBC('BO_ 100 Gear: 1 ECU\n SG_ Gear : 0|4@1+ (1,0) [0|0] "" X\n')
+                          .decode(CAN(" can0 064 [1] 05")).labels)
+
+        out = io.StringIO()
+        pipeline.print_default(pipeline.decode_frames(pipeline.parse_frames([" can0 064 [2] 05 F3"]), dbc), out)
+        self.assertEqual(out.getvalue().splitlines()[0:2], ['[100] Gear:Gear = 3 "D" (ECU => X)',
+                                                            '[100] Gear:Mode m1 = -7 "Fault" (ECU => X)'])
+
+    def test_json_lines(self):
+        dbc = DBC('BO_ 100 Gear: 2 ECU\n'
+                  ' SG_ Gear : 0|4@1+ (1,0) [0|0] "" X\n'
+                  ' SG_ Mode m1 : 4|4@1- (1,0) [0|0] "" X\n'
+                  ' SG_ Speed : 8|8@1+ (1,0) [0|0] "kph" X\n'
+                  'VAL_ 100 Gear 0 "P" 1 "R" 2 "N" 3 "D";\n'
+                  'VAL_ 100 Mode 1 "Eco" 2 "Sport" -1 "Fault";\n')
+        out = io.StringIO()
+        frames = pipeline.parse_bytes([b"(1.5) can0 064#05F3\n", b"(1.6) can0 065#05F3\n"])
+        pipeline.print_json(pipeline.decode_values(frames, dbc), out)
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()],
+                         [{'timestamp': 1.5, 'interface': 'can0', 'code': 100, 'name': 'Gear',
+                           'values': {'Gear': 3, 'Mode m1': -7, 'Speed': 5},
+                           'labels': {'Gear': 'D', 'Mode m1': 'Fault'}}])
+
+    def test_output_sinks(self):
+        """
+        The sinks print what the print() loop of the original decode_can.py did.
+        """
+        dbc_text = 'BO_ 100 Gear: 2 ECU\n' \
+                   ' SG_ Gear : 0|4@1+ (1,0) [0|0] "" X\n' \
+                   ' SG_ Mode m1 : 4|4@1- (1,0) [0|0] "" X\n' \
+                   ' SG_ Speed : 8|8@1+ (0.5,-10) [-10|100] "kph" X,Y\n' \
+                   'BO_ 218165760 Body: 8 BCM\n' \
+                   ' SG_ Temp : 7|12@0- (0.25,0) [0|0] "degC" ECU\n' \
+                   ' SG_ Door : 40|2@1+ (1,0) [0|0] "" ECU\n'
+        lines = [" can0 064 [2] 05 F3\n",
+                 " can0 7FF [1] 00\n",
+                 " can0 291 [2] ab cd\n",
+                 " can0 0D00F200 [8] 81 23 45 67 89 AB CD EF\n",
+                 " can1 064 [2] FF 00\n"]
+
+        def original(verbose, annotation):
+            out = io.StringIO()
+            dbc = DBC(dbc_text)
+            with contextlib.redirect_stdout(out):
+                for line in lines:
+                    event = CAN(line)
+                    message = dbc.annotate(event)
+                    if message is not None:
+                        code, name, from_node, fields = message['code'], message['name'], \
+                                                        message['from'], message['fields']
+                        for field_name in fields:
+                            value, to_node, sg_ = fields[field_name]['value'], \
+                                                  fields[field_name]['to'], \
+                                                  fields[field_name]['sg_']
+                            if verbose:
+                                bin_str = event.get_binary_str()
+                                sg_rule = ' '.join(sg_.split(':')[1].lstrip().split(' ')[0:3])
+                                print(f'[{code}] {name}:{field_name}\n{bin_str} : <{sg_rule}> : {value}')
+                            elif annotation:
+                                line = line.strip()
+                                print(f'{line: <40} #  {name}:{field_name} = {value}')
+                            else:
+                                print(f'[{code}] {name}:{field_name} = {value} ({from_node} => {to_node})')
+                    elif verbose:
+                        print(f'NO DECODE FOR: {event}')
+            return out.getvalue()
+
+        with tempfile.TemporaryDirectory() as directory:
+            can_filename = os.path.join(directory, 'candump.log')
+            with open(can_filename, 'w') as can_fh:
+                can_fh.writelines(lines)
+            for verbose, annotation in ((False, False), (True, False), (False, True)):
+                out = io.StringIO()
+                decode_can.run(dbc_text, can_filename, verbose, annotation, out=out, cache=False)
+                self.assertEqual(out.getvalue(), original(verbose, annotation))
+
+    def test_live_stream(self):
+        dbc_text = 'BO_ 1000 XYZ_message: 6 ABC\n' \
+                   '    SG_ XYZ_messageID A : 0|16@1+ (1,0) [255|257] "MPH" XYZ\n' \
+                   'BO_ 1001 ABC_message: 6 XYZ\n' \
+                   '    SG_ ABC_messageID B : 2|15@1- (2.5,150) [-3000|4] "MPH" XYZ\n'
+        dbc = DBC(dbc_text)
+        lines = [b" can0 3E8 [6] FF FF FF FF 01 00\n", b" can0 3E9 [6] FF FF FF FF 04 03\n"]
+        expect = [message for _, _, message in pipeline.decode_frames(pipeline.parse_bytes(lines), dbc)]
+
+        async def serve_tcp():
+            async def handle(reader, writer):
+                writer.write(b'< hi >< frame 3E8 1.25 FFFFFFFF0100 >' + b''.join(lines))
+                await writer.drain()
+                writer.close()
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            queue = live.LiveQueue(4)
+            async with server:
+                await live.decode_stream(live.tcp_lines('127.0.0.1', port), dbc, queue)
+            return [item async for item in queue]
+
+        items = asyncio.run(serve_tcp())
+        self.assertEqual([message for _, _, message in items], expect[0:1] + expect)
+        self.assertEqual(items[0][1].timestamp, 1.25)
+
+        async def serve_udp():
+            ready = asyncio.get_running_loop().create_future()
+            queue = live.LiveQueue(4)
+            task = asyncio.create_task(live.decode_stream(live.udp_lines('127.0.0.1', 0, ready),
+                                                          dbc, queue, values=True))
+            transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                asyncio.DatagramProtocol, remote_addr=await ready)
+            transport.sendto(b''.join(lines))
+            item = await queue.get()
+            task.cancel()
+            transport.close()
+            return item
+
+        self.assertEqual(asyncio.run(serve_udp())[2].values, (256,))
+
+        async def flood_udp():
+            ready = asyncio.get_running_loop().create_future()
+            received = live.LiveQueue(2)
+            records = live.udp_lines('127.0.0.1', 0, ready, received)
+            first = asyncio.ensure_future(records.__anext__())
+            transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                asyncio.DatagramProtocol, remote_addr=await ready)
+            for _ in range(5):
+                transport.sendto(b''.join(lines))
+            await first
+            for _ in range(500):
+                if received.dropped + received.queue.qsize() >= 9:
+                    break
+                await asyncio.sleep(0.01)
+            transport.close()
+            await records.aclose()
+            return received.queue.qsize(), received.dropped
+
+        self.assertEqual(asyncio.run(flood_udp()), (2, 7))
+        with self.assertRaises(Exception):
+            live.LiveQueue(0)
+        with self.assertRaises(Exception):
+            live.parse_args(['live.py', 'test.dbc', '--queue', '0'])
+
+        async def cancel_blocked():
+            async def source():
+                for line in lines * 3:
+                    yield line
+                await asyncio.Event().wait()
+            queue = live.LiveQueue(2)
+            task = asyncio.create_task(live.decode_stream(source(), dbc, queue))
+            while not queue.queue.full():
+                await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await asyncio.wait_for(task, 1)
+            return [message for _, _, message in [item async for item in queue]], queue.dropped
+
+        self.assertEqual(asyncio.run(cancel_blocked()), ([expect[1]], 1))
+
+        async def overflow(policy):
+            queue = live.LiveQueue(3, policy, sample_n=2)
+            for i in range(8):
+                await queue.put(i)
+            await queue.close()
+            return [item async for item in queue], queue.dropped
+
+        self.assertEqual(asyncio.run(overflow('drop-oldest')), ([6, 7], 6))
+        self.assertEqual(asyncio.run(overflow('sample')), ([4, 6], 6))
+
+    def test_benchmark_suite(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dbc_filename, can_filename = bench_decode.write_fixtures(tmp_dir, 5, 4, 50)
+            dbc = DBC(dbc_filename)
+            with open(can_filename) as can_fh:
+                self.assertTrue(all(dbc.annotate(CAN(line)) for line in can_fh))
+
+            json_filename = os.path.join(tmp_dir, 'bench.json')
+            with contextlib.redirect_stdout(io.StringIO()):
+                bench_decode.run_suite(5, 4, 50, json_filename)
+            with open(json_filename) as json_fh:
+                results = json.load(json_fh)
+            self.assertEqual([stage['stage'] for stage in results['stages']],
+                             ['parse', 'line', 'lookup', 'decode', 'output'])
+            self.assertEqual(results['stages'][1]['items'], 50)
+
+    def test_run_stats(self):
+        dbc_text = 'BO_ 1000 XYZ_message: 6 ABC\n' \
+                   '    SG_ XYZ_messageID A : 0|16@1+ (1,0) [255|257] "MPH" XYZ\n'
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dbc_filename = os.path.join(tmp_dir, 'test.dbc')
+            can_filename = os.path.join(tmp_dir, 'candump.log')
+            with open(dbc_filename, 'w') as dbc_fh:
+                dbc_fh.write(dbc_text)
+            with open(can_filename, 'w') as can_fh:
+                for i in range(10):
+                    can_fh.write(f"({i / 10:.6f}) can0 {[0x3E8, 0x3E8, 0x7FF, 0x100][i % 4]:03X}#0100\n")
+
+            run_stats = stats.Stats()
+            decode_can.run(dbc_filename, can_filename, False, False, out=io.StringIO(),
+                           cache=False, stats=run_stats)
+            report = run_stats.as_dict()
+            self.assertEqual((report['frames_read'], report['frames_selected'],
+                              report['frames_decoded'], report['frames_unknown']), (10, 10, 6, 4))
+            self.assertEqual(report['unknown_ids'], [{'code': 0x7FF, 'frames': 2},
+                                                     {'code': 0x100, 'frames': 2}])
+            self.assertEqual(report['messages'][0]['frames'], 6)
+            self.assertAlmostEqual(report['messages'][0]['rate'], 5 / 0.9)
+
+            merged = stats.Stats().merge(run_stats).merge(run_stats)
+            self.assertEqual(merged.frames_selected, 20)
+            self.assertEqual(merged.messages[1000][1], 12)
+
+            run_stats = stats.Stats()
+            decode_can.run(dbc_filename, can_filename, False, False, out=io.StringIO(),
+                           jobs=2, cache=False, stats=run_stats)
+            self.assertEqual((run_stats.frames_selected, run_stats.workers), (10, 2))
+            self.assertIn('decode time (summed over 2 workers): ', run_stats.report())
+
+            run_stats = stats.Stats()
+            decode_can.run(dbc_filename, can_filename, False, False, out=io.StringIO(),
+                           cache=False, codes=[0x3E8], stats=run_stats)
+            self.assertEqual((run_stats.frames_selected, run_stats.frames_decoded), (6, 6))
+            self.assertNotIn('summed', run_stats.report())
+
+            run_stats = stats.Stats()
+            decode_can.run(dbc_filename, can_filename, False, False, out=io.StringIO(),
+                           cache=False, messages=['XYZ_message'], stats=run_stats)
+            self.assertEqual((run_stats.frames_read, run_stats.frames_selected,
+                              run_stats.frames_decoded), (10, 6, 6))
+            self.assertGreater(run_stats.times['load'], 0)
+            self.assertIn('frames read: 10\nframes selected: 6\n', run_stats.report())
+
+    def test_window_aggregation(self):
+        dbc = DBC('BO_ 100 Speed: 1 ECU\n'
+                  ' SG_ Speed : 0|8@1+ (1,0) [0|0] "kph" X\n')
+        lines = [f"({t:.2f}) can0 064#{v:02X}\n".encode()
+                 for t, v in [(0.1, 10), (0.5, 30), (1.2, 20), (3.5, 40), (3.9, 50)]]
+
+        def windows(width, step=None):
+            rows = aggregate.aggregate(pipeline.decode_values(pipeline.parse_bytes(lines), dbc),
+                                       width, step)
+            return [(row.start, row.end, row.count, row.min, row.max, row.mean, row.last)
+                    for row in rows]
+
+        self.assertEqual(windows(1), [(0, 1, 2, 10, 30, 20.0, 30),
+                                      (1, 2, 1, 20, 20, 20.0, 20),
+                                      (3, 4, 2, 40, 50, 45.0, 50)])
+        self.assertEqual(windows(2, 1), [(0, 1, 2, 10, 30, 20.0, 30),
+                                         (0, 2, 3, 10, 30, 20.0, 20),
+                                         (1, 3, 1, 20, 20, 20.0, 20),
+                                         (2, 4, 2, 40, 50, 45.0, 50)])
+
+        aggregator = aggregate.WindowAggregator(3, 1)
+        gear = DBC('BO_ 101 Gear: 1 ECU\n SG_ Gear : 0|8@1+ (1,0) [0|0] "" X\n')
+        speed = dbc.decode(CAN(" can0 064 [1] 0A"))
+        self.assertEqual(aggregator.add(10.3, gear.decode(CAN(" can0 065 [1] 02"))), [])
+        self.assertEqual(aggregator.add(10.4, speed), [])
+        rows = aggregator.add(11.5, speed) + aggregator.add(14.2, speed) + aggregator.flush()
+        self.assertEqual([(row.start, row.end, row.signal, row.count) for row in rows],
+                         [(10, 11, 'Gear', 1), (10, 11, 'Speed', 1),
+                          (10, 12, 'Gear', 1), (10, 12, 'Speed', 2),
+                          (10, 13, 'Gear', 1), (10, 13, 'Speed', 2),
+                          (11, 14, 'Speed', 1), (12, 15, 'Speed', 1)])
+
+        out = io.StringIO()
+        aggregate.print_windows([aggregate.WindowRow(0, 1, 100, 'Speed', 'Speed', 2, 10, 30, 20.0, 30)], out)
+        self.assertEqual(out.getvalue().splitlines()[1], '0,1,100,Speed,Speed,2,10,30,20.0,30')
+
+        with self.assertRaises(Exception):
+            aggregate.WindowAggregator(1, 0.3)
+
+    def test_filter_predicate(self):
+        dbc_text = 'BO_ 100 Drive: 2 ECU\n' \
+                   ' SG_ Speed : 0|8@1+ (0.5,-20) [0|0] "kph" X\n' \
+                   ' SG_ Temp : 8|8@1+ (-2,100) [-150|90] "C" X\n' \
+                   'BO_ 101 Trans: 1 ECU\n' \
+                   ' SG_ Gear : 0|4@1+ (1,0) [0|0] "" X\n' \
+                   ' SG_ Slip : 4|4@1- (1,0) [0|0] "" X\n' \
+                   'VAL_ 101 Gear 0 "P" 1 "R" 2 "N" 3 "D" ;\n'
+        dbc = DBC(dbc_text)
+        drive = dbc.query(DBC.BO_, CAN("can0 064 [2] 00 00")).compile()
+        slip = dbc.query(DBC.BO_, CAN("can0 065 [1] 00")).compile().signals[1]
+
+        for op in ('<', '<=', '>', '>=', '==', '!='):
+            for signal, threshold in [('Speed', 80), ('Speed', 80.5), ('Temp', 20), ('Temp', -150),
+                                      ('Temp', 95)]:
+                predicate = dbc.predicate(f'{signal} {op} {threshold}')
+                decoder = drive.signals[signal == 'Temp']
+                for raw in range(256):
+                    expect = eval(f'{decoder.physical(raw)!r} {op} {threshold}')
+                    self.assertEqual(predicate.update(CAN(f"can0 064 [2] {raw:02X} {raw:02X}")),
+                                     expect, f'{signal} {op} {threshold} at {raw}')
+            predicate = dbc.predicate(f'Slip {op} -3')
+            for raw in range(16):
+                self.assertEqual(predicate.update(CAN(f"can0 065 [1] {raw << 4:02X}")),
+                                 eval(f'{slip.physical(raw)!r} {op} -3'))
+
+        lines = ["can0 064 [2] 00 C8", "can0 065 [1] 03", "can0 064 [2] 00 10",
+                 "can0 064 [2] 00 D0", "can0 065 [1] 01", "can0 064 [2] 00 D0"]
+        predicate = dbc.predicate('Speed > 70 and Gear == D')
+        kept = [line for line, _ in pipeline.filter_predicate(pipeline.parse_frames(lines), predicate)]
+        self.assertEqual(kept, [lines[1], lines[3]])
+        self.assertEqual(predicate.codes, {100, 101})
+
+        for expression in ('Speed > "D"', 'Gear > D', 'Nope > 1', 'Speed + 1 > 2', 'Speed >'):
+            with self.assertRaises(Exception):
+                dbc.predicate(expression)
+
+    def test_frame_store(self):
+        dbc_text = 'BO_ 1001 XYZ_message: 6 ABC\n' \
+                   '    SG_ XYZ_messageID A : 0|16@1+ (1,0) [255|257] "MPH" XYZ\n' \
+                   '    SG_ XYZ_messageID B : 2|15@1- (2.5,150) [-3000|4] "MPH" XYZ\n'
+        dbc = DBC(dbc_text)
+        lines = [b"(1.5) can0 3E9#FFFFFFFF0403\n", b"(1.6) can1 3E9#FFFFFFFF0100\n",
+                 b"(1.7) can0 7FF#0102\n"]
+        store = FrameStore()
+        store.extend(parse_line(line) for line in lines)
+
+        self.assertEqual(len(store), 3)
+        for view, line in zip(store, lines):
+            frame = parse_line(line)
+            self.assertEqual((view.timestamp, view.interface, view.code, view.byte_n, view.payload),
+                             (frame.timestamp, frame.interface, frame.code, frame.byte_n, frame.payload))
+            self.assertEqual(view.get_binary_str(), frame.get_binary_str())
+            self.assertEqual(str(view), str(frame))
+        sg = dbc.query(DBC.BO_, store[0]).sgs[1]
+        self.assertEqual(store[0].decode(sg), CAN(" can0 3E9 [6] FF FF FF FF 04 03").decode(sg))
+        self.assertEqual(dbc.annotate(store[-1]), None)
+        self.assertEqual(store.interfaces, ['can0', 'can1'])
+
+        if numpy is not None:
+            fields = store.decode_batch(dbc)[1001]['fields']
+            self.assertEqual(fields['XYZ_messageID B'].tolist(),
+                             [dbc.decode(store[0]).values[1], dbc.decode(store[1]).values[1]])
+
+        event = pickle.loads(pickle.dumps(CAN(" can0 3E9 [6] FF FF FF FF 04 03")))
+        self.assertEqual((event.code, event.payload), (1001, bytes.fromhex('FFFFFFFF0403')))
+        with self.assertRaises(AttributeError):
+            event.extra = 1
+        with self.assertRaises(AttributeError):
+            dbc.query(DBC.BO_, event).extra = 1
+
+    def test_bus_routing(self):
+        powertrain = 'BO_ 1000 Engine: 2 ECU\n' \
+                     '    SG_ Rpm : 0|16@1+ (1,0) [0|0] "rpm" ECU\n'
+        body = 'BO_ 1000 Doors: 2 BCM\n' \
+               '    SG_ Open : 0|8@1+ (1,0) [0|0] "" BCM\n'
+        lines = [" can0 3E8 [2] 10 00\n", " can1 3E8 [2] 01 00\n", " vcan2 3E8 [2] 02 00\n",
+                 " can0 3E8 [2] 10 00\n", " can1 3E8 [2] 10 00\n"]
+        buses = {'can0': powertrain, 'can1': body}
+
+        router = BusRouter.load(buses)
+        decoded = [router.decode(CAN(line)) for line in lines]
+        dbcs = [DBC(powertrain), DBC(body), None, DBC(powertrain), DBC(body)]
+        self.assertEqual([message and (message.name, message.values) for message in decoded],
+                         [dbc and (dbc.decode(CAN(line)).name, dbc.decode(CAN(line)).values)
+                          for dbc, line in zip(dbcs, lines)])
+        memo = DecodeCache(router)
+        self.assertEqual([message and message.name for message in map(memo.decode, map(CAN, lines))],
+                         ['Engine', 'Doors', None, 'Engine', 'Doors'])
+        self.assertEqual(memo.hits, 1)
+        router = BusRouter.load(buses, powertrain)
+        self.assertEqual(router.decode(CAN(lines[2])).name, 'Engine')
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            can_filename = os.path.join(tmp_dir, 'candump.log')
+            with open(can_filename, 'w') as can_fh:
+                can_fh.writelines(lines * 50)
+            for name, text in (('powertrain.dbc', powertrain), ('body.dbc', body)):
+                with open(os.path.join(tmp_dir, name), 'w') as dbc_fh:
+                    dbc_fh.write(text)
+            config_filename = os.path.join(tmp_dir, 'buses.conf')
+            with open(config_filename, 'w') as config_fh:
+                config_fh.write('# bus = dbc\ncan0 = powertrain.dbc\n\ncan1 = body.dbc\n')
+            _, _, options = decode_can.parse_args(['decode_can.py', '-', can_filename,
+                                                   '--bus-config', config_filename])
+            self.assertEqual(options['buses'], {'can0': os.path.join(tmp_dir, 'powertrain.dbc'),
+                                                'can1': os.path.join(tmp_dir, 'body.dbc')})
+            _, _, options = decode_can.parse_args(['decode_can.py', '-', can_filename,
+                                                   '--bus', 'can1=' + options['buses']['can0'],
+                                                   '--bus-config', config_filename])
+            self.assertEqual(options['buses']['can1'], os.path.join(tmp_dir, 'powertrain.dbc'))
+
+            serial, jobs = io.StringIO(), io.StringIO()
+            decode_can.run(None, can_filename, False, False, out=serial, buses=buses)
+            decode_can.run(None, can_filename, False, False, out=jobs, jobs=2, buses=buses)
+            self.assertEqual(serial.getvalue(), jobs.getvalue())
+            self.assertEqual(serial.getvalue().count('Engine'), 100)
+            self.assertEqual(serial.getvalue().count('Doors'), 100)
+
+        engine_a = 'BO_ 1000 Engine: 2 ECU\n' \
+                   '    SG_ Rpm : 0|16@1+ (1,0) [0|0] "rpm" TCU\n'
+        engine_b = 'BO_ 1000 Engine: 2 BCM\n' \
+                   '    SG_ Rpm : 8|8@1+ (2,0) [0|0] "rpm" GW\n' \
+                   '    SG_ Lock : 0|8@1+ (1,0) [0|0] "" GW\n'
+        buses = {'can0': engine_a, 'can1': engine_b}
+        lines = ["(1.0) can0 3E8#1002\n", "(2.0) can1 3E8#1002\n",
+                 "(3.0) can0 3E8#1002\n", "(4.0) can1 3E8#1002\n"]
+        single = {'can0': DBC(engine_a), 'can1': DBC(engine_b)}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            can_filename = os.path.join(tmp_dir, 'candump.log')
+            with open(can_filename, 'w') as can_fh:
+                can_fh.writelines(lines)
+            for verbose in (False, True):
+                expected = io.StringIO()
+                for line in lines:
+                    frame = parse_line(line.encode())
+                    pipeline.select_sink(verbose, False)(
+                        pipeline.decode_frames([(line, frame)], single[frame.interface]), expected)
+                out = io.StringIO()
+                decode_can.run(None, can_filename, verbose, False, out=out, buses=buses)
+                self.assertEqual(out.getvalue(), expected.getvalue())
+                if not verbose:
+                    self.assertIn('(BCM => GW)', out.getvalue())
+                    first_frames = expected.getvalue().splitlines(keepends=True)[:3]
+
+            out = io.StringIO()
+            decode_can.run(None, can_filename, False, False, out=out, buses=buses,
+                           changes_only=True, decode_cache=8)
+            self.assertEqual(out.getvalue(), ''.join(first_frames))
+
+            run_stats = stats.Stats()
+            csv_dir = os.path.join(tmp_dir, 'csv')
+            decode_can.run_export(None, can_filename, 'csv', csv_dir, buses=buses, stats=run_stats)
+            self.assertEqual(sorted(os.listdir(csv_dir)),
+                             ['can0.Engine.Rpm.csv', 'can1.Engine.Lock.csv', 'can1.Engine.Rpm.csv'])
+            with open(os.path.join(csv_dir, 'can1.Engine.Rpm.csv')) as csv_fh:
+                self.assertEqual(csv_fh.read(), 'time,value\n2.0,32.0\n4.0,32.0\n')
+            self.assertEqual([(message['interface'], message['name'], message['frames'])
+                              for message in run_stats.as_dict()['messages']],
+                             [('can0', 'Engine', 2), ('can1', 'Engine', 2)])
+
+            shared = {'can0': engine_a, 'can1': engine_a}
+            router = BusRouter.load(shared)
+            self.assertIs(router.buses['can0'], router.buses['can1'])
+            csv_dir = os.path.join(tmp_dir, 'shared')
+            decode_can.run_export(None, can_filename, 'csv', csv_dir, buses=shared)
+            self.assertEqual(sorted(os.listdir(csv_dir)), ['can0.Engine.Rpm.csv', 'can1.Engine.Rpm.csv'])
+            with open(os.path.join(csv_dir, 'can1.Engine.Rpm.csv')) as csv_fh:
+                self.assertEqual(csv_fh.read(), 'time,value\n2.0,4098.0\n4.0,4098.0\n')
+            out = io.StringIO()
+            decode_can.run_windows(None, can_filename, 10, out=out, buses=shared)
+            self.assertEqual(out.getvalue().splitlines(),
+                             ['start,end,interface,code,message,signal,count,min,max,mean,last',
+                              '0,10,can0,1000,Engine,Rpm,2,4098,4098,4098.0,4098',
+                              '0,10,can1,1000,Engine,Rpm,2,4098,4098,4098.0,4098'])
+
+    def test_follow_checkpoint(self):
+        dbc_text = 'BO_ 1000 XYZ_message: 6 ABC\n' \
+                   '    SG_ XYZ_messageID A : 0|16@1+ (1,0) [255|257] "MPH" XYZ\n'
+        lines = [f" can0 3E8 [6] FF FF FF {i:02X} 04 03\n" for i in range(6)]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            can_filename = os.path.join(tmp_dir, 'candump.log')
+            checkpoint_filename = os.path.join(tmp_dir, 'candump.ckpt')
+            with open(can_filename, 'w') as can_fh:
+                can_fh.writelines(lines[:2])
+                can_fh.write(lines[2][:5])
+
+            watcher = follow.PollWatcher(can_filename, 0.01)
+            chunks = list(follow.follow_chunks(can_filename, 0, watcher, idle=0.05))
+            self.assertEqual([line.decode() for chunk, _, _ in chunks for line in chunk], lines[:2])
+            self.assertEqual(chunks[-1][1], len(''.join(lines[:2])))
+
+            out = io.StringIO()
+            decode_can.run_follow(dbc_text, can_filename, False, False, out=out,
+                                  checkpoint=checkpoint_filename, poll=True, idle=0.05)
+            self.assertEqual(out.getvalue().count('[1000]'), 2)
+            with open(can_filename, 'a') as can_fh:
+                can_fh.write(lines[2][5:])
+                can_fh.writelines(lines[3:4])
+            out = io.StringIO()
+            decode_can.run_follow(dbc_text, can_filename, False, False, out=out,
+                                  checkpoint=checkpoint_filename, poll=True, idle=0.05)
+            expected = io.StringIO()
+            pipeline.print_default(pipeline.decode_frames(
+                pipeline.parse_frames(lines[2:4]), DBC(dbc_text)), expected)
+            self.assertEqual(out.getvalue(), expected.getvalue())
+
+            os.rename(can_filename, can_filename + '.1')
+            with open(can_filename, 'w') as can_fh:
+                can_fh.writelines(lines[4:])
+            self.assertEqual(follow.Checkpoint(checkpoint_filename).resume(can_filename), 0)
+            with open(can_filename + '.1', 'a') as can_fh:
+                can_fh.write(lines[0])
+            chunks = follow.follow_chunks(can_filename + '.1', len(''.join(lines[:4])), watcher, idle=0.05)
+            self.assertEqual([line.decode() for chunk, _, _ in chunks for line in chunk], lines[:1])
+
+            with open(can_filename, 'w') as can_fh:
+                can_fh.write(lines[5])
+            self.assertEqual(follow.Checkpoint(checkpoint_filename).resume(can_filename), 0)
+            chunks = follow.follow_chunks(can_filename, len(''.join(lines[4:])), watcher, idle=0.05)
+            self.assertEqual([line.decode() for chunk, _, _ in chunks for line in chunk], lines[5:])
+
+    def test_follow_rotation(self):
+        lines = [f" can0 3E8 [6] FF FF FF {i:02X} 04 03\n".encode() for i in range(8)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            can_filename = os.path.join(tmp_dir, 'candump.log')
+            with open(can_filename, 'wb') as can_fh:
+                can_fh.write(b''.join(lines[:2]) + lines[2][:7])
+
+            if follow.load_libc() is not None:
+                watcher = follow.InotifyWatcher(can_filename, interval=5)
+                os.utime(can_filename)
+                started = time.monotonic()
+                watcher.wait()
+                self.assertLess(time.monotonic() - started, 2)
+                watcher.interval = 0.05
+            else:
+                watcher = follow.PollWatcher(can_filename, 0.05)
+
+            chunks = follow.follow_chunks(can_filename, 0, watcher, idle=0.3)
+            first_inode = os.stat(can_filename).st_ino
+            self.assertEqual(next(chunks), (lines[:2], len(b''.join(lines[:2])), first_inode))
+
+            os.rename(can_filename, can_filename + '.1')
+            with open(can_filename, 'wb') as can_fh:
+                can_fh.write(b''.join(lines[3:6]))
+            inode = os.stat(can_filename).st_ino
+            self.assertEqual(next(chunks), ([lines[2][:7]], len(b''.join(lines[:2])) + 7, first_inode))
+            self.assertEqual(next(chunks), (lines[3:6], len(b''.join(lines[3:6])), inode))
+
+            with open(can_filename, 'r+b') as can_fh:
+                can_fh.truncate(0)
+                can_fh.write(lines[6])
+            self.assertEqual(next(chunks), ([lines[6]], len(lines[6]), inode))
+            with open(can_filename, 'ab') as can_fh:
+                can_fh.write(lines[7])
+            self.assertEqual(next(chunks), ([lines[7]], len(b''.join(lines[6:8])), inode))
+            self.assertEqual(list(chunks), [])
+
+            checkpoint = follow.Checkpoint(os.path.join(tmp_dir, 'candump.ckpt'))
+            for text in ('', '{"inode": 1', '{"inode": %d}' % inode, '[1, 2]'):
+                with open(checkpoint.path, 'w') as checkpoint_fh:
+                    checkpoint_fh.write(text)
+                errors = io.StringIO()
+                with contextlib.redirect_stderr(errors):
+                    self.assertEqual(checkpoint.resume(can_filename), 0)
+                self.assertIn(checkpoint.path, errors.getvalue())
+            checkpoint.save(can_filename, len(lines[6]))
+            self.assertEqual(checkpoint.resume(can_filename), len(lines[6]))
+
+    def test_signal_encoder(self):
+        dbc_text = 'BO_ 1000 XYZ_message: 8 ABC\n' \
+                   '    SG_ A : 0|12@1+ (0.5,10) [0|0] "MPH" XYZ\n' \
+                   '    SG_ B : 12|10@1- (2.5,150) [-3000|4] "MPH" XYZ\n' \
+                   '    SG_ C : 0|16@0- (0.1,-5) [0|0] "C" XYZ\n' \
+                   '    SG_ D : 16|20@0+ (-3,100) [-500|90] "" XYZ\n'
+        dbc = DBC(dbc_text)
+        decoder, encoder = dbc.decoder(1000), dbc.encoder('XYZ_message')
+        self.assertIs(dbc.encoder(1000).signals[0].decoder, decoder.signals[0])
+        rng = random.Random(7)
+        for _ in range(500):
+            payload = bytes(rng.getrandbits(8) for _ in range(8))
+            values = dict(zip(decoder.names, decoder.decode(payload)))
+            self.assertEqual(decoder.decode(encoder.encode(values)), list(values.values()))
+
+        for index, signal in enumerate(decoder.signals[:3]):
+            physicals = [signal.physical(raw) for raw in range(signal.mask + 1)]
+            for value in [-4000, -151.25, -5, 0, 0.26, 12.3, 99, 2047.6, 1e6]:
+                nearest = min(abs(physical - value) for physical in physicals)
+                decoded = decoder.decode(encoder.encode({signal.name: value}))[index]
+                self.assertEqual(abs(decoded - value), nearest, (signal.name, value))
+
+        lines = list(format_lines(1000, [encoder.encode({'A': 20})], [1.5]))
+        self.assertEqual(lines, ['(1.500000) can0 3E8#0000000000000014\n'])
+        frame = parse_line(lines[0].encode())
+        self.assertEqual((frame.timestamp, frame.code, dbc.decode(frame).values[0]), (1.5, 1000, 20))
+        lines = list(format_lines([1000, 0x1ABCDEF0], [b'\x01\x02', b'\xff']))
+        self.assertEqual(lines, ['  can0  3E8   [2]  01 02\n', '  can0  1ABCDEF0   [1]  FF\n'])
+        self.assertEqual(CAN(lines[0]).payload, b'\x01\x02')
+
+        if numpy is not None:
+            columns = {name: numpy.array([rng.uniform(-5000, 5000) for _ in range(200)])
+                       for name in decoder.names}
+            matrix = encoder.encode_batch(columns)
+            self.assertEqual(matrix.shape, (200, 8))
+            for row in range(200):
+                self.assertEqual(bytes(matrix[row]),
+                                 encoder.encode({name: columns[name][row] for name in columns}))
+
+            timestamps, codes, payloads = encode_can.generate(dbc, frame_n=50, rate=10, seed=3)
+            self.assertEqual((len(timestamps), set(codes.tolist())), (50, {1000}))
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                can_filename = os.path.join(tmp_dir, 'candump.log')
+                encode_can.run(dbc_text, can_filename, frame_n=50, rate=10, seed=3)
+                frames = list(read_frames(can_filename))
+                self.assertEqual([frame.payload for frame in frames], payloads)
+                self.assertEqual(frames[-1].timestamp, 4.9)
+
 
 if __name__ == '__main__':
     unittest.main()